@@ -0,0 +1,251 @@
+import os
+from typing import Optional, List, Dict, Any
+
+# Caches that live in process memory can't see writes made by sibling worker
+# processes, so with several workers they are turned off unless set explicitly.
+# Must run before db is imported (via backend); workers inherit the environment.
+API_WORKERS = int(os.getenv("LEARNSENSE_API_WORKERS", "4"))
+if API_WORKERS > 1:
+    os.environ.setdefault("LEARNSENSE_DASHBOARD_CACHE_SIZE", "0")
+    os.environ.setdefault("LEARNSENSE_DB_WRITE_BEHIND", "0")
+
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from core.model_calls import call_stats
+from core.latency import latency_stats
+from core.hedging import hedge_stats
+from core.router import router_stats
+from core.single_flight import flight_stats
+from core.scheduler import scheduler_stats
+from core.gemini_client import client_stats
+from core.prefetch import prefetch_stats
+from core.llm_cache import cache_stats
+from core.image_prep import prep_stats
+from core.blob_store import blob_stats
+from core.jobs import job_stats
+from core.aio import on_loop
+from backend import (
+    atutor_turn, adiagnose_worksheet, split_pages, generate_questions_from_notes, start_exam, finish_exam,
+    cancel_turn, TurnCancelled,
+)
+
+API_HOST = os.getenv("LEARNSENSE_API_HOST", "0.0.0.0")
+API_PORT = int(os.getenv("LEARNSENSE_API_PORT", "8000"))
+MAX_IMAGE_BYTES = int(os.getenv("LEARNSENSE_API_MAX_IMAGE_BYTES", str(10 * 1024 * 1024)))
+
+app = FastAPI(title="LearnSense API")
+
+
+class NotesRequest(BaseModel):
+    notes_text: str
+    topic: str = "General"
+    mode: str = "Exam"
+    user_id: str = ""
+
+
+class ExamStartRequest(BaseModel):
+    topic: str
+    style: str
+    n: int = 5
+    user_id: str = ""
+
+
+class ExamFinishRequest(BaseModel):
+    topic: str
+    qa_pairs: List[Dict[str, str]]
+    user_id: str = ""
+
+
+def _error(status: int, message: str) -> JSONResponse:
+    return JSONResponse(status_code=status, content={"error": message})
+
+
+def _as_bool(value: Any) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(value)
+
+
+@app.get("/health")
+def health() -> Dict[str, Any]:
+    # Client and connection pool, per-model call counters, circuit state, latencies,
+    # routing, coalescing, scheduling, rubric prefetch, response cache, image
+    # prep, blob store and background jobs for this worker.
+    return {
+        "ok": True,
+        "client": client_stats(),
+        "models": call_stats(),
+        "latency": latency_stats(),
+        "hedging": hedge_stats(),
+        "routing": router_stats(),
+        "prefetch": prefetch_stats(),
+        "coalescing": flight_stats(),
+        "scheduler": scheduler_stats(),
+        "llm_cache": cache_stats(),
+        "image_prep": prep_stats(),
+        "blobs": blob_stats(),
+        "jobs": job_stats(),
+    }
+
+
+@app.post("/tutor/turn")
+async def tutor_turn_endpoint(request: Request):
+    """
+    One tutor turn. Accepts either a JSON body or multipart/form-data with an
+    optional "image" file part; the response is TutorResponse.to_dict().
+    """
+    image_bytes: Optional[bytes] = None
+    image_mime: Optional[str] = None
+
+    content_type = request.headers.get("content-type", "")
+    try:
+        if content_type.startswith("multipart/form-data"):
+            form = await request.form()
+            fields: Dict[str, Any] = {k: v for k, v in form.items() if isinstance(v, str)}
+            upload = form.get("image")
+            if upload is not None and not isinstance(upload, str):
+                image_bytes = await upload.read(MAX_IMAGE_BYTES + 1)
+                if len(image_bytes) > MAX_IMAGE_BYTES:
+                    return _error(413, "image too large")
+                image_mime = upload.content_type or "image/png"
+                if not image_mime.startswith("image/"):
+                    return _error(415, "image must be an image/* upload")
+                if not image_bytes:
+                    image_bytes, image_mime = None, None
+        else:
+            fields = await request.json()
+            if not isinstance(fields, dict):
+                return _error(400, "expected a JSON object")
+    except ValueError:
+        return _error(400, "malformed request body")
+
+    missing = [k for k in ("user_id", "question") if not str(fields.get(k) or "").strip()]
+    if missing:
+        return _error(400, "missing field(s): " + ", ".join(missing))
+
+    try:
+        hint_level = int(fields.get("hint_level") or 1)
+    except (TypeError, ValueError):
+        return _error(400, "hint_level must be an integer")
+
+    try:
+        budget_s = float(fields["budget_s"]) if fields.get("budget_s") not in (None, "") else None
+    except (TypeError, ValueError):
+        return _error(400, "budget_s must be a number")
+
+    # The pipeline runs on core.aio's loop, which owns the Gemini client's
+    # async connections, not on uvicorn's.
+    try:
+        return await on_loop(atutor_turn(
+            user_id=str(fields["user_id"]),
+            question=str(fields["question"]),
+            student_input=str(fields.get("student_input") or ""),
+            mode=str(fields.get("mode") or "Exam"),
+            topic=str(fields.get("topic") or "General"),
+            hint_level=hint_level,
+            give_up=_as_bool(fields.get("give_up", False)),
+            image_bytes=image_bytes,
+            image_mime=image_mime,
+            turn_id=str(fields.get("turn_id") or "") or None,
+            budget_s=budget_s,
+        ))
+    except TurnCancelled:
+        return _error(409, "turn cancelled")
+
+
+@app.post("/worksheet/diagnose")
+async def worksheet_endpoint(request: Request):
+    """
+    Grade a whole answer sheet. multipart/form-data with one or more "pages"
+    file parts (images or a PDF) and a "questions" field, one question per
+    line. Optional "page_of" is a comma-separated page number (1-based) per
+    question. Cancel it like a turn, through /tutor/turn/{turn_id}/cancel.
+    """
+    try:
+        form = await request.form()
+    except ValueError:
+        return _error(400, "malformed request body")
+
+    fields: Dict[str, Any] = {k: v for k, v in form.items() if isinstance(v, str)}
+    if not str(fields.get("user_id") or "").strip():
+        return _error(400, "missing field(s): user_id")
+    questions = [q for q in str(fields.get("questions") or "").splitlines() if q.strip()]
+    if not questions:
+        return _error(400, "missing field(s): questions")
+
+    pages = []
+    total = 0
+    for upload in form.getlist("pages"):
+        if isinstance(upload, str):
+            continue
+        data = await upload.read(MAX_IMAGE_BYTES + 1)
+        total += len(data)
+        if len(data) > MAX_IMAGE_BYTES or total > 4 * MAX_IMAGE_BYTES:
+            return _error(413, "pages too large")
+        mime = upload.content_type or "image/png"
+        if not (mime.startswith("image/") or mime == "application/pdf"):
+            return _error(415, "pages must be image/* or application/pdf uploads")
+        # PDF and multi-frame image splitting is blocking work.
+        pages.extend(await run_in_threadpool(split_pages, data, mime))
+    if not pages:
+        return _error(400, "missing file part(s): pages")
+
+    page_of = None
+    if fields.get("page_of"):
+        try:
+            page_of = [int(p) - 1 for p in str(fields["page_of"]).split(",")]
+        except ValueError:
+            return _error(400, "page_of must be comma-separated page numbers")
+
+    try:
+        budget_s = float(fields["budget_s"]) if fields.get("budget_s") not in (None, "") else None
+    except (TypeError, ValueError):
+        return _error(400, "budget_s must be a number")
+
+    try:
+        return await on_loop(adiagnose_worksheet(
+            user_id=str(fields["user_id"]),
+            questions=questions,
+            pages=pages,
+            mode=str(fields.get("mode") or "Exam"),
+            topic=str(fields.get("topic") or "General"),
+            student_text=str(fields.get("student_text") or ""),
+            page_of=page_of,
+            turn_id=str(fields.get("turn_id") or "") or None,
+            budget_s=budget_s,
+        ))
+    except TurnCancelled:
+        return _error(409, "turn cancelled")
+
+
+@app.post("/tutor/turn/{turn_id}/cancel")
+def tutor_cancel_endpoint(turn_id: str):
+    # Turns are tracked per worker process; this only reaches turns running
+    # in the worker that receives it (use sticky routing by turn id).
+    return {"cancelled": cancel_turn(turn_id)}
+
+
+# Plain defs: FastAPI runs these on its thread pool, so the blocking model
+# calls don't hold up the event loop.
+@app.post("/notes/questions")
+def notes_questions_endpoint(body: NotesRequest):
+    return generate_questions_from_notes(body.notes_text, topic=body.topic, mode=body.mode, user_id=body.user_id)
+
+
+@app.post("/exam/start")
+def exam_start_endpoint(body: ExamStartRequest):
+    return start_exam(topic=body.topic, style=body.style, n=max(1, min(body.n, 20)), user_id=body.user_id)
+
+
+@app.post("/exam/finish")
+def exam_finish_endpoint(body: ExamFinishRequest):
+    return finish_exam(topic=body.topic, qa_pairs=body.qa_pairs, user_id=body.user_id)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run("api:app", host=API_HOST, port=API_PORT, workers=API_WORKERS)
@@ -1,10 +1,40 @@
-from typing import Optional, List, Dict, Any
+import os
+from typing import Optional, List, Dict
 from google.genai.errors import ClientError
 
-from core.tutor import handle_turn
-from core.utils import is_academic_only, safe_json_load
-from core.gemini_client import get_client, MODEL_FAST
+from core.tutor import handle_turn, ahandle_turn
+from core.prefetch import prefetch_rubric
+from core.turns import cancel_turn, TurnCancelled
+from core.jobs import Job, submit_job, get_job, pop_job, cancel_job
+from core.worksheet import split_pages, diagnose_worksheet, adiagnose_worksheet
+from core.utils import is_academic_only, safe_json_scan
+from core.gemini_client import get_client, start_warm_up
+from core.router import route
 from core.exam import generate_exam_questions, build_exam_report
+from core.llm_cache import cache_key, cache_get, cache_put
+from core.single_flight import single_flight, flight_key
+from core.scheduler import user_scope
+from core.streaming import generate_text, OnPartial
+from core.model_calls import ModelUnavailable
+from db import init_db
+
+# The API the UI (ui.py) and HTTP server (api.py) use, including what is
+# re-exported from core so they only need to import backend.
+__all__ = [
+    "tutor_turn", "atutor_turn", "submit_tutor_turn", "submit_worksheet", "prefetch_give_up",
+    "generate_questions_from_notes", "start_exam", "finish_exam",
+    "cancel_turn", "TurnCancelled", "get_job", "pop_job", "cancel_job",
+    "split_pages", "diagnose_worksheet", "adiagnose_worksheet",
+]
+
+# Create the schema and warm the connection pool once per process.
+init_db()
+# Open the Gemini connections in the background so the first turn doesn't wait on them.
+start_warm_up()
+
+# Speculating on every visible "Give up" button costs a MODEL_DEEP call per
+# wrong answer, so it's opt-in; the attempt-before-threshold prefetch is always on.
+PREFETCH_ON_GIVE_UP_BUTTON = os.getenv("LEARNSENSE_PREFETCH_ON_GIVE_UP_BUTTON", "0") == "1"
 
 
 def tutor_turn(
@@ -17,7 +47,16 @@ def tutor_turn(
     give_up: bool = False,
     image_bytes: Optional[bytes] = None,
     image_mime: Optional[str] = None,
+    on_partial: Optional[OnPartial] = None,
+    turn_id: Optional[str] = None,
+    budget_s: Optional[float] = None,
+    image_hash: Optional[str] = None,
 ) -> dict:
+    """
+    Run one tutor turn. Pass turn_id to be able to cancel_turn() it; raises
+    TurnCancelled if that happens. budget_s overrides LEARNSENSE_TURN_BUDGET_S.
+    An image is either image_bytes or the image_hash of a stored blob.
+    """
     return handle_turn(
         user_id=user_id,
         question=question,
@@ -28,10 +67,124 @@ def tutor_turn(
         give_up=give_up,
         image_bytes=image_bytes,
         image_mime=image_mime,
+        on_partial=on_partial,
+        turn_id=turn_id,
+        budget_s=budget_s,
+        image_hash=image_hash,
+    )
+
+
+async def atutor_turn(
+    user_id: str,
+    question: str,
+    student_input: str,
+    mode: str,
+    topic: str,
+    hint_level: int = 1,
+    give_up: bool = False,
+    image_bytes: Optional[bytes] = None,
+    image_mime: Optional[str] = None,
+    on_partial: Optional[OnPartial] = None,
+    turn_id: Optional[str] = None,
+    budget_s: Optional[float] = None,
+    image_hash: Optional[str] = None,
+) -> dict:
+    """Async tutor_turn for servers that run their own event loop."""
+    return await ahandle_turn(
+        user_id=user_id,
+        question=question,
+        student_input=student_input,
+        mode=mode,
+        topic=topic,
+        hint_level=hint_level,
+        give_up=give_up,
+        image_bytes=image_bytes,
+        image_mime=image_mime,
+        on_partial=on_partial,
+        turn_id=turn_id,
+        budget_s=budget_s,
+        image_hash=image_hash,
     )
 
 
-def generate_questions_from_notes(notes_text: str, topic: str = "General", mode: str = "Exam") -> dict:
+def submit_tutor_turn(
+    job_id: str,
+    user_id: str,
+    question: str,
+    student_input: str,
+    mode: str,
+    topic: str,
+    hint_level: int = 1,
+    give_up: bool = False,
+    image_bytes: Optional[bytes] = None,
+    image_mime: Optional[str] = None,
+    image_hash: Optional[str] = None,
+) -> Job:
+    """
+    Start a tutor turn in the background and return at once. Poll it with
+    get_job(job_id); streamed fields are on job.partial(). cancel_job(job_id)
+    stops it.
+    """
+    return submit_job(
+        job_id,
+        atutor_turn,
+        user_id=user_id,
+        question=question,
+        student_input=student_input,
+        mode=mode,
+        topic=topic,
+        hint_level=hint_level,
+        give_up=give_up,
+        image_bytes=image_bytes,
+        image_mime=image_mime,
+        turn_id=job_id,
+        image_hash=image_hash,
+    )
+
+
+def submit_worksheet(
+    job_id: str,
+    user_id: str,
+    questions: List[str],
+    pages: List[tuple],
+    mode: str,
+    topic: str,
+    student_text: str = "",
+    page_of: Optional[List[int]] = None,
+) -> Job:
+    """
+    Grade a whole answer sheet in the background. pages are (bytes, mime)
+    pairs, e.g. from split_pages(); graded questions appear on job.partial()
+    as "items[i]" while the rest are still running.
+    """
+    return submit_job(
+        job_id,
+        adiagnose_worksheet,
+        user_id=user_id,
+        questions=questions,
+        pages=pages,
+        mode=mode,
+        topic=topic,
+        student_text=student_text,
+        page_of=page_of,
+        turn_id=job_id,
+    )
+
+
+def prefetch_give_up(user_id: str, question: str, student_input: str, mode: str, topic: str) -> bool:
+    """Called while the "Give up" button is visible; warms the rubric for that attempt."""
+    if not PREFETCH_ON_GIVE_UP_BUTTON:
+        return False
+    return prefetch_rubric(user_id, question, student_input, topic, mode)
+
+
+def generate_questions_from_notes(
+    notes_text: str,
+    topic: str = "General",
+    mode: str = "Exam",
+    on_partial: Optional[OnPartial] = None,
+    user_id: Optional[str] = None,
+) -> dict:
     client = get_client()
     if client is None:
         return {"questions": []}
@@ -70,23 +223,41 @@ Notes:
 \"\"\"{notes_text}\"\"\"
 """.strip()
 
-    try:
-        resp = client.models.generate_content(model=MODEL_FAST, contents=prompt)
-        parsed = safe_json_load(getattr(resp, "text", "") or "")
-        if not parsed or "questions" not in parsed:
+    key = cache_key("notes", prompt)
+
+    def _generate(on_partial: Optional[OnPartial]) -> dict:
+        cached = cache_get("notes", key)
+        if cached is not None:
+            return cached
+        try:
+            raw_text = generate_text(client, route("notes").model, prompt, on_partial, ("questions[]",), site="notes")
+            scan = safe_json_scan(raw_text)
+            parsed = scan.value
+            if not parsed or "questions" not in parsed:
+                return {"questions": []}
+            if not isinstance(parsed.get("questions"), list):
+                return {"questions": []}
+            # A truncated list is still shown, but not kept.
+            if scan.complete:
+                cache_put("notes", key, parsed)
+            return parsed
+        except (ClientError, ModelUnavailable):
             return {"questions": []}
-        if not isinstance(parsed.get("questions"), list):
+        except Exception:
             return {"questions": []}
-        return parsed
-    except ClientError:
-        return {"questions": []}
-    except Exception:
-        return {"questions": []}
+
+    # A class generating from the same shared notes makes one call.
+    with user_scope(user_id):
+        return single_flight("notes", flight_key("notes", prompt), _generate, on_partial)
 
 
-def start_exam(topic: str, style: str, n: int = 5) -> dict:
-    return generate_exam_questions(topic=topic, style=style, n=n)
+def start_exam(
+    topic: str, style: str, n: int = 5, on_partial: Optional[OnPartial] = None, user_id: Optional[str] = None,
+) -> dict:
+    with user_scope(user_id):
+        return generate_exam_questions(topic=topic, style=style, n=n, on_partial=on_partial)
 
 
-def finish_exam(topic: str, qa_pairs: List[Dict[str, str]]) -> dict:
-    return build_exam_report(topic=topic, qa_pairs=qa_pairs)
+def finish_exam(topic: str, qa_pairs: List[Dict[str, str]], user_id: Optional[str] = None) -> dict:
+    with user_scope(user_id):
+        return build_exam_report(topic=topic, qa_pairs=qa_pairs)
@@ -0,0 +1,92 @@
+import queue
+import asyncio
+import threading
+from typing import Any, Callable, Awaitable, Coroutine, Optional, TypeVar, TYPE_CHECKING
+
+if TYPE_CHECKING:  # streaming imports this module
+    from .streaming import OnPartial
+
+# One event loop per process, running on a daemon thread. Async pipeline code
+# runs there; sync callers (Streamlit script threads, worker pools) submit to it
+# and block only their own thread while many turns share the loop. Code on
+# another loop (uvicorn's) awaits on_loop(). The Gemini client's async
+# connection pool is bound to this loop, so every client.aio call runs here.
+
+T = TypeVar("T")
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_thread: Optional[threading.Thread] = None
+_lock = threading.Lock()
+_DONE = object()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    global _loop, _thread
+    if _loop is not None:
+        return _loop
+    with _lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            _thread = threading.Thread(target=loop.run_forever, name="learnsense-aio", daemon=True)
+            _thread.start()
+            _loop = loop
+    return _loop
+
+
+def run_sync(afunc: Callable[..., Awaitable[T]], *args: Any, on_partial: "Optional[OnPartial]" = None, **kwargs: Any) -> T:
+    """
+    Run afunc(*args, on_partial=..., **kwargs) on the shared loop and wait for it.
+    on_partial callbacks are delivered on the calling thread, so UI code can
+    touch its own widgets from them.
+    """
+    loop = get_loop()
+    if threading.current_thread() is _thread:
+        raise RuntimeError("run_sync() called from the event loop thread; await the async API instead")
+
+    if on_partial is None:
+        fut = asyncio.run_coroutine_threadsafe(afunc(*args, **kwargs), loop)
+        try:
+            return fut.result()
+        except BaseException:
+            # Interrupted caller (Ctrl-C, a Streamlit rerun): don't leave the
+            # coroutine running and spending tokens for nobody.
+            fut.cancel()
+            raise
+
+    events: "queue.SimpleQueue[Any]" = queue.SimpleQueue()
+    fut = asyncio.run_coroutine_threadsafe(
+        afunc(*args, on_partial=lambda name, value: events.put((name, value)), **kwargs),
+        loop,
+    )
+    fut.add_done_callback(lambda _f: events.put(_DONE))
+    try:
+        while True:
+            item = events.get()
+            if item is _DONE:
+                break
+            try:
+                on_partial(*item)
+            except Exception:
+                pass
+    except BaseException:
+        # Streamlit stops a script by raising from its next st.* call, which
+        # is usually this callback.
+        fut.cancel()
+        raise
+    return fut.result()
+
+
+async def on_loop(coro: Coroutine[Any, Any, T]) -> T:
+    """
+    Await coro on the shared loop from any event loop. Cancelling the caller
+    cancels it there too.
+    """
+    loop = get_loop()
+    if asyncio.get_running_loop() is loop:
+        return await coro
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+
+async def in_thread(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run blocking work (SQLite, prefetch waits) off the event loop."""
+    return await asyncio.to_thread(fn, *args, **kwargs)
@@ -0,0 +1,154 @@
+import os
+import mmap
+import time
+import hashlib
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Optional, Iterator, Dict, Any, List, Tuple
+
+# Content-addressed store for uploaded answer images. A blob's id is the
+# sha256 of its bytes, so the same photo is stored once however often it is
+# submitted, and attempts can reference it by hash. Reads are memory-mapped;
+# when the store grows past BLOB_MAX_BYTES the least recently used blobs go.
+
+BLOB_DIR = os.getenv("LEARNSENSE_BLOB_DIR", "blobs")
+BLOB_MAX_BYTES = int(os.getenv("LEARNSENSE_BLOB_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+
+_lock = threading.Lock()
+_total_bytes: Optional[int] = None   # lazily counted from disk
+_stats = {"puts": 0, "dedup_hits": 0, "reads": 0, "misses": 0, "evicted": 0}
+
+
+def blob_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _path(h: str) -> str:
+    return os.path.join(BLOB_DIR, h[:2], h)
+
+
+def _scan() -> List[Tuple[float, int, str]]:
+    out = []
+    if not os.path.isdir(BLOB_DIR):
+        return out
+    for sub in os.scandir(BLOB_DIR):
+        if not sub.is_dir():
+            continue
+        for entry in os.scandir(sub.path):
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            if entry.is_file() and not entry.name.startswith("."):
+                out.append((st.st_mtime, st.st_size, entry.path))
+    return out
+
+
+def _ensure_total():
+    # Caller holds _lock.
+    global _total_bytes
+    if _total_bytes is None:
+        _total_bytes = sum(size for _, size, _ in _scan())
+
+
+def _evict():
+    # Caller holds _lock. Oldest-used first, down to 90% of the cap.
+    global _total_bytes
+    target = int(BLOB_MAX_BYTES * 0.9)
+    files = sorted(_scan())
+    _total_bytes = sum(size for _, size, _ in files)
+    for _, size, path in files:
+        if _total_bytes <= target:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        _total_bytes -= size
+        _stats["evicted"] += 1
+
+
+def put_blob(data: bytes) -> str:
+    """Store data (if new) and return its hash."""
+    global _total_bytes
+    h = blob_hash(data)
+    path = _path(h)
+    with _lock:
+        _stats["puts"] += 1
+        if os.path.exists(path):
+            _stats["dedup_hits"] += 1
+            _touch(path)
+            return h
+        _ensure_total()
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write-then-rename, so a reader never sees a half-written blob.
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except OSError:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+    with _lock:
+        _total_bytes = (_total_bytes or 0) + len(data)
+        if _total_bytes > BLOB_MAX_BYTES:
+            _evict()
+    return h
+
+
+def _touch(path: str):
+    # mtime doubles as "last used" for eviction.
+    try:
+        os.utime(path, (time.time(), time.time()))
+    except OSError:
+        pass
+
+
+def has_blob(h: str) -> bool:
+    return bool(h) and os.path.exists(_path(h))
+
+
+@contextmanager
+def open_blob(h: str) -> Iterator[Optional[mmap.mmap]]:
+    """Memory-map a blob for reading; yields None if it was never stored or was evicted."""
+    path = _path(h) if h else ""
+    try:
+        f = open(path, "rb")
+    except OSError:
+        with _lock:
+            _stats["misses"] += 1
+        yield None
+        return
+    with f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield None
+            return
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with _lock:
+            _stats["reads"] += 1
+        _touch(path)
+        try:
+            yield mm
+        finally:
+            mm.close()
+
+
+def read_blob(h: str) -> Optional[bytes]:
+    """Blob contents as bytes (for APIs that need a bytes object)."""
+    with open_blob(h) as mm:
+        return mm[:] if mm is not None else None
+
+
+def blob_stats() -> Dict[str, Any]:
+    with _lock:
+        _ensure_total()
+        out: Dict[str, Any] = dict(_stats)
+        out["bytes"] = _total_bytes
+    return out
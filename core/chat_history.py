@@ -0,0 +1,54 @@
+import os
+from typing import List, Dict, Any
+
+from db import spill_chat_messages, load_chat_messages, clear_chat_messages
+
+# Bounded chat history for UI sessions. A session keeps only its newest
+# messages in memory; older ones are spilled to SQLite under the user_id and
+# read back a page at a time when the student scrolls up.
+
+CHAT_WINDOW = int(os.getenv("LEARNSENSE_CHAT_WINDOW", "40"))
+CHAT_PAGE_SIZE = int(os.getenv("LEARNSENSE_CHAT_PAGE_SIZE", "20"))
+SESSION_MEMORY_BYTES = int(os.getenv("LEARNSENSE_SESSION_MEMORY_BYTES", str(256 * 1024)))
+
+# Always keep the latest exchange on screen, whatever the caps say.
+_MIN_KEEP = 2
+# Rough per-message overhead of the dict itself.
+_MESSAGE_OVERHEAD = 64
+
+
+def message_bytes(m: Dict[str, Any]) -> int:
+    return len((m.get("content") or "").encode("utf-8")) + _MESSAGE_OVERHEAD
+
+
+def session_bytes(messages: List[Dict[str, Any]], extra: int = 0) -> int:
+    return sum(message_bytes(m) for m in messages) + extra
+
+
+def trim_window(user_id: str, messages: List[Dict[str, Any]], reserved_bytes: int = 0) -> int:
+    """
+    Spill the oldest messages until the window fits CHAT_WINDOW and
+    SESSION_MEMORY_BYTES (reserved_bytes counts other session data, e.g. an
+    attached image). Edits messages in place; returns how many were spilled.
+    """
+    budget = SESSION_MEMORY_BYTES - reserved_bytes
+    used = session_bytes(messages)
+    cut = 0
+    while len(messages) - cut > _MIN_KEEP and (len(messages) - cut > CHAT_WINDOW or used > budget):
+        used -= message_bytes(messages[cut])
+        cut += 1
+    if not cut:
+        return 0
+    spill_chat_messages(user_id, [m for m in messages[:cut] if "seq" in m])
+    del messages[:cut]
+    return cut
+
+
+def load_earlier(user_id: str, before_seq: int, pages: int) -> List[Dict[str, Any]]:
+    if pages <= 0:
+        return []
+    return load_chat_messages(user_id, before_seq, pages * CHAT_PAGE_SIZE)
+
+
+def clear_history(user_id: str):
+    clear_chat_messages(user_id)
@@ -2,11 +2,44 @@ from typing import Optional, List, Union
 from google.genai import types
 from google.genai.errors import ClientError
 
-from .gemini_client import get_client, MODEL_DEEP
-from .utils import safe_json_load, clamp
-from .prompts import prompt_diagnose
+from .model_calls import ModelUnavailable
+from .gemini_client import get_client
+from .router import route
+from .utils import safe_json_scan, clamp
+from .prompts import prompt_diagnose, prompt_diagnose_steps
+from .llm_cache import cache_key, cache_get, cache_put
+from .streaming import OnPartial
+from .hedging import ahedged_text
+from .aio import run_sync, in_thread
+from .blob_store import read_blob, blob_hash
 
-def diagnose(
+# Two stages for images: the first vision call on an image both reads the
+# handwriting and reasons about it, and its steps are kept as the image's
+# transcription, keyed by image hash and question. A turn whose whole prompt
+# was already answered for that image is served from the diagnose cache;
+# otherwise later turns on the same image (a follow-up, another hint level)
+# send the cached steps as text instead of the image, a cheaper and faster call.
+
+# Bump when the diagnose prompt changes how steps are extracted.
+_TRANSCRIPT_VERSION = "v1"
+
+
+def _transcript_key(image_hash: str, question: str) -> str:
+    # The steps are read off the image for this question; another question
+    # about the same photo (a worksheet page) gets its own transcript.
+    return cache_key("transcript", "\n".join((_TRANSCRIPT_VERSION, question.strip())), image_hash=image_hash)
+
+
+def _finish(parsed: dict) -> dict:
+    parsed["confidence"] = clamp(parsed.get("confidence", 0.5), 0.0, 1.0)
+    parsed.setdefault("steps", [])
+    parsed.setdefault("wrong_step_index", -1)
+    parsed.setdefault("fix", "")
+    parsed.setdefault("misconceptions", [])
+    return parsed
+
+
+async def adiagnose(
     question: str,
     student_text: str,
     memory_block: str,
@@ -14,35 +47,107 @@ def diagnose(
     topic: str,
     image_bytes: Optional[bytes] = None,
     image_mime: Optional[str] = None,
+    on_partial: Optional[OnPartial] = None,
+    image_hash: Optional[str] = None,
+    use_transcript: bool = True,
+    prev_confidence: Optional[float] = None,
+    attempts: int = 0,
 ) -> dict:
+    """
+    Mistake Microscope. The image comes either as image_bytes or as an
+    image_hash in the blob store, which is only read on a cache miss.
+    With use_transcript, an image whose handwriting was already transcribed
+    is diagnosed from the cached steps without sending the image again.
+    A response that was cut off comes back with "truncated": True.
+    """
     client = get_client()
     if client is None:
         return {"error": True, "error_message": "Model unavailable."}
 
+    if image_bytes and not image_hash:
+        image_hash = blob_hash(image_bytes)
     prompt = prompt_diagnose(question, student_text, memory_block, mode, topic)
+    key = cache_key("diagnose", prompt, image_bytes, image_hash=image_hash)
+    cached = await in_thread(cache_get, "diagnose", key)
+    if cached is not None:
+        return cached
+
+    tkey = _transcript_key(image_hash, question) if image_hash and use_transcript else None
+    transcript = await in_thread(cache_get, "transcript", tkey) if tkey else None
+    if transcript is not None:
+        steps = transcript["steps"]
+        prompt = prompt_diagnose_steps(question, student_text, steps, memory_block, mode, topic)
+        key = cache_key("diagnose", prompt)
+        cached = await in_thread(cache_get, "diagnose", key)
+        if cached is not None:
+            return cached
 
     contents: List[Union[str, types.Part]] = [prompt]
-    if image_bytes:
+    if transcript is None and image_hash:
+        if not image_bytes:
+            image_bytes = await in_thread(read_blob, image_hash)
+        if not image_bytes:
+            # Evicted or lost from the blob store; diagnosing without it would grade the text alone.
+            return {"error": True, "error_message": "The uploaded image is no longer available. Please upload it again."}
         mime = image_mime or "image/jpeg"
         try:
             contents.append(types.Part.from_bytes(data=image_bytes, mime_type=mime))
         except Exception:
             pass
 
+    if transcript is not None and on_partial is not None:
+        # Already known, so the UI can show them before the model answers.
+        for i, step in enumerate(steps):
+            try:
+                on_partial(f"steps[{i}]", step)
+            except Exception:
+                # As in streaming: a broken UI callback must not lose the diagnosis.
+                pass
+
     try:
-        resp = client.models.generate_content(model=MODEL_DEEP, contents=contents)
-        parsed = safe_json_load(getattr(resp, "text", "") or "")
+        fields = ("fix", "hints[]") if transcript is not None else ("fix", "steps[]", "hints[]")
+        r = route("diagnose", has_image=len(contents) > 1, prev_confidence=prev_confidence, attempts=attempts)
+        raw_text = await ahedged_text(client, "diagnose", r.model, contents, on_partial, fields, backup_model=r.backup)
+        scan = safe_json_scan(raw_text)
+        parsed = scan.value
         if not parsed:
             return {"error": True, "error_message": "Invalid model JSON."}
 
-        parsed["confidence"] = clamp(parsed.get("confidence", 0.5), 0.0, 1.0)
-        parsed.setdefault("steps", [])
-        parsed.setdefault("wrong_step_index", -1)
-        parsed.setdefault("fix", "")
-        parsed.setdefault("misconceptions", [])
+        if transcript is not None:
+            # Keep the transcribed steps so wrong_step_index lines up.
+            parsed["steps"] = steps
+        parsed = _finish(parsed)
+        if not scan.complete:
+            # Usable for this turn, but never cached (nor its steps kept as the transcript).
+            parsed["truncated"] = True
+            return parsed
+        await in_thread(cache_put, "diagnose", key, parsed)
+        if tkey and transcript is None and len(contents) > 1 and parsed["steps"]:
+            await in_thread(cache_put, "transcript", tkey, {"steps": parsed["steps"]})
         return parsed
 
-    except ClientError:
+    except (ClientError, ModelUnavailable):
         return {"error": True, "error_message": "Model busy, try again."}
     except Exception:
         return {"error": True, "error_message": "Diagnosis failed."}
+
+
+def diagnose(
+    question: str,
+    student_text: str,
+    memory_block: str,
+    mode: str,
+    topic: str,
+    image_bytes: Optional[bytes] = None,
+    image_mime: Optional[str] = None,
+    on_partial: Optional[OnPartial] = None,
+    image_hash: Optional[str] = None,
+    use_transcript: bool = True,
+    prev_confidence: Optional[float] = None,
+    attempts: int = 0,
+) -> dict:
+    return run_sync(
+        adiagnose, question, student_text, memory_block, mode, topic,
+        image_bytes=image_bytes, image_mime=image_mime, on_partial=on_partial, image_hash=image_hash,
+        use_transcript=use_transcript, prev_confidence=prev_confidence, attempts=attempts,
+    )
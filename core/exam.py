@@ -1,26 +1,43 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from google.genai.errors import ClientError
 
-from .gemini_client import get_client, MODEL_FAST
-from .utils import safe_json_load
+from .model_calls import ModelUnavailable
+from .gemini_client import get_client
+from .router import route
+from .utils import safe_json_load, safe_json_scan
 from .prompts import prompt_generate_exam, prompt_exam_report
+from .llm_cache import cache_key, cache_get, cache_put
+from .streaming import generate_text, OnPartial
+from .single_flight import single_flight, flight_key
 
-def generate_exam_questions(topic: str, style: str, n: int = 5) -> Dict[str, Any]:
+def generate_exam_questions(topic: str, style: str, n: int = 5, on_partial: Optional[OnPartial] = None) -> Dict[str, Any]:
     client = get_client()
     if client is None:
         return {"error": True, "error_message": "Model unavailable.", "questions": []}
 
     prompt = prompt_generate_exam(topic=topic, style=style, n=n)
-    try:
-        resp = client.models.generate_content(model=MODEL_FAST, contents=prompt)
-        parsed = safe_json_load(getattr(resp, "text", "") or "")
-        if not parsed or "questions" not in parsed or not isinstance(parsed.get("questions"), list):
-            return {"error": True, "error_message": "Invalid exam JSON.", "questions": []}
-        return {"questions": parsed["questions"][:n]}
-    except ClientError:
-        return {"error": True, "error_message": "Model busy, try again.", "questions": []}
-    except Exception:
-        return {"error": True, "error_message": "Exam generation failed.", "questions": []}
+    key = cache_key("exam", prompt)
+
+    def _generate(on_partial: Optional[OnPartial]) -> Dict[str, Any]:
+        cached = cache_get("exam", key)
+        if cached is not None:
+            return cached
+        try:
+            raw_text = generate_text(client, route("exam").model, prompt, on_partial, ("questions[]",), site="exam")
+            scan = safe_json_scan(raw_text)
+            parsed = scan.value
+            if not parsed or "questions" not in parsed or not isinstance(parsed.get("questions"), list):
+                return {"error": True, "error_message": "Invalid exam JSON.", "questions": []}
+            result = {"questions": parsed["questions"][:n]}
+            if scan.complete:
+                cache_put("exam", key, result)
+            return result
+        except (ClientError, ModelUnavailable):
+            return {"error": True, "error_message": "Model busy, try again.", "questions": []}
+        except Exception:
+            return {"error": True, "error_message": "Exam generation failed.", "questions": []}
+
+    return single_flight("exam", flight_key("exam", prompt), _generate, on_partial)
 
 def build_exam_report(topic: str, qa_pairs: List[Dict[str, str]]) -> Dict[str, Any]:
     client = get_client()
@@ -31,12 +48,11 @@ def build_exam_report(topic: str, qa_pairs: List[Dict[str, str]]) -> Dict[str, A
     prompt = prompt_exam_report(topic, qa_text)
 
     try:
-        resp = client.models.generate_content(model=MODEL_FAST, contents=prompt)
-        parsed = safe_json_load(getattr(resp, "text", "") or "")
+        parsed = safe_json_load(generate_text(client, route("exam").model, prompt, site="exam"))
         if not parsed:
             return {"error": True, "error_message": "Invalid report JSON."}
         return parsed
-    except ClientError:
+    except (ClientError, ModelUnavailable):
         return {"error": True, "error_message": "Model busy, try again."}
     except Exception:
         return {"error": True, "error_message": "Exam report failed."}
@@ -1,13 +1,51 @@
 import os
+import time
+import logging
+import threading
+from typing import Optional, Dict, Any
+
+import httpx
 from dotenv import load_dotenv
 from google import genai
+from google.genai import types
+
+from .scheduler import SCHED_CONCURRENCY
+from .aio import run_sync
+
+# One Gemini client per process, created under a lock so concurrent sessions
+# can't each build their own. Its sync and async HTTP pools are sized for
+# the model calls the scheduler lets out at once, and idle connections are
+# kept long enough to be reused between turns instead of paying for TCP and
+# TLS setup again. warm_up() opens a connection in each pool at startup so
+# the first student after a restart doesn't pay for it either. The async pool
+# belongs to the shared loop in core/aio.py: warm-up and every client.aio
+# call (streaming.agenerate_text) run there, whatever loop they came from.
 
 load_dotenv()
-_client = None
 
 MODEL_FAST = os.getenv("GEMINI_MODEL_FAST", "gemini-3-flash-preview")
 MODEL_DEEP = os.getenv("GEMINI_MODEL_DEEP", "gemini-3-flash-preview")  # set to pro if available
 
+# Connections per pool; by default the scheduler's slots plus headroom for warm-up.
+_default_pool = SCHED_CONCURRENCY + 4 if SCHED_CONCURRENCY > 0 else 32
+POOL_SIZE = int(os.getenv("LEARNSENSE_GEMINI_POOL_SIZE", str(_default_pool)))
+# httpx drops idle connections after 5s by default, i.e. between most turns.
+KEEPALIVE_S = float(os.getenv("LEARNSENSE_GEMINI_KEEPALIVE_S", "120"))
+WARMUP_ENABLED = os.getenv("LEARNSENSE_GEMINI_WARMUP", "1") == "1"
+
+logger = logging.getLogger(__name__)
+
+_client = None
+_lock = threading.Lock()
+_warm_started = False
+_stats: Dict[str, Any] = {"init_ms": None, "warm_up": "off", "warm_up_ms": None, "warm_up_error": None}
+
+
+def _http_options() -> types.HttpOptions:
+    limits = httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE, keepalive_expiry=KEEPALIVE_S)
+    return types.HttpOptions(client_args={"limits": limits}, async_client_args={"limits": limits})
+
+
 def get_client():
     global _client
     if _client is not None:
@@ -15,5 +53,74 @@ def get_client():
     api_key = os.getenv("GOOGLE_API_KEY")
     if not api_key:
         return None
-    _client = genai.Client(api_key=api_key)
+    with _lock:
+        if _client is None:
+            started = time.perf_counter()
+            _client = genai.Client(api_key=api_key, http_options=_http_options())
+            _stats["init_ms"] = round((time.perf_counter() - started) * 1000, 1)
     return _client
+
+
+def warm_up() -> bool:
+    """
+    Create the client and open a connection in its sync and async pools with
+    a model metadata request (no tokens). Returns False if that failed.
+    """
+    client = get_client()
+    if client is None:
+        _stats["warm_up"] = "no_api_key"
+        return False
+    _stats["warm_up"] = "running"
+    started = time.perf_counter()
+    try:
+        client.models.get(model=MODEL_FAST)
+        run_sync(client.aio.models.get, model=MODEL_FAST)
+    except Exception as exc:
+        logger.warning("Gemini warm-up failed: %s", exc)
+        _stats.update(warm_up="failed", warm_up_error=str(exc)[:200])
+        return False
+    _stats.update(warm_up="ok", warm_up_ms=round((time.perf_counter() - started) * 1000, 1), warm_up_error=None)
+    return True
+
+
+def start_warm_up():
+    """Run warm_up() once per process on a background thread (if LEARNSENSE_GEMINI_WARMUP=1)."""
+    global _warm_started
+    with _lock:
+        if not WARMUP_ENABLED or _warm_started:
+            return
+        _warm_started = True
+        _stats["warm_up"] = "pending"
+    threading.Thread(target=warm_up, name="learnsense-gemini-warmup", daemon=True).start()
+
+
+def _pool_stats(http) -> Optional[Dict[str, int]]:
+    # httpx has no public pool stats; read httpcore's pool and give up
+    # quietly if its internals change.
+    pool = getattr(getattr(http, "_transport", None), "_pool", None)
+    try:
+        connections = list(pool.connections)
+        idle = sum(1 for c in connections if c.is_idle())
+        requests = len(pool._requests)
+    except Exception:
+        return None
+    return {"connections": len(connections), "idle": idle, "busy": len(connections) - idle, "requests": requests}
+
+
+def client_stats() -> Dict[str, Any]:
+    client = _client
+    out: Dict[str, Any] = {
+        "configured": bool(os.getenv("GOOGLE_API_KEY")),
+        "created": client is not None,
+        "pool_size": POOL_SIZE,
+        "keepalive_s": KEEPALIVE_S,
+        **_stats,
+    }
+    api = getattr(client, "_api_client", None)
+    if api is not None:
+        out["sync_pool"] = _pool_stats(getattr(api, "_httpx_client", None))
+        if getattr(api, "_use_aiohttp", lambda: False)():
+            out["async_pool"] = "aiohttp"
+        else:
+            out["async_pool"] = _pool_stats(getattr(api, "_async_httpx_client", None))
+    return out
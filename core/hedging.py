@@ -0,0 +1,138 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Optional, Any, Sequence, Dict, Deque
+
+from .utils import safe_json_scan
+from .streaming import agenerate_text, OnPartial
+from .latency import record_latency, latency_percentile
+
+# Hedged requests: if the primary call hasn't answered by the
+# HEDGE_PERCENTILE of its recent latency, a backup request goes out (to the
+# other model, or the same one again) and the first valid JSON wins; the
+# loser is cancelled. Hedges are capped at HEDGE_MAX_RATE of recent calls so
+# a slow API can't double the bill. Off unless LEARNSENSE_HEDGE=1. The
+# thresholds come from the per-site latencies model_calls records.
+
+HEDGE_ENABLED = os.getenv("LEARNSENSE_HEDGE", "0") == "1"
+HEDGE_PERCENTILE = float(os.getenv("LEARNSENSE_HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("LEARNSENSE_HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MIN_DELAY_S = float(os.getenv("LEARNSENSE_HEDGE_MIN_DELAY_S", "0.5"))
+HEDGE_MAX_RATE = float(os.getenv("LEARNSENSE_HEDGE_MAX_RATE", "0.1"))
+# "other": back up to the other model when the site has one; "same": repeat.
+HEDGE_BACKUP = os.getenv("LEARNSENSE_HEDGE_BACKUP", "other").lower()
+
+# The hedge rate is measured over this many seconds of calls.
+_HEDGE_WINDOW_S = 120.0
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_calls: Deque[float] = deque()    # start times of recent primary calls
+_hedges: Deque[float] = deque()   # start times of recent hedges
+_stats = {"calls": 0, "hedged": 0, "capped": 0, "primary_wins": 0, "backup_wins": 0}
+
+
+def _hedge_delay(site: str, model: str) -> Optional[float]:
+    p = latency_percentile(site, model, HEDGE_PERCENTILE, HEDGE_MIN_SAMPLES)
+    if p is None:
+        return None
+    return max(HEDGE_MIN_DELAY_S, p / 1000.0)
+
+
+def _prune(now: float):
+    # Caller holds _lock.
+    for q in (_calls, _hedges):
+        while q and now - q[0] > _HEDGE_WINDOW_S:
+            q.popleft()
+
+
+def _take_hedge_slot() -> bool:
+    now = time.monotonic()
+    with _lock:
+        _prune(now)
+        if len(_hedges) + 1 > HEDGE_MAX_RATE * max(len(_calls), HEDGE_MIN_SAMPLES):
+            _stats["capped"] += 1
+            return False
+        _hedges.append(now)
+        _stats["hedged"] += 1
+        return True
+
+
+async def ahedged_text(
+    client: Any,
+    site: str,
+    model: str,
+    contents: Any,
+    on_partial: Optional[OnPartial] = None,
+    fields: Sequence[str] = (),
+    backup_model: Optional[str] = None,
+) -> str:
+    """
+    agenerate_text() with an optional hedge. Only the primary streams
+    partial fields; the backup is a plain call whose result replaces them.
+    """
+    started = time.perf_counter()
+    primary = asyncio.ensure_future(agenerate_text(client, model, contents, on_partial, fields, site=site))
+    delay = _hedge_delay(site, model) if HEDGE_ENABLED else None
+    with _lock:
+        _stats["calls"] += 1
+        _calls.append(time.monotonic())
+    if delay is None:
+        return await primary
+
+    backup = None
+    backup_model_used = model
+    backup_started = started
+    won = False
+    try:
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done or not _take_hedge_slot():
+            return await primary
+
+        backup_model_used = backup_model if HEDGE_BACKUP == "other" and backup_model else model
+        logger.debug("hedging %s/%s after %.2fs with %s", site, model, delay, backup_model_used)
+        backup_started = time.perf_counter()
+        backup = asyncio.ensure_future(agenerate_text(client, backup_model_used, contents, site=site))
+
+        pending = {primary, backup}
+        fallback: Optional[str] = None
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = error or task.exception()
+                    continue
+                text = task.result()
+                # A truncated answer doesn't win; the other call may finish it.
+                scan = safe_json_scan(text)
+                if scan.value is not None and scan.complete:
+                    won = True
+                    with _lock:
+                        _stats["primary_wins" if task is primary else "backup_wins"] += 1
+                    return text
+                fallback = text if fallback is None else fallback
+        if fallback is not None:
+            return fallback
+        raise error
+    finally:
+        now = time.perf_counter()
+        for task, m, t0 in ((primary, model, started), (backup, backup_model_used, backup_started)):
+            if task is not None and not task.done():
+                task.cancel()
+                # The loser's elapsed time is a lower bound on its latency;
+                # leaving it out would hide exactly the slow tail.
+                if won:
+                    record_latency(site, m, (now - t0) * 1000)
+
+
+def hedge_stats() -> Dict[str, Any]:
+    with _lock:
+        _prune(time.monotonic())
+        out: Dict[str, Any] = dict(_stats)
+        out["recent_hedge_rate"] = len(_hedges) / len(_calls) if _calls else 0.0
+    return out
@@ -0,0 +1,79 @@
+import os
+import time
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple
+
+# Remembers the last Socratic response per (user, question, answer) so moving
+# the hint slider from 1 -> 2 -> 3 is served locally instead of re-calling the model.
+
+LADDER_TTL = float(os.getenv("LEARNSENSE_HINT_LADDER_TTL", "1800"))
+LADDER_MAX_ENTRIES = int(os.getenv("LEARNSENSE_HINT_LADDER_MAX_ENTRIES", "4096"))
+
+_lock = threading.Lock()
+_ladders: "OrderedDict[Tuple[str, str, str], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+
+def normalize_answer(text: str) -> str:
+    return " ".join((text or "").lower().split())
+
+
+def _key(user_id: str, question: str, student_input: str) -> Tuple[str, str, str]:
+    q = hashlib.sha256((question or "").strip().encode("utf-8")).hexdigest()[:16]
+    a = hashlib.sha256(normalize_answer(student_input).encode("utf-8")).hexdigest()[:16]
+    return (user_id, q, a)
+
+
+def get_ladder(user_id: str, question: str, student_input: str) -> Optional[Dict[str, Any]]:
+    """Returns the stored Socratic response for this exact answer, or None."""
+    if LADDER_TTL <= 0:
+        return None
+    key = _key(user_id, question, student_input)
+    with _lock:
+        entry = _ladders.get(key)
+        if entry is None:
+            return None
+        stored_at, sc = entry
+        if time.time() - stored_at > LADDER_TTL:
+            del _ladders[key]
+            return None
+        _ladders.move_to_end(key)
+        return copy.deepcopy(sc)
+
+
+def latest_ladder(user_id: str, question: str) -> Optional[Dict[str, Any]]:
+    """Most recent stored response for this question, whatever the answer was."""
+    if LADDER_TTL <= 0:
+        return None
+    q = _key(user_id, question, "")[1]
+    now = time.time()
+    with _lock:
+        for key in reversed(_ladders):
+            if key[0] == user_id and key[1] == q:
+                stored_at, sc = _ladders[key]
+                if now - stored_at <= LADDER_TTL:
+                    return copy.deepcopy(sc)
+                break
+    return None
+
+
+def put_ladder(user_id: str, question: str, student_input: str, sc: Dict[str, Any]):
+    if LADDER_TTL <= 0 or not isinstance(sc, dict) or sc.get("error"):
+        return
+    key = _key(user_id, question, student_input)
+    with _lock:
+        _ladders[key] = (time.time(), copy.deepcopy(sc))
+        _ladders.move_to_end(key)
+        while len(_ladders) > LADDER_MAX_ENTRIES:
+            _ladders.popitem(last=False)
+
+
+def clear_ladders(user_id: Optional[str] = None):
+    with _lock:
+        if user_id is None:
+            _ladders.clear()
+            return
+        for key in [k for k in _ladders if k[0] == user_id]:
+            del _ladders[key]
@@ -0,0 +1,153 @@
+import io
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional, List, Dict, Any, Tuple
+
+from .blob_store import blob_hash, put_blob, has_blob
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; without it uploads are sent as-is.
+    Image = None
+    ImageOps = None
+
+# Shrinks answer photos before they are stored and sent to the model: phone
+# pictures of a worksheet are 4-12 MB, but handwriting reads just as well at
+# ~1600px in grayscale. Steps: EXIF orientation, crop paper margins, colour
+# reduction, downscale, re-encode as JPEG.
+
+PREP_ENABLED = os.getenv("LEARNSENSE_IMAGE_PREP", "1") == "1"
+PREP_MAX_DIM = int(os.getenv("LEARNSENSE_IMAGE_MAX_DIM", "1600"))
+# gray | contrast | color
+PREP_COLOR = os.getenv("LEARNSENSE_IMAGE_COLOR", "gray").lower()
+PREP_CROP = os.getenv("LEARNSENSE_IMAGE_CROP", "1") == "1"
+PREP_JPEG_QUALITY = int(os.getenv("LEARNSENSE_IMAGE_JPEG_QUALITY", "80"))
+
+# Pixels darker than this (after inversion: brighter) count as ink when cropping.
+_INK_THRESHOLD = 60
+_CROP_PAD = 16
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_stats = {"images": 0, "skipped": 0, "bytes_in": 0, "bytes_out": 0, "ms": 0.0}
+# original hash -> (stored hash, mime); the same upload isn't processed twice.
+_seen: "OrderedDict[str, Tuple[str, str]]" = OrderedDict()
+_SEEN_MAX = 256
+
+
+@dataclass
+class PrepResult:
+    data: bytes
+    mime: str
+    bytes_in: int
+    bytes_out: int
+    ms: float
+    steps: List[str] = field(default_factory=list)
+
+
+def _crop_margins(img: "Image.Image") -> "Image.Image":
+    gray = img if img.mode == "L" else img.convert("L")
+    ink = ImageOps.invert(ImageOps.autocontrast(gray)).point(lambda p: 255 if p > _INK_THRESHOLD else 0)
+    box = ink.getbbox()
+    if not box:
+        return img
+    left, top, right, bottom = box
+    left, top = max(0, left - _CROP_PAD), max(0, top - _CROP_PAD)
+    right, bottom = min(img.width, right + _CROP_PAD), min(img.height, bottom + _CROP_PAD)
+    # Don't crop to a speck (stray dot on a blank page).
+    if (right - left) * (bottom - top) < 0.05 * img.width * img.height:
+        return img
+    return img.crop((left, top, right, bottom))
+
+
+def preprocess_image(data: bytes, mime: Optional[str] = None) -> PrepResult:
+    """Return a smaller version of the image, or the original if that isn't smaller."""
+    started = time.perf_counter()
+    mime = mime or "image/jpeg"
+    if not PREP_ENABLED or Image is None or not data:
+        return PrepResult(data, mime, len(data or b""), len(data or b""), 0.0, ["skipped"])
+
+    steps: List[str] = []
+    try:
+        with Image.open(io.BytesIO(data)) as src:
+            img = ImageOps.exif_transpose(src)
+            steps.append("exif_transpose")
+
+            if PREP_COLOR in ("gray", "contrast"):
+                img = img.convert("L")
+                steps.append("grayscale")
+                if PREP_COLOR == "contrast":
+                    img = ImageOps.autocontrast(img, cutoff=1)
+                    steps.append("autocontrast")
+            elif img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+
+            if PREP_CROP:
+                w, h = img.size
+                img = _crop_margins(img)
+                if img.size != (w, h):
+                    steps.append("crop")
+
+            if max(img.size) > PREP_MAX_DIM:
+                img.thumbnail((PREP_MAX_DIM, PREP_MAX_DIM), Image.LANCZOS)
+                steps.append("downscale")
+
+            out = io.BytesIO()
+            img.save(out, format="JPEG", quality=PREP_JPEG_QUALITY, optimize=True, progressive=True)
+            encoded = out.getvalue()
+            steps.append("jpeg")
+    except Exception:
+        # Unreadable or unsupported format: let the model try the original.
+        logger.debug("image preprocessing failed", exc_info=True)
+        encoded = b""
+
+    ms = (time.perf_counter() - started) * 1000
+    if not encoded or len(encoded) >= len(data):
+        return PrepResult(data, mime, len(data), len(data), ms, steps + ["kept_original"])
+    return PrepResult(encoded, "image/jpeg", len(data), len(encoded), ms, steps)
+
+
+def ingest_image(data: bytes, mime: Optional[str] = None) -> Tuple[str, str]:
+    """Preprocess an upload and put it in the blob store. Returns (hash, mime)."""
+    original = blob_hash(data)
+    with _lock:
+        hit = _seen.get(original)
+    if hit is not None and has_blob(hit[0]):
+        with _lock:
+            if original in _seen:
+                _seen.move_to_end(original)
+        return hit
+
+    res = preprocess_image(data, mime)
+    stored = (put_blob(res.data), res.mime)
+
+    with _lock:
+        if res.steps == ["skipped"]:
+            _stats["skipped"] += 1
+        else:
+            _stats["images"] += 1
+            _stats["bytes_in"] += res.bytes_in
+            _stats["bytes_out"] += res.bytes_out
+            _stats["ms"] += res.ms
+        _seen[original] = stored
+        while len(_seen) > _SEEN_MAX:
+            _seen.popitem(last=False)
+
+    logger.info(
+        "image prep: %d -> %d bytes (%.0f%% saved) in %.1f ms [%s]",
+        res.bytes_in, res.bytes_out, 100.0 * (1 - res.bytes_out / max(1, res.bytes_in)), res.ms, ",".join(res.steps),
+    )
+    return stored
+
+
+def prep_stats() -> Dict[str, Any]:
+    with _lock:
+        out: Dict[str, Any] = dict(_stats)
+    out["bytes_saved"] = out["bytes_in"] - out["bytes_out"]
+    out["avg_ms"] = out["ms"] / out["images"] if out["images"] else 0.0
+    return out
@@ -0,0 +1,103 @@
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, Callable, Awaitable
+
+from .aio import get_loop
+
+# Background jobs for the UI: a turn is submitted to the shared event loop and
+# the page polls it instead of blocking a script run until the model answers.
+# Partial fields streamed by the model are collected on the job so the poller
+# can show them.
+
+JOB_TTL = float(os.getenv("LEARNSENSE_JOB_TTL", "600"))
+
+
+@dataclass
+class Job:
+    job_id: str
+    future: Optional[Future] = None
+    submitted_at: float = field(default_factory=time.monotonic)
+    finished_at: Optional[float] = None
+    _partial: Dict[str, Any] = field(default_factory=dict)
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
+    @property
+    def done(self) -> bool:
+        return self.future.done()
+
+    def partial(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._partial)
+
+    def _on_partial(self, name: str, value: Any):
+        with self._lock:
+            self._partial[name] = value
+
+    def result(self) -> Any:
+        """The job's return value; re-raises its exception."""
+        return self.future.result()
+
+
+_lock = threading.Lock()
+_jobs: Dict[str, Job] = {}
+
+
+def _expire(now: float):
+    # Caller holds _lock. Finished jobs nobody came back for (closed tabs).
+    for key in [k for k, j in _jobs.items() if j.finished_at is not None and now - j.finished_at > JOB_TTL]:
+        del _jobs[key]
+
+
+def submit_job(job_id: str, afunc: Callable[..., Awaitable[Any]], **kwargs: Any) -> Job:
+    """
+    Start afunc(on_partial=..., **kwargs) on the shared loop. Submitting an id
+    that is already known returns the existing job.
+    """
+    with _lock:
+        _expire(time.monotonic())
+        existing = _jobs.get(job_id)
+        if existing is not None:
+            return existing
+
+        job = Job(job_id=job_id)
+        fut = asyncio.run_coroutine_threadsafe(afunc(on_partial=job._on_partial, **kwargs), get_loop())
+        job.future = fut
+        _jobs[job_id] = job
+
+    def finished(_f: Future):
+        job.finished_at = time.monotonic()
+
+    fut.add_done_callback(finished)
+    return job
+
+
+def get_job(job_id: Optional[str]) -> Optional[Job]:
+    if not job_id:
+        return None
+    with _lock:
+        return _jobs.get(job_id)
+
+
+def pop_job(job_id: Optional[str]) -> Optional[Job]:
+    if not job_id:
+        return None
+    with _lock:
+        return _jobs.pop(job_id, None)
+
+
+def cancel_job(job_id: Optional[str]) -> bool:
+    """Cancel and forget a job; cancelling the coroutine aborts its model call."""
+    job = pop_job(job_id)
+    if job is None:
+        return False
+    return job.future.cancel()
+
+
+def job_stats() -> Dict[str, int]:
+    with _lock:
+        running = sum(1 for j in _jobs.values() if not j.done)
+        return {"running": running, "finished": len(_jobs) - running}
@@ -0,0 +1,302 @@
+import re
+import json
+from dataclasses import dataclass, field
+from typing import Optional, Any, Dict, List
+
+# Single-pass, chunk-fed scanner that pulls the first JSON object out of model
+# output and repairs the defects we actually see from the model:
+#   - prose / ``` fences around the object (ignored)
+#   - raw newlines, tabs and other control chars inside strings (escaped)
+#   - invalid backslash escapes such as "\q" (backslash escaped)
+#   - trailing commas before } or ] (dropped)
+#   - missing commas between values, as in [1 2 3] (inserted)
+#   - Python literals True / False / None (mapped to JSON)
+#   - truncation at the end (open string, dangling key/colon/comma,
+#     half-written literal, unclosed containers are all closed off)
+
+_STRING_RUN = re.compile(r'[^"\\\x00-\x1f]+')
+_LITERAL_RUN = re.compile(r'[^\s,:\[\]{}"]+')
+_WHITESPACE = re.compile(r"\s+")
+_VALID_ESCAPES = set('"\\/bfnrtu')
+_CONTROL_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t", "\b": "\\b", "\f": "\\f"}
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_decoder = json.JSONDecoder()
+_NUMBER_TAIL = re.compile(r"[-+.eE]+$")
+_PARTIAL_UNICODE = re.compile(r"(\\+)u[0-9a-fA-F]{0,3}$")
+
+
+@dataclass
+class ScanResult:
+    value: Optional[Dict[str, Any]] = None
+    text: Optional[str] = None            # the (repaired) JSON text of the object
+    complete: bool = False                # the object closed on its own
+    repairs: List[str] = field(default_factory=list)
+    fields: List[str] = field(default_factory=list)          # top-level keys fully received
+    partial_fields: List[str] = field(default_factory=list)  # top-level keys cut off by truncation
+
+
+class JsonScanner:
+    """
+    Feed model output in chunks with feed(); call result() at any point.
+    Scanning stops at the end of the first balanced object.
+    """
+
+    def __init__(self):
+        self._out: List[str] = []
+        self._stack: List[List[str]] = []   # [kind, expect]; kind "{"/"[", expect "key"/"value"
+        self._started = False
+        self._done = False
+        self._in_string = False
+        self._string_is_key = False
+        self._string_start = 0
+        self._bare_key_start: Optional[int] = None  # key received, colon not yet
+        self._escape = False
+        self._literal_start: Optional[int] = None
+        self._key: Optional[str] = None   # top-level key whose value is being read
+        self._repairs: List[str] = []
+        self._fields: List[str] = []
+
+    @property
+    def done(self) -> bool:
+        return self._done
+
+    def _repair(self, what: str):
+        if what not in self._repairs:
+            self._repairs.append(what)
+
+    def _field_done(self):
+        if len(self._stack) == 1 and self._key is not None and self._key not in self._fields:
+            self._fields.append(self._key)
+
+    def _end_literal(self):
+        if self._literal_start is None:
+            return
+        text = "".join(self._out[self._literal_start:])
+        if text in _PY_LITERALS:
+            self._out[self._literal_start:] = [_PY_LITERALS[text]]
+            self._repair("python_literal")
+        self._literal_start = None
+        self._field_done()
+
+    def _value_start(self):
+        # A value right after another one ("[1 2]", '{"a": 1 "b": 2}'): the
+        # comma between them is missing. Without it the two would be glued
+        # together (1 2 -> 12) or the next key read as a value.
+        out = self._out
+        if self._bare_key_start is not None or out[-1][-1] in ",:[{":
+            return
+        out.append(",")
+        self._repair("missing_comma")
+        top = self._stack[-1]
+        if top[0] == "{":
+            top[1] = "key"
+            if len(self._stack) == 1:
+                self._key = None
+
+    def feed(self, chunk: str) -> "JsonScanner":
+        i, n = 0, len(chunk or "")
+        out = self._out
+        while i < n and not self._done:
+            if not self._started:
+                j = chunk.find("{", i)
+                if j < 0:
+                    break
+                self._started = True
+                self._stack.append(["{", "key"])
+                out.append("{")
+                i = j + 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    c = chunk[i]
+                    if c in _VALID_ESCAPES:
+                        out.append("\\" + c)
+                    else:
+                        out.append("\\\\" + _CONTROL_ESCAPES.get(c, c))
+                        self._repair("invalid_escape")
+                    self._escape = False
+                    i += 1
+                    continue
+                m = _STRING_RUN.match(chunk, i)
+                if m:
+                    out.append(m.group())
+                    i = m.end()
+                    continue
+                c = chunk[i]
+                if c == '"':
+                    out.append('"')
+                    self._in_string = False
+                    i += 1
+                    if self._string_is_key:
+                        self._bare_key_start = self._string_start
+                    if self._string_is_key and len(self._stack) == 1:
+                        try:
+                            self._key = json.loads("".join(out[self._string_start:]))
+                        except ValueError:
+                            self._key = None
+                    elif not self._string_is_key:
+                        self._field_done()
+                elif c == "\\":
+                    self._escape = True
+                    i += 1
+                else:
+                    out.append(_CONTROL_ESCAPES.get(c, "\\u%04x" % ord(c)))
+                    self._repair("unescaped_control_char")
+                    i += 1
+                continue
+
+            c = chunk[i]
+            if c in " \t\r\n":
+                self._end_literal()
+                i = _WHITESPACE.match(chunk, i).end()
+                continue
+
+            top = self._stack[-1]
+            if c == '"':
+                self._end_literal()
+                self._value_start()
+                self._in_string = True
+                self._string_is_key = top[0] == "{" and top[1] == "key"
+                self._string_start = len(out)
+                out.append('"')
+                i += 1
+            elif c in "{[":
+                self._end_literal()
+                self._value_start()
+                self._stack.append([c, "key" if c == "{" else "value"])
+                out.append(c)
+                i += 1
+            elif c in "}]":
+                self._end_literal()
+                if out and out[-1] == ",":
+                    out.pop()
+                    self._repair("trailing_comma")
+                kind = self._stack.pop()[0]
+                closer = "}" if kind == "{" else "]"
+                if closer != c:
+                    self._repair("mismatched_bracket")
+                out.append(closer)
+                i += 1
+                if not self._stack:
+                    self._done = True
+                elif len(self._stack) == 1:
+                    self._field_done()
+            elif c == ",":
+                self._end_literal()
+                if out and out[-1] in ",[{":
+                    self._repair("stray_comma")
+                else:
+                    out.append(",")
+                if top[0] == "{":
+                    top[1] = "key"
+                    if len(self._stack) == 1:
+                        self._key = None
+                i += 1
+            elif c == ":":
+                self._end_literal()
+                out.append(":")
+                top[1] = "value"
+                self._bare_key_start = None
+                i += 1
+            else:
+                m = _LITERAL_RUN.match(chunk, i)
+                if self._literal_start is None:
+                    self._value_start()
+                    self._literal_start = len(out)
+                out.append(m.group())
+                i = m.end()
+        return self
+
+    def result(self) -> ScanResult:
+        if not self._started:
+            return ScanResult()
+
+        out = list(self._out)
+        stack = [list(s) for s in self._stack]
+        repairs = list(self._repairs)
+        fields = list(self._fields)
+        partial: List[str] = []
+
+        if not self._done:
+            repairs.append("truncated")
+            top_key = self._key
+
+            if self._in_string:
+                if self._string_is_key:
+                    del out[self._string_start:]
+                    if len(stack) == 1:
+                        top_key = None
+                else:
+                    # Drop a half-written \uXXXX escape before closing the string.
+                    body = "".join(out[self._string_start:])
+                    m = _PARTIAL_UNICODE.search(body)
+                    if m and len(m.group(1)) % 2 == 1:
+                        body = body[:m.start()] + m.group(1)[:-1]
+                    out[self._string_start:] = [body, '"']
+            elif self._literal_start is not None:
+                literal = "".join(out[self._literal_start:])
+                for full in ("true", "false", "null"):
+                    if full.startswith(literal) or _PY_LITERALS.get(literal) == full:
+                        literal = full
+                        break
+                else:
+                    literal = _NUMBER_TAIL.sub("", literal)
+                del out[self._literal_start:]
+                if literal:
+                    out.append(literal)
+
+            # Drop a dangling key (with or without its colon) or comma.
+            bare_key = self._bare_key_start if not self._in_string else None
+            while out:
+                last = out[-1]
+                if last == ",":
+                    out.pop()
+                elif last == ":":
+                    out.append("null")
+                elif bare_key is not None:
+                    # A complete key string with no colon after it.
+                    del out[bare_key:]
+                    bare_key = None
+                    if len(stack) == 1:
+                        top_key = None
+                else:
+                    break
+
+            if top_key is not None and top_key not in fields:
+                partial.append(top_key)
+
+            for kind, _ in reversed(stack):
+                out.append("}" if kind == "{" else "]")
+
+        text = "".join(out)
+        try:
+            value = json.loads(text)
+        except ValueError:
+            value = None
+        if not isinstance(value, dict):
+            value = None
+
+        return ScanResult(
+            value=value,
+            text=text if value is not None else None,
+            complete=self._done,
+            repairs=repairs,
+            fields=fields,
+            partial_fields=partial,
+        )
+
+
+def scan_json(text: str) -> ScanResult:
+    text = text or ""
+    # Well-formed output is the common case: let the C decoder try first and
+    # only walk the text in Python when it needs repairing.
+    start = text.find("{")
+    if start != -1:
+        try:
+            value, end = _decoder.raw_decode(text, start)
+        except ValueError:
+            value = None
+        if isinstance(value, dict):
+            return ScanResult(value=value, text=text[start:end], complete=True, fields=list(value))
+    return JsonScanner().feed(text).result()
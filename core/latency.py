@@ -0,0 +1,108 @@
+import os
+import time
+import bisect
+import threading
+from collections import deque
+from typing import Dict, Any, List, Optional, Deque, Tuple
+
+# Rolling latency histograms and error rates for model calls, keyed by
+# "site/model" (e.g. "diagnose/gemini-3-flash-preview"). Percentiles and
+# error rates come from the last LATENCY_WINDOW calls; bucket counts are
+# cumulative, for dashboards.
+
+LATENCY_WINDOW = int(os.getenv("LEARNSENSE_LATENCY_WINDOW", "500"))
+
+# Upper bounds in ms; the last bucket catches everything slower.
+BUCKETS_MS = [100, 250, 500, 750, 1000, 1500, 2000, 3000, 5000, 7500, 10000, 15000, 20000, 30000, 60000]
+
+_lock = threading.Lock()
+_windows: Dict[str, Deque[Tuple[float, float]]] = {}     # (monotonic time, ms)
+_buckets: Dict[str, List[int]] = {}
+_outcomes: Dict[str, Deque[Tuple[float, bool]]] = {}     # (monotonic time, failed)
+
+
+def _key(site: str, model: str) -> str:
+    return f"{site}/{model}"
+
+
+def record_latency(site: str, model: str, ms: float):
+    key = _key(site, model)
+    with _lock:
+        window = _windows.get(key)
+        if window is None:
+            window = _windows[key] = deque(maxlen=LATENCY_WINDOW)
+            _buckets[key] = [0] * (len(BUCKETS_MS) + 1)
+        window.append((time.monotonic(), ms))
+        _buckets[key][bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        _outcome(key, False)
+
+
+def _outcome(key: str, failed: bool):
+    # Caller holds _lock.
+    outcomes = _outcomes.get(key)
+    if outcomes is None:
+        outcomes = _outcomes[key] = deque(maxlen=LATENCY_WINDOW)
+    outcomes.append((time.monotonic(), failed))
+
+
+def record_error(site: str, model: str):
+    with _lock:
+        _outcome(_key(site, model), True)
+
+
+def _recent(window, max_age_s: Optional[float]) -> list:
+    # Caller holds _lock.
+    if not window:
+        return []
+    if max_age_s is None:
+        return [v for _, v in window]
+    cutoff = time.monotonic() - max_age_s
+    return [v for t, v in window if t >= cutoff]
+
+
+def error_rate(site: str, model: str, min_samples: int = 1, max_age_s: Optional[float] = None) -> Optional[float]:
+    """Share of recent calls that failed, or None with fewer than min_samples."""
+    with _lock:
+        outcomes = _recent(_outcomes.get(_key(site, model)), max_age_s)
+    if len(outcomes) < max(1, min_samples):
+        return None
+    return sum(outcomes) / len(outcomes)
+
+
+def _percentile(sorted_ms: List[float], pct: float) -> float:
+    idx = min(len(sorted_ms) - 1, max(0, int(round(pct / 100.0 * (len(sorted_ms) - 1)))))
+    return sorted_ms[idx]
+
+
+def latency_percentile(
+    site: str, model: str, pct: float, min_samples: int = 1, max_age_s: Optional[float] = None,
+) -> Optional[float]:
+    """
+    pct-th percentile of recent latencies in ms, or None with fewer than
+    min_samples. max_age_s ignores samples older than that.
+    """
+    with _lock:
+        samples = sorted(_recent(_windows.get(_key(site, model)), max_age_s))
+    if len(samples) < max(1, min_samples):
+        return None
+    return _percentile(samples, pct)
+
+
+def latency_stats() -> Dict[str, Dict[str, Any]]:
+    labels = [f"<={b}" for b in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}"]
+    with _lock:
+        snapshot = {
+            k: (sorted(_recent(_windows.get(k), None)), list(_buckets.get(k) or [0] * len(labels)), _recent(o, None))
+            for k, o in _outcomes.items()
+        }
+    out = {}
+    for key, (samples, buckets, outcomes) in snapshot.items():
+        out[key] = {
+            "samples": len(samples),
+            "error_rate": sum(outcomes) / len(outcomes) if outcomes else 0.0,
+            "p50_ms": _percentile(samples, 50) if samples else None,
+            "p95_ms": _percentile(samples, 95) if samples else None,
+            "p99_ms": _percentile(samples, 99) if samples else None,
+            "histogram": dict(zip(labels, buckets)),
+        }
+    return out
@@ -0,0 +1,241 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple
+
+# Content-addressed cache for parsed model responses, keyed by (call site,
+# prompt, image). Not by model: the router and hedging pick the model per
+# call, and any answer they accept for a site is a valid answer for it.
+# Tier 1: in-process LRU. Tier 2: SQLite file shared by every process.
+
+CACHE_PATH = os.getenv("LEARNSENSE_LLM_CACHE_PATH", "llm_cache.db")
+MEMORY_ENTRIES = int(os.getenv("LEARNSENSE_LLM_CACHE_MEMORY_ENTRIES", "512"))
+DISK_MAX_BYTES = int(os.getenv("LEARNSENSE_LLM_CACHE_DISK_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Call sites opt in by having a TTL (seconds) here.
+SITE_TTLS: Dict[str, float] = {
+    "rubric": float(os.getenv("LEARNSENSE_LLM_CACHE_TTL_RUBRIC", str(7 * 24 * 3600))),
+    "exam": float(os.getenv("LEARNSENSE_LLM_CACHE_TTL_EXAM", str(24 * 3600))),
+    "notes": float(os.getenv("LEARNSENSE_LLM_CACHE_TTL_NOTES", str(24 * 3600))),
+    # The diagnose prompt embeds the student's history, so hits are rarer; off by default.
+    "diagnose": float(os.getenv("LEARNSENSE_LLM_CACHE_TTL_DIAGNOSE", str(3600))),
+    # Handwriting transcriptions keyed by image hash and question; an image never changes.
+    "transcript": float(os.getenv("LEARNSENSE_LLM_CACHE_TTL_TRANSCRIPT", str(7 * 24 * 3600))),
+    # Worksheet items are keyed by page hash + question, without the history.
+    "worksheet": float(os.getenv("LEARNSENSE_LLM_CACHE_TTL_WORKSHEET", str(24 * 3600))),
+}
+_enabled_sites = os.getenv("LEARNSENSE_LLM_CACHE_SITES", "rubric,exam,notes,worksheet,transcript")
+ENABLED_SITES = {s.strip() for s in _enabled_sites.split(",") if s.strip()}
+
+# Touched disk entries' last_used is written in batches of this many, or
+# with the next store, instead of one UPDATE per hit.
+TOUCH_BATCH = int(os.getenv("LEARNSENSE_LLM_CACHE_TOUCH_BATCH", "64"))
+
+# _lock guards the memory tier, stats and pending touches only; the disk tier
+# is read and written outside it, on a connection per thread (WAL lets
+# readers run alongside the writer).
+_lock = threading.Lock()
+_memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()  # key -> (expires_at, json)
+_touched: Dict[str, float] = {}  # key -> last_used not yet written to disk
+_puts_since_evict = 0
+_stats: Dict[str, Dict[str, int]] = {}
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+_TOUCH_SQL = "UPDATE llm_cache SET last_used=? WHERE key=?"
+
+
+def _count(site: str, outcome: str):
+    # Caller holds _lock.
+    site_stats = _stats.setdefault(site, {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0})
+    site_stats[outcome] += 1
+
+
+def _disk_conn() -> Optional[sqlite3.Connection]:
+    """This thread's connection to the disk tier, or None if there is none."""
+    global _schema_ready
+    con = getattr(_local, "con", None)
+    if con is not None or not CACHE_PATH:
+        return con
+    try:
+        con = sqlite3.connect(CACHE_PATH, timeout=5.0)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA synchronous=NORMAL")
+        with _schema_lock:
+            if not _schema_ready:
+                con.execute("""
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    site TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+                """)
+                con.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache (last_used)")
+                con.commit()
+                _schema_ready = True
+    except sqlite3.Error:
+        return None
+    _local.con = con
+    return con
+
+
+def _take_touched() -> List[Tuple[float, str]]:
+    # Caller holds _lock.
+    batch = [(last_used, key) for key, last_used in _touched.items()]
+    _touched.clear()
+    return batch
+
+
+def cache_key(site: str, prompt: str, image_bytes: Optional[bytes] = None, image_hash: Optional[str] = None) -> str:
+    # image_hash is the blob store's sha256 of the image; same key as passing the bytes.
+    h = hashlib.sha256()
+    h.update(site.encode("utf-8"))
+    h.update(b"\0")
+    h.update(hashlib.sha256(prompt.encode("utf-8")).digest())
+    h.update(b"\0")
+    if image_hash:
+        h.update(bytes.fromhex(image_hash))
+    elif image_bytes:
+        h.update(hashlib.sha256(image_bytes).digest())
+    return h.hexdigest()
+
+
+def is_enabled(site: str) -> bool:
+    return site in ENABLED_SITES and site in SITE_TTLS
+
+
+def cache_get(site: str, key: str) -> Optional[Dict[str, Any]]:
+    """Returns a fresh copy of the cached response, or None."""
+    if not is_enabled(site):
+        return None
+
+    now = time.time()
+    with _lock:
+        entry = _memory.get(key)
+        if entry is not None:
+            expires_at, raw = entry
+            if expires_at > now:
+                _memory.move_to_end(key)
+                _count(site, "memory_hits")
+                return json.loads(raw)
+            del _memory[key]
+
+    con = _disk_conn()
+    row = None
+    if con is not None:
+        try:
+            row = con.execute("SELECT value, expires_at FROM llm_cache WHERE key=?", (key,)).fetchone()
+        except sqlite3.Error:
+            row = None
+    if row and row[1] <= now:
+        # Left for the next eviction pass to delete.
+        row = None
+
+    touched: List[Tuple[float, str]] = []
+    with _lock:
+        if not row:
+            _count(site, "misses")
+            return None
+        _remember(key, row[1], row[0])
+        _count(site, "disk_hits")
+        _touched[key] = now
+        if len(_touched) >= TOUCH_BATCH:
+            touched = _take_touched()
+    if touched:
+        try:
+            con.executemany(_TOUCH_SQL, touched)
+            con.commit()
+        except sqlite3.Error:
+            pass
+    return json.loads(row[0])
+
+
+def _remember(key: str, expires_at: float, raw: str):
+    # Caller holds _lock.
+    _memory[key] = (expires_at, raw)
+    _memory.move_to_end(key)
+    while len(_memory) > MEMORY_ENTRIES:
+        _memory.popitem(last=False)
+
+
+def cache_put(site: str, key: str, value: Dict[str, Any]):
+    """Store a successful response. Error responses are never cached."""
+    global _puts_since_evict
+    if not is_enabled(site) or not isinstance(value, dict) or value.get("error"):
+        return
+
+    try:
+        raw = json.dumps(value)
+    except (TypeError, ValueError):
+        return
+
+    now = time.time()
+    expires_at = now + SITE_TTLS[site]
+    with _lock:
+        _remember(key, expires_at, raw)
+        _count(site, "stores")
+        _puts_since_evict += 1
+        evict = _puts_since_evict >= 50
+        if evict:
+            _puts_since_evict = 0
+        touched = _take_touched()
+
+    con = _disk_conn()
+    if con is None:
+        return
+    try:
+        con.execute(
+            "INSERT OR REPLACE INTO llm_cache (key, site, value, size, expires_at, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+            (key, site, raw, len(raw), expires_at, now),
+        )
+        if touched:
+            con.executemany(_TOUCH_SQL, touched)
+        if evict:
+            _evict_disk(con, now)
+        con.commit()
+    except sqlite3.Error:
+        pass
+
+
+def _evict_disk(con: sqlite3.Connection, now: float):
+    # Drop expired rows, then least recently used ones until under the byte budget.
+    con.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,))
+    total = con.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+    if total <= DISK_MAX_BYTES:
+        return
+    excess = total - DISK_MAX_BYTES
+    freed = 0
+    doomed = []
+    for key, size in con.execute("SELECT key, size FROM llm_cache ORDER BY last_used ASC"):
+        doomed.append((key,))
+        freed += size
+        if freed >= excess:
+            break
+    con.executemany("DELETE FROM llm_cache WHERE key=?", doomed)
+
+
+def cache_stats() -> Dict[str, Dict[str, int]]:
+    with _lock:
+        return {site: dict(s) for site, s in _stats.items()}
+
+
+def cache_clear():
+    with _lock:
+        _memory.clear()
+        _touched.clear()
+    con = _disk_conn()
+    if con is not None:
+        try:
+            con.execute("DELETE FROM llm_cache")
+            con.commit()
+        except sqlite3.Error:
+            pass
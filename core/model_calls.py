@@ -0,0 +1,269 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, Callable, Awaitable, TypeVar
+
+from google.genai.errors import APIError
+
+from .latency import record_latency, record_error
+from .scheduler import slot, aslot, Overloaded
+
+# Every model request goes through call_model()/acall_model() (via
+# streaming.generate_text/agenerate_text). Per model they add:
+#   - a token bucket, so a class submitting at once queues briefly here
+#     instead of hitting the API quota for everyone;
+#   - retries with jittered exponential backoff for 429/5xx/transport errors;
+#   - a circuit breaker that fails fast while the API keeps failing (5xx,
+#     transport errors; not 429s), then lets one probe through after a cooldown;
+#   - counters for each outcome (call_stats()).
+# Before any of that, each call waits for a slot from core/scheduler.py,
+# which shares the API between users and call types. Limits are per process.
+# Calls made for a call site ("diagnose", "notes", ...) also feed that site's
+# latency and error stats in core/latency.py.
+
+MODEL_RPM = float(os.getenv("LEARNSENSE_MODEL_RPM", "120"))
+MODEL_BURST = float(os.getenv("LEARNSENSE_MODEL_BURST", "10"))
+# "model-a=60,model-b=300" overrides LEARNSENSE_MODEL_RPM per model.
+_rpm_overrides = os.getenv("LEARNSENSE_MODEL_RPM_OVERRIDES", "")
+RPM_OVERRIDES = {
+    k.strip(): float(v) for k, _, v in (p.partition("=") for p in _rpm_overrides.split(",")) if k.strip() and v.strip()
+}
+# Waiting longer than this for a token is rejected instead of queued.
+MODEL_MAX_WAIT_S = float(os.getenv("LEARNSENSE_MODEL_MAX_WAIT_S", "10"))
+
+MODEL_RETRIES = int(os.getenv("LEARNSENSE_MODEL_RETRIES", "3"))
+BACKOFF_BASE_S = float(os.getenv("LEARNSENSE_MODEL_BACKOFF_S", "0.5"))
+BACKOFF_MAX_S = float(os.getenv("LEARNSENSE_MODEL_BACKOFF_MAX_S", "8"))
+
+BREAKER_FAILURES = int(os.getenv("LEARNSENSE_BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN_S = float(os.getenv("LEARNSENSE_BREAKER_COOLDOWN_S", "30"))
+
+RETRYABLE_CODES = {408, 429, 500, 502, 503, 504}
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class ModelUnavailable(Exception):
+    """Rejected without calling the API: the circuit is open, or the rate limit or scheduler queue is too long."""
+
+
+@dataclass
+class _ModelState:
+    rate: float                      # tokens per second
+    burst: float
+    tokens: float = 0.0
+    refilled_at: float = field(default_factory=time.monotonic)
+    failures: int = 0                # consecutive retryable failures
+    open_until: float = 0.0
+    probing: bool = False
+    counters: Dict[str, float] = field(default_factory=lambda: {
+        "calls": 0, "ok": 0, "retries": 0, "quota_errors": 0, "retryable_errors": 0, "errors": 0,
+        "throttled": 0, "throttle_wait_ms": 0.0, "rejected_rate": 0, "rejected_open": 0, "breaker_trips": 0,
+    })
+
+
+_lock = threading.Lock()
+_models: Dict[str, _ModelState] = {}
+
+
+def _state(model: str) -> _ModelState:
+    # Caller holds _lock.
+    st = _models.get(model)
+    if st is None:
+        rpm = RPM_OVERRIDES.get(model, MODEL_RPM)
+        st = _ModelState(rate=rpm / 60.0, burst=max(1.0, MODEL_BURST))
+        st.tokens = st.burst
+        _models[model] = st
+    return st
+
+
+def _admit(model: str) -> float:
+    """Check the breaker and take a token. Returns how long to wait before calling."""
+    now = time.monotonic()
+    with _lock:
+        st = _state(model)
+        st.counters["calls"] += 1
+        if st.open_until:
+            if now < st.open_until or st.probing:
+                st.counters["rejected_open"] += 1
+                raise ModelUnavailable(f"{model}: circuit open")
+            # Cooldown over: this request is the half-open probe.
+            st.probing = True
+
+        if st.rate <= 0:
+            return 0.0
+        st.tokens = min(st.burst, st.tokens + (now - st.refilled_at) * st.rate)
+        st.refilled_at = now
+        wait = 0.0 if st.tokens >= 1 else (1 - st.tokens) / st.rate
+        if wait > MODEL_MAX_WAIT_S:
+            st.counters["rejected_rate"] += 1
+            st.probing = False
+            raise ModelUnavailable(f"{model}: rate limit queue full")
+        # Reserve the token now so concurrent callers queue behind this one.
+        st.tokens -= 1
+        if wait:
+            st.counters["throttled"] += 1
+            st.counters["throttle_wait_ms"] += wait * 1000
+        return wait
+
+
+def _succeeded(model: str):
+    with _lock:
+        st = _state(model)
+        st.counters["ok"] += 1
+        st.failures = 0
+        st.open_until = 0.0
+        st.probing = False
+
+
+def _failed(model: str, exc: BaseException, retryable: bool):
+    with _lock:
+        st = _state(model)
+        if not retryable:
+            st.counters["errors"] += 1
+            st.probing = False
+            return
+        if getattr(exc, "code", None) == 429:
+            # Over quota, not degraded: don't trip the breaker, but empty the
+            # bucket so other callers slow down too.
+            st.counters["quota_errors"] += 1
+            st.tokens = min(st.tokens, 0.0)
+            st.probing = False
+            return
+        st.counters["retryable_errors"] += 1
+        st.failures += 1
+        if st.probing or st.failures >= BREAKER_FAILURES:
+            if not st.open_until or st.probing:
+                st.counters["breaker_trips"] += 1
+                logger.warning("model %s: circuit open for %.0fs after %d failures", model, BREAKER_COOLDOWN_S, st.failures)
+            st.open_until = time.monotonic() + BREAKER_COOLDOWN_S
+            st.probing = False
+
+
+def _retryable(exc: BaseException) -> bool:
+    if isinstance(exc, APIError):
+        return getattr(exc, "code", None) in RETRYABLE_CODES
+    # Timeouts and dropped connections from the HTTP layer.
+    return isinstance(exc, (TimeoutError, ConnectionError)) or type(exc).__module__.startswith(("httpx", "httpcore"))
+
+
+def _backoff(attempt: int) -> float:
+    # Full jitter: spreads out the retries of everyone who failed together.
+    return random.uniform(0, min(BACKOFF_MAX_S, BACKOFF_BASE_S * (2 ** attempt)))
+
+
+def _count_retry(model: str):
+    with _lock:
+        _state(model).counters["retries"] += 1
+
+
+def call_model(model: str, fn: Callable[[], T], site: Optional[str] = None) -> T:
+    """Run fn() (one request to model) with scheduling, rate limiting, retries and the circuit breaker."""
+    try:
+        with slot(site):
+            return _call_model(model, fn, site)
+    except Overloaded as exc:
+        raise ModelUnavailable(str(exc)) from exc
+
+
+def _call_model(model: str, fn: Callable[[], T], site: Optional[str]) -> T:
+    started = time.perf_counter()
+    attempt = 0
+    while True:
+        try:
+            wait = _admit(model)
+        except ModelUnavailable:
+            if site:
+                record_error(site, model)
+            raise
+        if wait:
+            time.sleep(wait)
+        try:
+            result = fn()
+        except Exception as exc:
+            retryable = _retryable(exc)
+            _failed(model, exc, retryable)
+            if not retryable or attempt >= MODEL_RETRIES:
+                if site:
+                    record_error(site, model)
+                raise
+            _count_retry(model)
+            time.sleep(_backoff(attempt))
+            attempt += 1
+            continue
+        _succeeded(model)
+        if site:
+            record_latency(site, model, (time.perf_counter() - started) * 1000)
+        return result
+
+
+async def acall_model(model: str, afn: Callable[[], Awaitable[T]], site: Optional[str] = None) -> T:
+    """Async call_model(); queueing, waits and backoff sleeps are cancellable."""
+    try:
+        async with aslot(site):
+            return await _acall_model(model, afn, site)
+    except Overloaded as exc:
+        raise ModelUnavailable(str(exc)) from exc
+
+
+async def _acall_model(model: str, afn: Callable[[], Awaitable[T]], site: Optional[str]) -> T:
+    started = time.perf_counter()
+    attempt = 0
+    while True:
+        try:
+            wait = _admit(model)
+        except ModelUnavailable:
+            if site:
+                record_error(site, model)
+            raise
+        if wait:
+            await asyncio.sleep(wait)
+        try:
+            result = await afn()
+        except asyncio.CancelledError:
+            with _lock:
+                _state(model).probing = False
+            raise
+        except Exception as exc:
+            retryable = _retryable(exc)
+            _failed(model, exc, retryable)
+            if not retryable or attempt >= MODEL_RETRIES:
+                if site:
+                    record_error(site, model)
+                raise
+            _count_retry(model)
+            await asyncio.sleep(_backoff(attempt))
+            attempt += 1
+            continue
+        _succeeded(model)
+        if site:
+            record_latency(site, model, (time.perf_counter() - started) * 1000)
+        return result
+
+
+def circuit_open(model: str) -> bool:
+    """True while the model's breaker is rejecting calls."""
+    with _lock:
+        st = _models.get(model)
+        return st is not None and time.monotonic() < st.open_until
+
+
+def call_stats() -> Dict[str, Dict[str, Any]]:
+    now = time.monotonic()
+    with _lock:
+        out = {}
+        for model, st in _models.items():
+            d: Dict[str, Any] = dict(st.counters)
+            if not st.open_until:
+                d["circuit"] = "closed"
+            else:
+                d["circuit"] = "open" if now < st.open_until else "half_open"
+            d["tokens"] = round(min(st.burst, st.tokens + (now - st.refilled_at) * st.rate), 2)
+            out[model] = d
+        return out
@@ -0,0 +1,185 @@
+import os
+import time
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, List, Tuple, Set
+
+from .rubric import agenerate_rubric, arefresh_minimal_fix
+from .scheduler import user_scope
+from .aio import get_loop, run_sync
+
+# Speculative rubric generation: start the slow MODEL_DEEP rubric call in the
+# background while the student is still trying, so "Give up" (or the automatic
+# reveal) can pick up a finished or half-finished result. Prefetches run as
+# tasks on the shared event loop, so cancelling one really stops its call.
+# A rubric is matched on (user, question, topic, mode); when the student's
+# answer changed since the prefetch started, only minimal_fix and the
+# per-step student errors are redone.
+
+PREFETCH_ENABLED = os.getenv("LEARNSENSE_PREFETCH_RUBRIC", "1") == "1"
+PREFETCH_MAX_CONCURRENT = int(os.getenv("LEARNSENSE_PREFETCH_MAX_CONCURRENT", "2"))
+PREFETCH_TTL = float(os.getenv("LEARNSENSE_PREFETCH_TTL", "900"))
+
+
+@dataclass(eq=False)
+class _Entry:
+    attempt: str               # hash of the attempt the rubric was started for
+    started_at: float
+    future: Optional[Future] = None
+    running: bool = False
+    settled: bool = False      # slot released
+
+
+_slots = threading.BoundedSemaphore(max(1, PREFETCH_MAX_CONCURRENT))
+_lock = threading.Lock()
+
+# (user_id, hash(question, topic, mode)) -> entry
+_entries: Dict[Tuple[str, str], _Entry] = {}
+# Prefetches still holding a slot, including cancelled ones that are winding down.
+_live: Set[_Entry] = set()
+_stats = {"started": 0, "rejected": 0, "used": 0, "refreshed": 0, "wasted": 0}
+
+
+def _hash(*parts: str) -> str:
+    return hashlib.sha256("\0".join((p or "").strip() for p in parts).encode("utf-8")).hexdigest()[:16]
+
+
+def _settle(entry: _Entry):
+    with _lock:
+        if entry.settled:
+            return
+        entry.settled = True
+        _live.discard(entry)
+    _slots.release()
+
+
+def _discard(entries: List[_Entry]):
+    # Not under _lock: cancelling runs the done callback, which takes it.
+    for entry in entries:
+        entry.future.cancel()
+    with _lock:
+        _stats["wasted"] += len(entries)
+
+
+def _expire(now: float) -> List[_Entry]:
+    # Caller holds _lock; _discard() the result after releasing it.
+    return [_entries.pop(k) for k in [k for k, e in _entries.items() if now - e.started_at > PREFETCH_TTL]]
+
+
+async def _prefetch(entry: _Entry, user_id: str, question: str, student_attempt: str, topic: str, mode: str) -> Dict[str, Any]:
+    entry.running = True
+    try:
+        with user_scope(user_id):
+            return await agenerate_rubric(question, student_attempt, topic, mode)
+    finally:
+        _settle(entry)
+
+
+def _cancelled_before_start(entry: _Entry):
+    # A task cancelled before its first step never reaches the finally above.
+    if not entry.running:
+        _settle(entry)
+
+
+def prefetch_rubric(user_id: str, question: str, student_attempt: str, topic: str, mode: str) -> bool:
+    """
+    Start generating the rubric for this question in the background.
+    Returns False if disabled, already prefetched, or over the concurrency cap.
+    """
+    if not PREFETCH_ENABLED:
+        return False
+
+    key = (user_id, _hash(question, topic, mode))
+    now = time.time()
+
+    with _lock:
+        expired = _expire(now)
+        if key in _entries:
+            started = False
+        elif not _slots.acquire(blocking=False):
+            _stats["rejected"] += 1
+            started = False
+        else:
+            entry = _Entry(attempt=_hash(student_attempt), started_at=now)
+            _live.add(entry)
+            entry.future = asyncio.run_coroutine_threadsafe(
+                _prefetch(entry, user_id, question, student_attempt, topic, mode), get_loop(),
+            )
+            _entries[key] = entry
+            _stats["started"] += 1
+            started = True
+    _discard(expired)
+    if started:
+        entry.future.add_done_callback(lambda _f: _cancelled_before_start(entry))
+    return started
+
+
+async def atake_rubric(
+    user_id: str,
+    question: str,
+    student_attempt: str,
+    topic: str,
+    mode: str,
+    timeout: Optional[float] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Claim the prefetched rubric for this question, waiting up to timeout
+    seconds if it's still running. If it was started for an earlier answer,
+    minimal_fix and each step's student_error are regenerated for this one.
+    None when there is nothing usable.
+    """
+    with _lock:
+        expired = _expire(time.time())
+        entry = _entries.pop((user_id, _hash(question, topic, mode)), None)
+    _discard(expired)
+    if entry is None:
+        return None
+
+    try:
+        rb = await asyncio.wait_for(asyncio.wrap_future(entry.future), timeout)
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        rb = None
+
+    if not isinstance(rb, dict) or rb.get("error"):
+        with _lock:
+            _stats["wasted"] += 1
+        return None
+    refresh = entry.attempt != _hash(student_attempt)
+    with _lock:
+        _stats["used"] += 1
+        if refresh:
+            _stats["refreshed"] += 1
+    if refresh:
+        rb = await arefresh_minimal_fix(rb, question, student_attempt, topic, mode)
+    return rb
+
+
+def take_rubric(
+    user_id: str,
+    question: str,
+    student_attempt: str,
+    topic: str,
+    mode: str,
+    timeout: Optional[float] = None,
+) -> Optional[Dict[str, Any]]:
+    return run_sync(atake_rubric, user_id, question, student_attempt, topic, mode, timeout=timeout)
+
+
+def cancel_prefetch(user_id: str, question: str, topic: str, mode: str):
+    """Drop any speculative rubric for this question (e.g. the student got it right)."""
+    with _lock:
+        entry = _entries.pop((user_id, _hash(question, topic, mode)), None)
+    if entry is not None:
+        _discard([entry])
+
+
+def prefetch_stats() -> Dict[str, int]:
+    with _lock:
+        out = dict(_stats)
+        out["in_flight"] = len(_live)
+        return out
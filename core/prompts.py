@@ -48,6 +48,61 @@ Return JSON:
 }}
 """.strip()
 
+def prompt_diagnose_steps(question: str, student_text: str, steps: list, memory_block: str, mode: str, topic: str) -> str:
+    # Text-only follow-up to prompt_diagnose: the handwriting was already
+    # transcribed into steps, so no image is sent.
+    numbered = "\n".join(f"{i}. {s}" for i, s in enumerate(steps))
+    return f"""
+You are an educational tutor. Only academic/learning content.
+
+Tutor style: {mode}
+Topic: {topic}
+
+Task:
+1) Evaluate the student's handwritten solution to the Question. It was transcribed into the numbered steps below.
+2) Use the steps exactly as given; do not re-number or rewrite them.
+3) Identify the first incorrect step index (0-based). If fully correct, wrong_step_index=-1.
+4) Provide a short fix sentence for the wrong step (or reinforcement if correct).
+5) If correct: is_correct=true and return ONE item with concept="No misconception".
+6) If incorrect: return 1-3 misconceptions with teaching + 3-step hint ladder.
+7) Return ONLY valid JSON (no markdown).
+
+Question:
+\"\"\"{question}\"\"\"
+
+Student's handwritten steps (transcribed):
+{numbered}
+
+Student answer (typed):
+\"\"\"{student_text}\"\"\"
+
+Student history:
+{memory_block}
+
+Return JSON:
+{{
+  "is_correct": true|false,
+  "confidence": 0.0,
+  "wrong_step_index": -1,
+  "fix": "",
+  "misconceptions": [
+    {{
+      "concept": "",
+      "why_wrong": "",
+      "hints": ["", "", ""],
+      "diagnostic_question": "",
+      "severity": "low|medium|high",
+      "teaching": {{
+        "explanation": "",
+        "analogy": "",
+        "follow_up_question": ""
+      }},
+      "final_answer": ""
+    }}
+  ]
+}}
+""".strip()
+
 def prompt_socratic(question: str, student_text: str, memory_block: str, hint_level: int, mode: str, topic: str) -> str:
     return f"""
 You are an educational tutor. Only academic/learning content.
@@ -129,6 +184,38 @@ Return ONLY JSON:
 }}
 """.strip()
 
+def prompt_minimal_fix(question: str, student_attempt: str, final_answer: str, steps: list, topic: str, mode: str) -> str:
+    step_list = "\n".join(f"{i + 1}. {s}" for i, s in enumerate(steps)) or "(none)"
+    return f"""
+IMPORTANT: You MUST return valid JSON. Do NOT include explanations outside JSON.
+
+You are an educational tutor. Only academic/learning content.
+
+Tutor style: {mode}
+Topic: {topic}
+
+Question:
+\"\"\"{question}\"\"\"
+
+Correct answer:
+\"\"\"{final_answer}\"\"\"
+
+Rubric steps:
+{step_list}
+
+Student attempt:
+\"\"\"{student_attempt}\"\"\"
+
+1) Give minimal_fix: the smallest changes needed to correct the student's attempt.
+2) Give student_errors: for each rubric step, in order, what this attempt got wrong there ("" if nothing).
+
+Return ONLY JSON:
+{{
+  "minimal_fix": "",
+  "student_errors": [""]
+}}
+""".strip()
+
 def prompt_generate_exam(topic: str, style: str, n: int) -> str:
     return f"""
 You are an exam setter. Only academic content.
@@ -0,0 +1,166 @@
+import os
+import json
+import time
+import random
+import logging
+import threading
+from dataclasses import dataclass, field, asdict
+from typing import Optional, Dict, Any, List
+
+from .gemini_client import MODEL_FAST, MODEL_DEEP
+from .latency import latency_percentile, error_rate
+from .model_calls import circuit_open
+
+# Picks the model for each call. Each call site needs a minimum quality,
+# raised by signs of a hard task: an image, a full answer requested, a
+# low-confidence previous turn, many attempts. Of the models that clear it,
+# the cheapest one whose recent p95 latency meets the site's SLO and whose
+# error rate is acceptable wins. A floor above the best model's quality means
+# "the best model", not "nothing qualifies". Live stats come from core/latency.py.
+# Every decision can be appended to a JSONL file for offline tuning.
+
+ROUTER_ENABLED = os.getenv("LEARNSENSE_ROUTER", "1") == "1"
+
+
+def _pairs(raw: str) -> Dict[str, float]:
+    out = {}
+    for part in raw.split(","):
+        k, _, v = part.partition("=")
+        if k.strip() and v.strip():
+            out[k.strip()] = float(v)
+    return out
+
+
+# Candidate models, cheapest first. Defaults to MODEL_FAST, MODEL_DEEP.
+_models = os.getenv("LEARNSENSE_ROUTER_MODELS", "")
+ROUTER_MODELS: List[str] = list(dict.fromkeys([m.strip() for m in _models.split(",") if m.strip()] or [MODEL_FAST, MODEL_DEEP]))
+
+# Quality score per model, 0..1. By default the fast model is 0.6 and the deep one 0.9.
+MODEL_QUALITY: Dict[str, float] = {MODEL_FAST: 0.6}
+MODEL_QUALITY[MODEL_DEEP] = 0.9
+MODEL_QUALITY.update(_pairs(os.getenv("LEARNSENSE_ROUTER_QUALITY", "")))
+
+# Base quality floor per site; these defaults reproduce the old fixed choices.
+SITE_FLOOR: Dict[str, float] = {"diagnose": 0.8, "rubric": 0.8, "socratic": 0.5, "exam": 0.5, "notes": 0.5}
+SITE_FLOOR.update(_pairs(os.getenv("LEARNSENSE_ROUTER_FLOORS", "")))
+
+# p95 latency SLO per site, ms.
+SITE_SLO_MS: Dict[str, float] = {"socratic": 4000, "diagnose": 12000, "rubric": 15000, "exam": 20000, "notes": 20000}
+SITE_SLO_MS.update(_pairs(os.getenv("LEARNSENSE_ROUTER_SLO_MS", "")))
+
+MAX_ERROR_RATE = float(os.getenv("LEARNSENSE_ROUTER_MAX_ERROR_RATE", "0.2"))
+# Stats with fewer samples than this are ignored (the model counts as healthy).
+MIN_SAMPLES = int(os.getenv("LEARNSENSE_ROUTER_MIN_SAMPLES", "10"))
+# Only calls from the last STATS_MAX_AGE_S count, so a model that was
+# avoided for a while gets tried again once its bad samples age out.
+STATS_MAX_AGE_S = float(os.getenv("LEARNSENSE_ROUTER_STATS_MAX_AGE_S", "120"))
+# Share of calls still sent to a cheaper model that was skipped for bad
+# stats, so recovery is noticed sooner.
+EXPLORE_RATE = float(os.getenv("LEARNSENSE_ROUTER_EXPLORE", "0.05"))
+# JSONL file of routing decisions; empty = don't write.
+ROUTER_LOG = os.getenv("LEARNSENSE_ROUTER_LOG", "")
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_decisions: Dict[str, Dict[str, int]] = {}   # site -> model -> count
+
+
+@dataclass
+class Route:
+    model: str
+    backup: Optional[str]          # next-best model, for hedging
+    reason: str
+    floor: float
+    signals: Dict[str, Any] = field(default_factory=dict)
+
+
+def _floor(site: str, has_image: bool, hint_level: Optional[int], prev_confidence: Optional[float], attempts: int) -> float:
+    floor = SITE_FLOOR.get(site, 0.5)
+    if has_image:
+        floor += 0.1
+    if hint_level is not None and hint_level >= 4:
+        floor += 0.3       # full worked answer
+    if prev_confidence is not None and prev_confidence < 0.5:
+        floor += 0.1
+    if attempts >= 3:
+        floor += 0.1
+    return min(1.0, floor)
+
+
+def _health(site: str, model: str) -> Dict[str, Any]:
+    p95 = latency_percentile(site, model, 95, MIN_SAMPLES, STATS_MAX_AGE_S)
+    err = error_rate(site, model, MIN_SAMPLES, STATS_MAX_AGE_S)
+    slo = SITE_SLO_MS.get(site)
+    tripped = circuit_open(model)
+    return {
+        "p95_ms": p95,
+        "error_rate": err,
+        "circuit_open": tripped,
+        "meets_slo": p95 is None or slo is None or p95 <= slo,
+        "healthy": (err is None or err <= MAX_ERROR_RATE) and not tripped,
+    }
+
+
+def route(
+    site: str,
+    has_image: bool = False,
+    hint_level: Optional[int] = None,
+    prev_confidence: Optional[float] = None,
+    attempts: int = 0,
+) -> Route:
+    """Choose the model for one call at site ("diagnose", "socratic", "rubric", "exam", "notes")."""
+    signals = {"has_image": has_image, "hint_level": hint_level, "prev_confidence": prev_confidence, "attempts": attempts}
+    models = ROUTER_MODELS
+    wanted = _floor(site, has_image, hint_level, prev_confidence, attempts)
+    floor = min(wanted, max(MODEL_QUALITY.get(m, 0.5) for m in models))
+    if floor < wanted:
+        signals["floor_wanted"] = wanted
+    health = {m: _health(site, m) for m in models}
+    good_enough = [m for m in models if MODEL_QUALITY.get(m, 0.5) >= floor]
+    ok = [m for m in good_enough if health[m]["meets_slo"] and health[m]["healthy"]]
+    # Exploring retries a model with bad stats, never one whose breaker is open.
+    explorable = [m for m in good_enough if not health[m]["circuit_open"]]
+    if len(models) == 1:
+        model, reason = models[0], "only_model"
+    elif not ROUTER_ENABLED:
+        # Quality floor only, no live stats.
+        model, reason = (good_enough or models[-1:])[0], "static"
+    elif ok and explorable[0] != ok[0] and random.random() < EXPLORE_RATE:
+        model, reason = explorable[0], "explore"
+    elif ok:
+        model, reason = ok[0], "cheapest_meeting_floor_and_slo"
+    else:
+        healthy = [m for m in models if health[m]["healthy"] and health[m]["meets_slo"]]
+        if healthy:
+            # Quality floor can't be met within the SLO: best healthy model.
+            model, reason = max(healthy, key=lambda m: MODEL_QUALITY.get(m, 0.5)), "floor_relaxed_for_slo"
+        else:
+            model, reason = min(good_enough, key=lambda m: (
+                health[m]["circuit_open"], health[m]["error_rate"] or 0.0, health[m]["p95_ms"] or 0.0,
+            )), "all_degraded"
+
+    others = [m for m in models if m != model]
+    backup = max(others, key=lambda m: MODEL_QUALITY.get(m, 0.5)) if others else None
+    decision = Route(model, backup, reason, floor, signals)
+    _log(site, decision, health)
+    return decision
+
+
+def _log(site: str, decision: Route, health: Dict[str, Dict[str, Any]]):
+    with _lock:
+        by_model = _decisions.setdefault(site, {})
+        by_model[decision.model] = by_model.get(decision.model, 0) + 1
+        if ROUTER_LOG:
+            record = {"ts": time.time(), "site": site, **asdict(decision), "candidates": health}
+            try:
+                with open(ROUTER_LOG, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record) + "\n")
+            except OSError:
+                logger.debug("router log write failed", exc_info=True)
+    logger.debug("route %s -> %s (%s, floor %.2f)", site, decision.model, decision.reason, decision.floor)
+
+
+def router_stats() -> Dict[str, Dict[str, int]]:
+    with _lock:
+        return {site: dict(models) for site, models in _decisions.items()}
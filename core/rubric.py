@@ -1,48 +1,117 @@
+from typing import Optional
 from google.genai.errors import ClientError
 
-from .gemini_client import get_client, MODEL_DEEP
-from .utils import safe_json_load
-from .prompts import prompt_rubric
+from .model_calls import ModelUnavailable
+from .gemini_client import get_client
+from .router import route
+from .utils import safe_json_load, safe_json_scan
+from .prompts import prompt_rubric, prompt_minimal_fix
+from .llm_cache import cache_key, cache_get, cache_put
+from .streaming import agenerate_text, OnPartial
+from .hedging import ahedged_text
+from .aio import run_sync, in_thread
+from .single_flight import asingle_flight, flight_key
 
-def generate_rubric(question: str, student_attempt: str, topic: str, mode: str) -> dict:
+async def agenerate_rubric(
+    question: str,
+    student_attempt: str,
+    topic: str,
+    mode: str,
+    on_partial: Optional[OnPartial] = None,
+) -> dict:
     client = get_client()
     if client is None:
         return {"error": True, "error_message": "Model unavailable."}
 
     prompt = prompt_rubric(question, student_attempt, topic, mode)
+    key = cache_key("rubric", prompt)
 
+    async def _generate(on_partial: Optional[OnPartial]) -> dict:
+        cached = await in_thread(cache_get, "rubric", key)
+        if cached is not None:
+            return cached
+        try:
+            r = route("rubric", hint_level=4)
+            raw_text = await ahedged_text(
+                client, "rubric", r.model, prompt, on_partial, ("solution_steps[]", "minimal_fix", "final_answer"), backup_model=r.backup,
+            )
+            scan = safe_json_scan(raw_text)
+            parsed = scan.value
+
+            # ---------- HARD FALLBACK FOR GIVE-UP ----------
+            if not parsed:
+                # Last-resort fallback: wrap raw text into a valid rubric response
+                return {
+                    "solution_steps": [
+                        s.strip() for s in raw_text.split("\n") if s.strip()
+                    ][:6],  # keep it short
+                    "rubric": [
+                        {
+                            "step": "Overall understanding",
+                            "marks": 10,
+                            "expected": "Correct explanation of the concept",
+                            "common_errors": "Confusing definitions or order of operations",
+                            "student_error": "Gave up before articulating the concept",
+                        }
+                    ],
+                    "minimal_fix": "Focus on the core definition first, then contrast it with the alternative.",
+                    "final_answer": raw_text.strip() or "Here is the correct explanation of the concept.",
+                }
+
+            parsed.setdefault("solution_steps", [])
+            parsed.setdefault("rubric", [])
+            parsed.setdefault("minimal_fix", "")
+            parsed.setdefault("final_answer", "")
+            if scan.complete:
+                await in_thread(cache_put, "rubric", key, parsed)
+            return parsed
+
+        except (ClientError, ModelUnavailable):
+            return {"error": True, "error_message": "Model busy, try again."}
+        except Exception:
+            return {"error": True, "error_message": "Rubric generation failed."}
+
+    return await asingle_flight("rubric", flight_key("rubric", prompt), _generate, on_partial)
+
+
+async def arefresh_minimal_fix(rubric: dict, question: str, student_attempt: str, topic: str, mode: str) -> dict:
+    """
+    Adapt a rubric generated for an earlier attempt to this one: solution
+    steps, marks and final answer still hold; minimal_fix and each step's
+    student_error are redone for this attempt (left blank if that fails).
+    """
+    out = dict(rubric)
+    out["minimal_fix"] = ""
+    items = [dict(it, student_error="") if isinstance(it, dict) else it for it in rubric.get("rubric") or []]
+    out["rubric"] = items
+    client = get_client()
+    if client is None:
+        return out
+    steps = [it.get("step", "") if isinstance(it, dict) else str(it) for it in items]
+    prompt = prompt_minimal_fix(question, student_attempt, rubric.get("final_answer", ""), steps, topic, mode)
     try:
-        resp = client.models.generate_content(model=MODEL_DEEP, contents=prompt)
-        raw_text = getattr(resp, "text", "") or ""
-        parsed = safe_json_load(raw_text)
-
-        # ---------- HARD FALLBACK FOR GIVE-UP ----------
-        if not parsed:
-            # Last-resort fallback: wrap raw text into a valid rubric response
-            return {
-                "solution_steps": [
-                    s.strip() for s in raw_text.split("\n") if s.strip()
-                ][:6],  # keep it short
-                "rubric": [
-                    {
-                        "step": "Overall understanding",
-                        "marks": 10,
-                        "expected": "Correct explanation of the concept",
-                        "common_errors": "Confusing definitions or order of operations",
-                        "student_error": "Gave up before articulating the concept",
-                    }
-                ],
-                "minimal_fix": "Focus on the core definition first, then contrast it with the alternative.",
-                "final_answer": raw_text.strip() or "Here is the correct explanation of the concept.",
-            }
-
-        parsed.setdefault("solution_steps", [])
-        parsed.setdefault("rubric", [])
-        parsed.setdefault("minimal_fix", "")
-        parsed.setdefault("final_answer", "")
-        return parsed
-
-    except ClientError:
-        return {"error": True, "error_message": "Model busy, try again."}
+        parsed = safe_json_load(await agenerate_text(client, route("rubric").model, prompt, site="rubric"))
+    except (ClientError, ModelUnavailable):
+        return out
     except Exception:
-        return {"error": True, "error_message": "Rubric generation failed."}
+        return out
+    if not parsed:
+        return out
+    if isinstance(parsed.get("minimal_fix"), str):
+        out["minimal_fix"] = parsed["minimal_fix"]
+    errors = parsed.get("student_errors")
+    if isinstance(errors, list) and len(errors) == len(items):
+        for it, err in zip(items, errors):
+            if isinstance(it, dict) and isinstance(err, str):
+                it["student_error"] = err
+    return out
+
+
+def generate_rubric(
+    question: str,
+    student_attempt: str,
+    topic: str,
+    mode: str,
+    on_partial: Optional[OnPartial] = None,
+) -> dict:
+    return run_sync(agenerate_rubric, question, student_attempt, topic, mode, on_partial=on_partial)
@@ -0,0 +1,279 @@
+import os
+import time
+import asyncio
+import threading
+import contextvars
+from collections import deque, OrderedDict
+from contextlib import contextmanager, asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, Deque, Iterator, AsyncIterator
+
+# Fair scheduling in front of the model API. Every model call (call_model /
+# acall_model) takes one of SCHED_CONCURRENCY slots before it goes out.
+# When they're all busy, calls queue per call class ("socratic", "diagnose",
+# "rubric", "exam", "notes") and, inside a class, per user:
+#   - classes share the slots by weight (stride scheduling), so interactive
+#     Socratic turns go first and bulk exam/notes generation last, but bulk
+#     work still moves while the tutor is busy;
+#   - users inside a class take turns, so one student resubmitting or one
+#     teacher building a question bank can't starve the others;
+#   - over-deep queues (total, per class, per user) reject at once instead
+#     of piling up, as does waiting longer than SCHED_MAX_WAIT_S.
+# The user comes from user_scope(), set where a turn, sheet or prefetch
+# starts. Limits are per process.
+
+SCHED_CONCURRENCY = int(os.getenv("LEARNSENSE_SCHED_CONCURRENCY", "16"))   # 0 = no limit
+SCHED_MAX_QUEUE = int(os.getenv("LEARNSENSE_SCHED_MAX_QUEUE", "200"))
+SCHED_MAX_USER_QUEUE = int(os.getenv("LEARNSENSE_SCHED_MAX_USER_QUEUE", "8"))
+SCHED_MAX_WAIT_S = float(os.getenv("LEARNSENSE_SCHED_MAX_WAIT_S", "30"))
+
+
+def _pairs(raw: str) -> Dict[str, float]:
+    out = {}
+    for part in raw.split(","):
+        k, _, v = part.partition("=")
+        if k.strip() and v.strip():
+            out[k.strip()] = float(v)
+    return out
+
+
+# Share of the slots per call class when all are busy; anything else is "other".
+CLASS_WEIGHTS: Dict[str, float] = {"socratic": 8, "diagnose": 4, "rubric": 2, "other": 2, "exam": 1, "notes": 1}
+CLASS_WEIGHTS.update(_pairs(os.getenv("LEARNSENSE_SCHED_WEIGHTS", "")))
+# Queue depth per class; defaults to SCHED_MAX_QUEUE. Bulk classes get less
+# so a question-bank run can't fill the whole queue.
+CLASS_MAX_QUEUE: Dict[str, float] = {"exam": 40, "notes": 40}
+CLASS_MAX_QUEUE.update(_pairs(os.getenv("LEARNSENSE_SCHED_CLASS_QUEUE", "")))
+
+_WAIT_WINDOW = 500
+
+_user: contextvars.ContextVar[str] = contextvars.ContextVar("learnsense_user", default="")
+
+
+class Overloaded(Exception):
+    """Rejected by the scheduler: a queue is full or the wait got too long."""
+
+
+@contextmanager
+def user_scope(user_id: Optional[str]) -> Iterator[None]:
+    """
+    Attribute model calls made inside (including tasks and to_thread work
+    started there) to user_id. An empty user_id keeps the current one.
+    """
+    token = _user.set(user_id or _user.get())
+    try:
+        yield
+    finally:
+        _user.reset(token)
+
+
+def call_class(site: Optional[str]) -> str:
+    return site if site in CLASS_WEIGHTS else "other"
+
+
+@dataclass
+class _Waiter:
+    cls: str
+    user: str
+    enqueued_at: float = field(default_factory=time.monotonic)
+    granted: bool = False
+    event: Optional[threading.Event] = None
+    loop: Optional[asyncio.AbstractEventLoop] = None
+    future: Optional[asyncio.Future] = None
+
+    def wake(self):
+        # Caller holds _lock.
+        if self.event is not None:
+            self.event.set()
+        elif self.loop is not None and self.future is not None:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(fut: asyncio.Future):
+    if not fut.done():
+        fut.set_result(None)
+
+
+@dataclass
+class _Class:
+    weight: float
+    pass_: float = 0.0
+    users: "OrderedDict[str, Deque[_Waiter]]" = field(default_factory=OrderedDict)
+    queued: int = 0
+    in_flight: int = 0
+    waits_ms: Deque[float] = field(default_factory=lambda: deque(maxlen=_WAIT_WINDOW))
+    counters: Dict[str, int] = field(default_factory=lambda: {
+        "admitted": 0, "queued": 0, "rejected_queue": 0, "rejected_user": 0, "rejected_wait": 0, "abandoned": 0,
+    })
+
+
+_lock = threading.Lock()
+_classes: Dict[str, _Class] = {}
+_user_queued: Dict[str, int] = {}
+_in_flight = 0
+_queued = 0
+_vtime = 0.0
+
+
+def _class(name: str) -> _Class:
+    # Caller holds _lock.
+    c = _classes.get(name)
+    if c is None:
+        c = _classes[name] = _Class(weight=max(0.01, CLASS_WEIGHTS.get(name, 1.0)))
+    return c
+
+
+def _grant(w: _Waiter):
+    # Caller holds _lock.
+    global _in_flight
+    w.granted = True
+    _in_flight += 1
+    c = _class(w.cls)
+    c.in_flight += 1
+    c.counters["admitted"] += 1
+    c.waits_ms.append((time.monotonic() - w.enqueued_at) * 1000)
+
+
+def _dispatch():
+    # Caller holds _lock. Hand free slots to the class with the lowest pass
+    # value and, within it, to the next user in turn.
+    global _queued, _vtime
+    while _queued and (SCHED_CONCURRENCY <= 0 or _in_flight < SCHED_CONCURRENCY):
+        c = min((c for c in _classes.values() if c.queued), key=lambda c: (c.pass_, -c.weight))
+        user, q = next(iter(c.users.items()))
+        w = q.popleft()
+        if q:
+            c.users.move_to_end(user)
+        else:
+            del c.users[user]
+        c.queued -= 1
+        _queued -= 1
+        _user_queued[w.user] -= 1
+        if not _user_queued[w.user]:
+            del _user_queued[w.user]
+        _vtime = c.pass_
+        c.pass_ += 1.0 / c.weight
+        _grant(w)
+        w.wake()
+
+
+def _enqueue(cls: str, user: str, waiter_kw: Dict[str, Any]) -> Optional[_Waiter]:
+    """Take a slot (returns None) or join the queue (returns the waiter). Raises Overloaded."""
+    global _queued
+    with _lock:
+        c = _class(cls)
+        w = _Waiter(cls, user, **waiter_kw)
+        if not _queued and (SCHED_CONCURRENCY <= 0 or _in_flight < SCHED_CONCURRENCY):
+            _grant(w)
+            return None
+        if _queued >= SCHED_MAX_QUEUE or c.queued >= CLASS_MAX_QUEUE.get(cls, SCHED_MAX_QUEUE):
+            c.counters["rejected_queue"] += 1
+            raise Overloaded(f"{cls}: queue full")
+        if user and _user_queued.get(user, 0) >= SCHED_MAX_USER_QUEUE:
+            c.counters["rejected_user"] += 1
+            raise Overloaded(f"{cls}: too many queued requests for this user")
+        if not c.queued:
+            # An idle class doesn't bank credit while it had nothing to send.
+            c.pass_ = max(c.pass_, _vtime)
+        c.users.setdefault(user, deque()).append(w)
+        c.queued += 1
+        c.counters["queued"] += 1
+        _queued += 1
+        _user_queued[user] = _user_queued.get(user, 0) + 1
+        return w
+
+
+def _withdraw(w: _Waiter, reason: str) -> bool:
+    """Drop a waiter that gave up. Returns True if it had been granted a slot meanwhile."""
+    global _queued
+    with _lock:
+        if w.granted:
+            return True
+        c = _class(w.cls)
+        q = c.users.get(w.user)
+        if q is not None and w in q:
+            q.remove(w)
+            if not q:
+                del c.users[w.user]
+            c.queued -= 1
+            _queued -= 1
+            _user_queued[w.user] -= 1
+            if not _user_queued[w.user]:
+                del _user_queued[w.user]
+        c.counters[reason] += 1
+        return False
+
+
+def _release(cls: str):
+    global _in_flight
+    with _lock:
+        _in_flight -= 1
+        _class(cls).in_flight -= 1
+        _dispatch()
+
+
+@contextmanager
+def slot(site: Optional[str]) -> Iterator[None]:
+    """Hold one model-call slot for the current user; blocks while queued."""
+    cls = call_class(site)
+    w = _enqueue(cls, _user.get(), {"event": threading.Event()})
+    if w is not None and not w.event.wait(SCHED_MAX_WAIT_S):
+        if not _withdraw(w, "rejected_wait"):
+            raise Overloaded(f"{cls}: queued longer than {SCHED_MAX_WAIT_S:.0f}s")
+    try:
+        yield
+    finally:
+        _release(cls)
+
+
+@asynccontextmanager
+async def aslot(site: Optional[str]) -> AsyncIterator[None]:
+    """Async slot(); a caller cancelled while queued just leaves the queue."""
+    cls = call_class(site)
+    loop = asyncio.get_running_loop()
+    fut = loop.create_future()
+    w = _enqueue(cls, _user.get(), {"loop": loop, "future": fut})
+    if w is not None:
+        try:
+            await asyncio.wait_for(fut, SCHED_MAX_WAIT_S)
+        except asyncio.TimeoutError:
+            if not _withdraw(w, "rejected_wait"):
+                raise Overloaded(f"{cls}: queued longer than {SCHED_MAX_WAIT_S:.0f}s") from None
+        except asyncio.CancelledError:
+            if _withdraw(w, "abandoned"):
+                _release(cls)
+            raise
+    try:
+        yield
+    finally:
+        _release(cls)
+
+
+def _percentile(sorted_ms, pct: float) -> Optional[float]:
+    if not sorted_ms:
+        return None
+    return round(sorted_ms[min(len(sorted_ms) - 1, int(round(pct / 100.0 * (len(sorted_ms) - 1))))], 1)
+
+
+def scheduler_stats() -> Dict[str, Any]:
+    with _lock:
+        classes = {}
+        for name, c in _classes.items():
+            waits = sorted(c.waits_ms)
+            classes[name] = {
+                **c.counters,
+                "weight": c.weight,
+                "waiting": c.queued,
+                "in_flight": c.in_flight,
+                "users_waiting": len(c.users),
+                "wait_p50_ms": _percentile(waits, 50),
+                "wait_p95_ms": _percentile(waits, 95),
+                "wait_max_ms": round(waits[-1], 1) if waits else None,
+            }
+        return {
+            "limit": SCHED_CONCURRENCY,
+            "in_flight": _in_flight,
+            "waiting": _queued,
+            "users_waiting": len(_user_queued),
+            "classes": classes,
+        }
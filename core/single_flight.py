@@ -0,0 +1,185 @@
+import copy
+import queue
+import asyncio
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, List, Tuple, Callable, Awaitable, TypeVar
+
+from .llm_cache import cache_key
+from .streaming import OnPartial
+
+# Single-flight for identical concurrent model calls: double clicks, reruns,
+# or a whole class pressing "Generate" on the same notes. The first caller
+# for a (site, normalized prompt) runs the call; everyone who asks
+# while it is in flight waits for the same parsed result, and gets the
+# partial fields it streams (including those streamed before they joined).
+# Partials reach each waiter on its own thread (or event loop), never on the
+# leader's, so a Streamlit session only ever touches its own widgets; each
+# caller gets its own copy of the result. Results aren't kept after the call
+# finishes (that's llm_cache's job).
+
+T = TypeVar("T")
+
+_DONE = object()
+
+
+class _Abandoned(Exception):
+    """The leading caller was cancelled; a waiting caller takes over."""
+
+
+@dataclass
+class _Flight:
+    future: Future = field(default_factory=Future)
+    partials: List[Tuple[str, Any]] = field(default_factory=list)
+    # Thread-safe hand-offs to the waiters: each queues the partial for its owner.
+    listeners: List[OnPartial] = field(default_factory=list)
+
+    def emitter(self, on_partial: OnPartial) -> OnPartial:
+        """The on_partial the leader passes to the call: its own callback plus the waiters'."""
+        def emit(name: str, value: Any):
+            with _lock:
+                self.partials.append((name, value))
+                listeners = list(self.listeners)
+            for fn in listeners:
+                fn(name, value)
+            on_partial(name, value)
+        return emit
+
+
+_lock = threading.Lock()
+_flights: Dict[Tuple[str, str], _Flight] = {}
+_stats: Dict[str, Dict[str, int]] = {}
+
+
+def flight_key(site: str, prompt: str) -> str:
+    # Whitespace differences (trailing newline, re-indented notes) don't
+    # change the request.
+    return cache_key(site, " ".join(prompt.split()))
+
+
+def _deliver(on_partial: OnPartial, name: str, value: Any):
+    try:
+        on_partial(name, value)
+    except Exception:
+        pass
+
+
+def _join(site: str, key: str, listener: Optional[OnPartial], rejoin: bool) -> Tuple[_Flight, bool, List[Tuple[str, Any]]]:
+    """Lead a new flight or wait on the running one; a waiter gets the partials streamed so far."""
+    with _lock:
+        counts = _stats.setdefault(site, {"calls": 0, "coalesced": 0, "handovers": 0})
+        flight = _flights.get((site, key))
+        if flight is None:
+            flight = _flights[(site, key)] = _Flight()
+            counts["calls"] += 1
+            # A waiter taking over from a cancelled leader was already counted.
+            if rejoin:
+                counts["coalesced"] -= 1
+                counts["handovers"] += 1
+            return flight, True, []
+        if not rejoin:
+            counts["coalesced"] += 1
+        if listener is not None:
+            flight.listeners.append(listener)
+        return flight, False, list(flight.partials)
+
+
+def _land(site: str, key: str, flight: _Flight):
+    with _lock:
+        if _flights.get((site, key)) is flight:
+            del _flights[(site, key)]
+
+
+def _detach(flight: _Flight, listener: Optional[OnPartial]):
+    with _lock:
+        if listener is not None and listener in flight.listeners:
+            flight.listeners.remove(listener)
+
+
+def single_flight(site: str, key: str, fn: Callable[[Optional[OnPartial]], T], on_partial: Optional[OnPartial] = None) -> T:
+    """
+    Run fn(on_partial) once for all concurrent callers with the same site
+    and key; everyone gets a copy of its return value (or its exception).
+    """
+    rejoin = False
+    while True:
+        events: "queue.SimpleQueue[Any]" = queue.SimpleQueue()
+        listener = (lambda name, value: events.put((name, value))) if on_partial is not None else None
+        flight, leader, replay = _join(site, key, listener, rejoin)
+        if not leader:
+            try:
+                return copy.deepcopy(_wait(flight, events, replay, on_partial))
+            except _Abandoned:
+                rejoin = True
+                continue
+        try:
+            result = fn(flight.emitter(on_partial) if on_partial is not None else None)
+        except BaseException as exc:
+            _land(site, key, flight)
+            flight.future.set_exception(exc if isinstance(exc, Exception) else _Abandoned())
+            raise
+        _land(site, key, flight)
+        flight.future.set_result(result)
+        return copy.deepcopy(result)
+
+
+def _wait(flight: _Flight, events: "queue.SimpleQueue[Any]", replay: List[Tuple[str, Any]], on_partial: Optional[OnPartial]) -> Any:
+    # Like aio.run_sync: partials are handed over through a queue and run
+    # here, on the waiting caller's thread.
+    if on_partial is None:
+        return flight.future.result()
+    for name, value in replay:
+        _deliver(on_partial, name, value)
+    flight.future.add_done_callback(lambda _f: events.put(_DONE))
+    while True:
+        item = events.get()
+        if item is _DONE:
+            break
+        _deliver(on_partial, *item)
+    return flight.future.result()
+
+
+async def asingle_flight(
+    site: str, key: str, afn: Callable[[Optional[OnPartial]], Awaitable[T]], on_partial: Optional[OnPartial] = None,
+) -> T:
+    """Async single_flight(). A cancelled waiter just stops waiting; a cancelled leader hands over."""
+    loop = asyncio.get_running_loop()
+    listener = (lambda name, value: loop.call_soon_threadsafe(_deliver, on_partial, name, value)) if on_partial is not None else None
+    rejoin = False
+    while True:
+        flight, leader, replay = _join(site, key, listener, rejoin)
+        if not leader:
+            for name, value in replay:
+                _deliver(on_partial, name, value)
+            try:
+                # shield: cancelling this waiter must not cancel the shared future.
+                return copy.deepcopy(await asyncio.shield(asyncio.wrap_future(flight.future)))
+            except _Abandoned:
+                rejoin = True
+                continue
+            except asyncio.CancelledError:
+                _detach(flight, listener)
+                raise
+        try:
+            result = await afn(flight.emitter(on_partial) if on_partial is not None else None)
+        except asyncio.CancelledError:
+            _land(site, key, flight)
+            flight.future.set_exception(_Abandoned())
+            raise
+        except Exception as exc:
+            _land(site, key, flight)
+            flight.future.set_exception(exc)
+            raise
+        _land(site, key, flight)
+        flight.future.set_result(result)
+        return copy.deepcopy(result)
+
+
+def flight_stats() -> Dict[str, Dict[str, int]]:
+    with _lock:
+        out = {site: dict(c) for site, c in _stats.items()}
+        for (site, _), _flight in _flights.items():
+            out.setdefault(site, {"calls": 0, "coalesced": 0, "handovers": 0})
+            out[site]["in_flight"] = out[site].get("in_flight", 0) + 1
+    return out
@@ -1,27 +1,38 @@
+from typing import Optional
 from google.genai.errors import ClientError
 
-from .gemini_client import get_client, MODEL_FAST, MODEL_DEEP
+from .model_calls import ModelUnavailable
+from .gemini_client import get_client
+from .router import route
 from .utils import safe_json_load, clamp
 from .prompts import prompt_socratic
+from .streaming import OnPartial
+from .hedging import ahedged_text
+from .aio import run_sync
 
-def socratic_turn(
+async def asocratic_turn(
     question: str,
     student_text: str,
     memory_block: str,
     hint_level: int,
     mode: str,
     topic: str,
+    on_partial: Optional[OnPartial] = None,
+    prev_confidence: Optional[float] = None,
+    attempts: int = 0,
 ) -> dict:
     client = get_client()
     if client is None:
         return {"error": True, "error_message": "Model unavailable."}
 
     prompt = prompt_socratic(question, student_text, memory_block, hint_level, mode, topic)
-    model = MODEL_FAST if hint_level < 4 else MODEL_DEEP
+    r = route("socratic", hint_level=hint_level, prev_confidence=prev_confidence, attempts=attempts)
 
     try:
-        resp = client.models.generate_content(model=model, contents=prompt)
-        parsed = safe_json_load(getattr(resp, "text", "") or "")
+        raw_text = await ahedged_text(
+            client, "socratic", r.model, prompt, on_partial, ("hints[]", "next_question", "final_answer"), backup_model=r.backup,
+        )
+        parsed = safe_json_load(raw_text)
         if not parsed:
             return {"error": True, "error_message": "Invalid model JSON."}
 
@@ -30,7 +41,24 @@ def socratic_turn(
         parsed.setdefault("misconceptions", [])
         return parsed
 
-    except ClientError:
+    except (ClientError, ModelUnavailable):
         return {"error": True, "error_message": "Model busy, try again."}
     except Exception:
         return {"error": True, "error_message": "Socratic step failed."}
+
+
+def socratic_turn(
+    question: str,
+    student_text: str,
+    memory_block: str,
+    hint_level: int,
+    mode: str,
+    topic: str,
+    on_partial: Optional[OnPartial] = None,
+    prev_confidence: Optional[float] = None,
+    attempts: int = 0,
+) -> dict:
+    return run_sync(
+        asocratic_turn, question, student_text, memory_block, hint_level, mode, topic,
+        on_partial=on_partial, prev_confidence=prev_confidence, attempts=attempts,
+    )
@@ -0,0 +1,185 @@
+import re
+import asyncio
+import inspect
+import json
+from typing import Optional, Callable, Sequence, List, Tuple, Any, Dict
+
+from .model_calls import call_model, acall_model
+from .aio import get_loop, on_loop
+
+# Streaming support: watch a JSON document as it arrives and report fields as
+# soon as their values are complete, so the UI can show them before the full
+# response lands.
+#
+# Field specs:
+#   "fix"       -> ("fix", value) once the value is complete
+#   "hints[]"   -> ("hints[0]", v), ("hints[1]", v), ... one per finished item
+# Only the first occurrence of a key is watched (e.g. the first misconception's hints).
+
+OnPartial = Callable[[str, Any], None]
+
+_decoder = json.JSONDecoder()
+_WS = re.compile(r"\s*")
+
+
+class FieldWatcher:
+    def __init__(self, fields: Sequence[str]):
+        self._buf = ""
+        self._done: Dict[str, bool] = {}
+        self._items: Dict[str, int] = {}
+        self._scalars = [f for f in fields if not f.endswith("[]")]
+        self._arrays = [f[:-2] for f in fields if f.endswith("[]")]
+
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        self._buf += text
+        out: List[Tuple[str, Any]] = []
+
+        for name in self._scalars:
+            if self._done.get(name):
+                continue
+            pos = self._value_start(name)
+            if pos is None:
+                continue
+            value = self._decode(pos)
+            if value is not _INCOMPLETE:
+                self._done[name] = True
+                out.append((name, value))
+
+        for name in self._arrays:
+            if self._done.get(name):
+                continue
+            pos = self._value_start(name)
+            if pos is None or pos >= len(self._buf):
+                continue
+            if self._buf[pos] != "[":
+                self._done[name] = True
+                continue
+            out.extend(self._array_items(name, pos + 1))
+
+        return out
+
+    def _value_start(self, name: str) -> Optional[int]:
+        m = re.search(r'"%s"\s*:\s*' % re.escape(name), self._buf)
+        return m.end() if m else None
+
+    def _decode(self, pos: int) -> Any:
+        try:
+            value, end = _decoder.raw_decode(self._buf, pos)
+        except ValueError:
+            return _INCOMPLETE
+        # A bare number/literal at the very end may still be growing ("1" -> "12").
+        if end >= len(self._buf) and not isinstance(value, (str, list, dict)):
+            return _INCOMPLETE
+        return value
+
+    def _array_items(self, name: str, pos: int) -> List[Tuple[str, Any]]:
+        out: List[Tuple[str, Any]] = []
+        index = 0
+        buf = self._buf
+        while True:
+            pos = _WS.match(buf, pos).end()
+            if pos >= len(buf):
+                break
+            if buf[pos] == "]":
+                self._done[name] = True
+                break
+            if buf[pos] == ",":
+                pos += 1
+                continue
+            try:
+                value, pos = _decoder.raw_decode(buf, pos)
+            except ValueError:
+                break
+            if index >= self._items.get(name, 0):
+                out.append((f"{name}[{index}]", value))
+            index += 1
+        self._items[name] = max(self._items.get(name, 0), index)
+        return out
+
+
+class _Incomplete:
+    pass
+
+
+_INCOMPLETE = _Incomplete()
+
+
+def generate_text(
+    client: Any,
+    model: str,
+    contents: Any,
+    on_partial: Optional[OnPartial] = None,
+    fields: Sequence[str] = (),
+    site: Optional[str] = None,
+) -> str:
+    """
+    Run one model call and return the full response text.
+    With on_partial, the SDK's streaming API is used and watched fields are
+    reported through on_partial(name, value) as soon as they are complete.
+    The call goes through model_calls (rate limit, retries, circuit breaker);
+    a retried stream starts over and may report the same fields again.
+    site names the call site for latency/error stats.
+    """
+    if on_partial is None:
+        def once() -> str:
+            resp = client.models.generate_content(model=model, contents=contents)
+            return getattr(resp, "text", "") or ""
+        return call_model(model, once, site)
+
+    def stream() -> str:
+        watcher = FieldWatcher(fields)
+        parts: List[str] = []
+        for chunk in client.models.generate_content_stream(model=model, contents=contents):
+            text = getattr(chunk, "text", "") or ""
+            if not text:
+                continue
+            parts.append(text)
+            for name, value in watcher.feed(text):
+                try:
+                    on_partial(name, value)
+                except Exception:
+                    # A broken UI callback must not lose the model response.
+                    pass
+        return "".join(parts)
+    return call_model(model, stream, site)
+
+
+async def agenerate_text(
+    client: Any,
+    model: str,
+    contents: Any,
+    on_partial: Optional[OnPartial] = None,
+    fields: Sequence[str] = (),
+    site: Optional[str] = None,
+) -> str:
+    """Async generate_text(), using the SDK's client.aio API."""
+    caller = asyncio.get_running_loop()
+    if caller is not get_loop():
+        # client.aio's connection pool is bound to the shared loop; a call
+        # from any other loop would fail. Hop over, and hand partials back.
+        relay = (lambda name, value: caller.call_soon_threadsafe(on_partial, name, value)) if on_partial else None
+        return await on_loop(agenerate_text(client, model, contents, relay, fields, site))
+    if on_partial is None:
+        async def once() -> str:
+            resp = await client.aio.models.generate_content(model=model, contents=contents)
+            return getattr(resp, "text", "") or ""
+        return await acall_model(model, once, site)
+
+    async def stream() -> str:
+        watcher = FieldWatcher(fields)
+        parts: List[str] = []
+        chunks = client.aio.models.generate_content_stream(model=model, contents=contents)
+        if inspect.isawaitable(chunks):
+            chunks = await chunks
+        async for chunk in chunks:
+            text = getattr(chunk, "text", "") or ""
+            if not text:
+                continue
+            parts.append(text)
+            for name, value in watcher.feed(text):
+                try:
+                    on_partial(name, value)
+                except Exception:
+                    pass
+        return "".join(parts)
+    return await acall_model(model, stream, site)
@@ -0,0 +1,126 @@
+import os
+import time
+import uuid
+import asyncio
+import threading
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, Awaitable, TypeVar
+
+# Every tutor turn gets an id and a deadline. The turn's asyncio task is kept
+# in a registry so cancel_turn() (the UI's Stop button, the API's cancel
+# endpoint) can abort the in-flight model call, and side effects are only
+# written if the turn is still live when the model work is done.
+
+TURN_BUDGET_S = float(os.getenv("LEARNSENSE_TURN_BUDGET_S", "45"))
+
+T = TypeVar("T")
+
+
+class TurnCancelled(Exception):
+    """The turn was cancelled through cancel_turn()."""
+
+
+class TurnExpired(Exception):
+    """The turn ran out of its latency budget."""
+
+
+@dataclass
+class Turn:
+    turn_id: str
+    deadline: Optional[float] = None       # time.monotonic() value; None = no budget
+    cancelled: bool = False
+    task: Optional[asyncio.Task] = None
+    loop: Optional[asyncio.AbstractEventLoop] = None
+    started_at: float = field(default_factory=time.monotonic)
+
+    def remaining(self) -> Optional[float]:
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def check(self):
+        """Raise unless the turn may still write side effects."""
+        if self.cancelled:
+            raise asyncio.CancelledError()
+        if self.expired():
+            raise TurnExpired(self.turn_id)
+
+    async def guard(self, aw: Awaitable[T]) -> T:
+        """Await aw within the remaining budget; TurnExpired when it runs out."""
+        remaining = self.remaining()
+        if remaining is None:
+            return await aw
+        try:
+            return await asyncio.wait_for(aw, remaining)
+        except asyncio.TimeoutError:
+            raise TurnExpired(self.turn_id) from None
+
+
+_lock = threading.Lock()
+_turns: Dict[str, Turn] = {}
+
+
+def begin_turn(turn_id: Optional[str] = None, budget_s: Optional[float] = None) -> Turn:
+    """Register a turn on the running loop; attach_task() gives it its task."""
+    budget = TURN_BUDGET_S if budget_s is None else budget_s
+    turn = Turn(
+        turn_id=turn_id or uuid.uuid4().hex,
+        deadline=time.monotonic() + budget if budget > 0 else None,
+        loop=asyncio.get_running_loop(),
+    )
+    with _lock:
+        # Stop may be pressed before the turn reaches the loop.
+        early = _turns.get(turn.turn_id)
+        if early is not None and early.loop is None:
+            turn.cancelled = early.cancelled
+        _turns[turn.turn_id] = turn
+    return turn
+
+
+def attach_task(turn: Turn, task: asyncio.Task):
+    with _lock:
+        turn.task = task
+        cancelled = turn.cancelled
+    if cancelled:
+        task.cancel()
+
+
+def end_turn(turn: Turn):
+    with _lock:
+        if _turns.get(turn.turn_id) is turn:
+            del _turns[turn.turn_id]
+
+
+def cancel_turn(turn_id: str) -> bool:
+    """
+    Cancel a running turn from any thread. Returns True if it was running.
+    A turn id cancelled before it starts is remembered and cancelled on start.
+    """
+    if not turn_id:
+        return False
+    with _lock:
+        turn = _turns.get(turn_id)
+        if turn is None:
+            _turns[turn_id] = Turn(turn_id=turn_id, cancelled=True)
+            _expire_placeholders()
+            return False
+        turn.cancelled = True
+        task, loop = turn.task, turn.loop
+    if task is not None and loop is not None:
+        loop.call_soon_threadsafe(task.cancel)
+    return loop is not None
+
+
+def _expire_placeholders():
+    # Caller holds _lock. Early cancels whose turn never showed up.
+    cutoff = time.monotonic() - max(TURN_BUDGET_S, 60.0)
+    for key in [k for k, t in _turns.items() if t.loop is None and t.started_at < cutoff]:
+        del _turns[key]
+
+
+def turn_stats() -> Dict[str, Any]:
+    with _lock:
+        return {"running": sum(1 for t in _turns.values() if t.loop is not None)}
@@ -1,20 +1,30 @@
+import asyncio
 from typing import Optional, List, Dict, Any
 from .schemas import TutorResponse, Misconception, Artifacts
 from .utils import is_academic_only, clamp
-from .diagnose import diagnose
-from .socratic import socratic_turn
-from .rubric import generate_rubric
+from .diagnose import adiagnose
+from .socratic import asocratic_turn
+from .rubric import agenerate_rubric
+from .hint_ladder import get_ladder, put_ladder, latest_ladder
+from .prefetch import prefetch_rubric, atake_rubric, cancel_prefetch
+from .streaming import OnPartial
+from .aio import run_sync, in_thread
+from .image_prep import ingest_image
+from .turns import Turn, TurnCancelled, TurnExpired, begin_turn, attach_task, end_turn
+from .scheduler import user_scope
 
 from db import (
     get_user_history,
     record_attempt,
+    get_attempts_used,
     update_user_concepts,
     get_concept_dashboard,
 )
 
 MAX_ATTEMPTS_BEFORE_RUBRIC = 4
 
-def _memory_block(user_id: str) -> str:
+def build_memory_block(user_id: str) -> str:
+    """The student's recent concept history, as the prompts' memory block."""
     hist = get_user_history(user_id) or []
     lines = []
     for h in hist[:6]:
@@ -24,7 +34,8 @@ def _memory_block(user_id: str) -> str:
             continue
     return "\n".join(lines) if lines else "No prior history."
 
-def _normalize_misconceptions(items: Any, is_correct: bool) -> List[Misconception]:
+def normalize_misconceptions(items: Any, is_correct: bool) -> List[Misconception]:
+    """At most three well-formed Misconceptions from a model's list (a default one for a correct answer)."""
     if not isinstance(items, list):
         items = []
     if is_correct and not items:
@@ -59,7 +70,101 @@ def _normalize_misconceptions(items: Any, is_correct: bool) -> List[Misconceptio
         ))
     return out
 
-def handle_turn(
+def _speculate_rubric(user_id: str, question: str, student_input: str, topic: str, mode: str, attempts_used: int, is_correct: bool):
+    # One more miss reveals the answer, so start the slow rubric call now.
+    if is_correct:
+        cancel_prefetch(user_id, question, topic, mode)
+    elif attempts_used >= MAX_ATTEMPTS_BEFORE_RUBRIC - 1:
+        prefetch_rubric(user_id, question, student_input, topic, mode)
+
+def _socratic_response(
+    user_id: str,
+    sc: Dict[str, Any],
+    misconceptions: List[Misconception],
+    attempts_used: int,
+    hint_level: int,
+    dashboard: Dict[str, Any],
+) -> Dict[str, Any]:
+    is_correct = bool(sc.get("is_correct", False))
+
+    msg = ""
+    if misconceptions:
+        idx = max(0, min(2, hint_level - 1))
+        hint = misconceptions[0].hints[idx] if misconceptions[0].hints else ""
+        if hint_level < 4 and hint:
+            msg += f"### Hint\n{hint}\n\n"
+
+    next_q = (sc.get("next_question") or (misconceptions[0].diagnostic_question if misconceptions else "")).strip()
+    if hint_level < 4:
+        msg += f"### Try this\n{next_q or 'Explain your reasoning briefly.'}"
+    else:
+        final = misconceptions[0].final_answer if misconceptions else ""
+        msg = final or "Here’s the correct solution idea."
+
+    tr = TutorResponse(
+        mode="SOCRATIC",
+        is_correct=is_correct,
+        confidence=clamp(sc.get("confidence", 0.5), 0.0, 1.0),
+        attempts_used=attempts_used,
+        hint_level=hint_level,
+        messages=[{"role": "assistant", "text": msg}],
+        misconceptions=misconceptions,
+        artifacts=Artifacts(concept_dashboard=dashboard)
+    )
+    return tr.to_dict()
+
+def _commit_turn(
+    user_id: str,
+    question: str,
+    student_input: str,
+    has_image: bool,
+    image_hash: Optional[str],
+    concepts: Optional[List[Dict[str, Any]]],
+    is_correct: bool,
+) -> int:
+    attempts_used = record_attempt(
+        user_id=user_id, question=question, student_input=student_input, has_image=has_image, image_hash=image_hash,
+    )
+    if concepts is not None:
+        update_user_concepts(user_id, concepts, is_correct=is_correct)
+    return attempts_used
+
+async def _commit(turn: Turn, user_id: str, question: str, student_input: str, has_image: bool, image_hash: Optional[str],
+                  concepts: Optional[List[Dict[str, Any]]] = None, is_correct: bool = False) -> int:
+    # Last point a cancel or an expired budget can stop the turn; once the
+    # writes start they finish together even if the turn is cancelled.
+    turn.check()
+    return await asyncio.shield(in_thread(_commit_turn, user_id, question, student_input, has_image, image_hash, concepts, is_correct))
+
+async def _out_of_time(user_id: str, question: str, hint_level: int) -> Dict[str, Any]:
+    # Budget ran out: answer from the hint ladder instead of hanging. Nothing
+    # was written, so the attempt isn't counted.
+    attempts_used, dashboard = await asyncio.gather(
+        in_thread(get_attempts_used, user_id, question),
+        in_thread(get_concept_dashboard, user_id),
+    )
+    sc = latest_ladder(user_id, question)
+    misconceptions = normalize_misconceptions(sc.get("misconceptions", []), is_correct=False) if sc else []
+    hints = misconceptions[0].hints if misconceptions else []
+    if hints:
+        hint = hints[max(0, min(len(hints) - 1, hint_level - 1))]
+        text = f"### Hint\n{hint}\n\n⏱ Full feedback is taking too long right now. Send your answer again in a moment."
+    else:
+        text = "⏱ The tutor is taking too long right now. Please try again in a moment."
+
+    tr = TutorResponse(
+        mode="SOCRATIC",
+        is_correct=False,
+        confidence=0.0,
+        attempts_used=attempts_used,
+        hint_level=hint_level,
+        messages=[{"role": "assistant", "text": text}],
+        misconceptions=misconceptions,
+        artifacts=Artifacts(concept_dashboard=dashboard)
+    )
+    return tr.to_dict()
+
+async def ahandle_turn(
     user_id: str,
     question: str,
     student_input: str,
@@ -69,6 +174,47 @@ def handle_turn(
     give_up: bool = False,
     image_bytes: Optional[bytes] = None,
     image_mime: Optional[str] = None,
+    on_partial: Optional[OnPartial] = None,
+    turn_id: Optional[str] = None,
+    budget_s: Optional[float] = None,
+    image_hash: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    One tutor turn. cancel_turn(turn_id) aborts it (TurnCancelled is raised and
+    nothing is written); past budget_s seconds it falls back to a cached hint.
+    """
+    turn = begin_turn(turn_id, budget_s)
+    # The task inherits the user, so its model calls queue as this student's.
+    with user_scope(user_id):
+        work = asyncio.ensure_future(_run_turn(
+            turn, user_id, question, student_input, mode, topic,
+            hint_level, give_up, image_bytes, image_mime, image_hash, on_partial,
+        ))
+    attach_task(turn, work)
+    try:
+        return await work
+    except TurnExpired:
+        return await _out_of_time(user_id, question, hint_level)
+    except asyncio.CancelledError:
+        if turn.cancelled:
+            raise TurnCancelled(turn.turn_id) from None
+        raise
+    finally:
+        end_turn(turn)
+
+async def _run_turn(
+    turn: Turn,
+    user_id: str,
+    question: str,
+    student_input: str,
+    mode: str,
+    topic: str,
+    hint_level: int,
+    give_up: bool,
+    image_bytes: Optional[bytes],
+    image_mime: Optional[str],
+    image_hash: Optional[str],
+    on_partial: Optional[OnPartial],
 ) -> Dict[str, Any]:
 
     # Guardrails
@@ -81,7 +227,7 @@ def handle_turn(
             hint_level=1,
             messages=[{"role": "assistant", "text": "I can help only with academic/learning questions."}],
             misconceptions=[],
-            artifacts=Artifacts(concept_dashboard=get_concept_dashboard(user_id))
+            artifacts=Artifacts(concept_dashboard=await in_thread(get_concept_dashboard, user_id))
         )
         return tr.to_dict()
 
@@ -94,23 +240,51 @@ def handle_turn(
             hint_level=1,
             messages=[{"role": "assistant", "text": "Please provide the question/problem statement in the left panel."}],
             misconceptions=[],
-            artifacts=Artifacts(concept_dashboard=get_concept_dashboard(user_id))
+            artifacts=Artifacts(concept_dashboard=await in_thread(get_concept_dashboard, user_id))
         )
         return tr.to_dict()
 
-    attempts_used = record_attempt(
-        user_id=user_id,
-        question=question,
-        student_input=student_input,
-        has_image=bool(image_bytes)
+    # Same answer, only a different hint level: serve the stored hint ladder
+    # instead of paying for another model call and another attempt.
+    if not give_up and not image_bytes and not image_hash and hint_level < 4:
+        sc = get_ladder(user_id, question, student_input)
+        if sc is not None:
+            is_correct = bool(sc.get("is_correct", False))
+            misconceptions = normalize_misconceptions(sc.get("misconceptions", []), is_correct=is_correct)
+            attempts_used, dashboard = await asyncio.gather(
+                in_thread(get_attempts_used, user_id, question),
+                in_thread(get_concept_dashboard, user_id),
+            )
+            return _socratic_response(user_id, sc, misconceptions, attempts_used, hint_level, dashboard)
+
+    # Only reads happen before the model call; the attempt and mastery updates
+    # are written by _commit() once the turn has its answer.
+    attempts_before, mem = await asyncio.gather(
+        in_thread(get_attempts_used, user_id, question),
+        in_thread(build_memory_block, user_id),
     )
+    attempts_used = attempts_before + 1
+    # Routing signal: how sure the model was about this question last time.
+    prev = latest_ladder(user_id, question)
+    prev_confidence = prev.get("confidence") if prev else None
 
-    mem = _memory_block(user_id)
+    # Uploads are shrunk and put in the blob store; from here on the turn
+    # carries only the hash.
+    if image_bytes and not image_hash:
+        try:
+            image_hash, image_mime = await in_thread(ingest_image, image_bytes, image_mime)
+            image_bytes = None
+        except OSError:
+            pass
+    has_image = bool(image_bytes or image_hash)
 
     # Give-up / auto-rubric
     if give_up or attempts_used >= MAX_ATTEMPTS_BEFORE_RUBRIC:
-        rb = generate_rubric(question, student_input, topic, mode)
+        rb = await turn.guard(atake_rubric(user_id, question, student_input, topic, mode, timeout=turn.remaining()))
+        if rb is None:
+            rb = await turn.guard(agenerate_rubric(question, student_input, topic, mode, on_partial=on_partial))
         if rb.get("error"):
+            attempts_used = await _commit(turn, user_id, question, student_input, has_image, image_hash)
             tr = TutorResponse(
                 mode="RUBRIC",
                 is_correct=False,
@@ -119,11 +293,11 @@ def handle_turn(
                 hint_level=4,
                 messages=[{"role": "assistant", "text": rb.get("error_message", "Unable to generate the answer right now.")}],
                 misconceptions=[],
-                artifacts=Artifacts(concept_dashboard=get_concept_dashboard(user_id))
+                artifacts=Artifacts(concept_dashboard=await in_thread(get_concept_dashboard, user_id))
             )
             return tr.to_dict()
 
-        update_user_concepts(user_id, [{"concept": "Answer Reveal"}], is_correct=False)
+        attempts_used = await _commit(turn, user_id, question, student_input, has_image, image_hash, [{"concept": "Answer Reveal"}], is_correct=False)
 
         tr = TutorResponse(
             mode="RUBRIC",
@@ -137,15 +311,20 @@ def handle_turn(
                 solution_steps=rb.get("solution_steps") or [],
                 rubric=rb.get("rubric") or [],
                 minimal_fix=rb.get("minimal_fix") or "",
-                concept_dashboard=get_concept_dashboard(user_id)
+                concept_dashboard=await in_thread(get_concept_dashboard, user_id)
             )
         )
         return tr.to_dict()
 
     # Image present => Mistake Microscope (DIAGNOSE)
-    if image_bytes:
-        dg = diagnose(question, student_input, mem, mode, topic, image_bytes=image_bytes, image_mime=image_mime)
+    if has_image:
+        dg = await turn.guard(adiagnose(
+            question, student_input, mem, mode, topic,
+            image_bytes=image_bytes, image_mime=image_mime, on_partial=on_partial, image_hash=image_hash,
+            prev_confidence=prev_confidence, attempts=attempts_before,
+        ))
         if dg.get("error"):
+            attempts_used = await _commit(turn, user_id, question, student_input, has_image, image_hash)
             tr = TutorResponse(
                 mode="DIAGNOSE",
                 is_correct=False,
@@ -154,14 +333,15 @@ def handle_turn(
                 hint_level=hint_level,
                 messages=[{"role": "assistant", "text": dg.get("error_message", "Unable to analyze right now.")}],
                 misconceptions=[],
-                artifacts=Artifacts(concept_dashboard=get_concept_dashboard(user_id))
+                artifacts=Artifacts(concept_dashboard=await in_thread(get_concept_dashboard, user_id))
             )
             return tr.to_dict()
 
         is_correct = bool(dg.get("is_correct", False))
-        misconceptions = _normalize_misconceptions(dg.get("misconceptions", []), is_correct=is_correct)
+        misconceptions = normalize_misconceptions(dg.get("misconceptions", []), is_correct=is_correct)
 
-        update_user_concepts(user_id, [m.to_dict() for m in misconceptions], is_correct=is_correct)
+        attempts_used = await _commit(turn, user_id, question, student_input, has_image, image_hash, [m.to_dict() for m in misconceptions], is_correct)
+        _speculate_rubric(user_id, question, student_input, topic, mode, attempts_used, is_correct)
 
         fix = (dg.get("fix") or "").strip()
         ask = misconceptions[0].diagnostic_question if misconceptions else "What definition are you using?"
@@ -179,14 +359,18 @@ def handle_turn(
                 steps=dg.get("steps") or [],
                 wrong_step_index=int(dg.get("wrong_step_index", -1)),
                 fix=fix,
-                concept_dashboard=get_concept_dashboard(user_id)
+                concept_dashboard=await in_thread(get_concept_dashboard, user_id)
             )
         )
         return tr.to_dict()
 
     # Text-only => SOCRATIC
-    sc = socratic_turn(question, student_input, mem, hint_level, mode, topic)
+    sc = await turn.guard(asocratic_turn(
+        question, student_input, mem, hint_level, mode, topic,
+        on_partial=on_partial, prev_confidence=prev_confidence, attempts=attempts_before,
+    ))
     if sc.get("error"):
+        attempts_used = await _commit(turn, user_id, question, student_input, has_image, image_hash)
         tr = TutorResponse(
             mode="SOCRATIC",
             is_correct=False,
@@ -195,36 +379,48 @@ def handle_turn(
             hint_level=hint_level,
             messages=[{"role": "assistant", "text": sc.get("error_message", "Unable to respond right now.")}],
             misconceptions=[],
-            artifacts=Artifacts(concept_dashboard=get_concept_dashboard(user_id))
+            artifacts=Artifacts(concept_dashboard=await in_thread(get_concept_dashboard, user_id))
         )
         return tr.to_dict()
 
-    is_correct = bool(sc.get("is_correct", False))
-    misconceptions = _normalize_misconceptions(sc.get("misconceptions", []), is_correct=is_correct)
-    update_user_concepts(user_id, [m.to_dict() for m in misconceptions], is_correct=is_correct)
+    put_ladder(user_id, question, student_input, sc)
 
-    msg = ""
-    if misconceptions:
-        idx = max(0, min(2, hint_level - 1))
-        hint = misconceptions[0].hints[idx] if misconceptions[0].hints else ""
-        if hint_level < 4 and hint:
-            msg += f"### Hint\n{hint}\n\n"
+    is_correct = bool(sc.get("is_correct", False))
+    misconceptions = normalize_misconceptions(sc.get("misconceptions", []), is_correct=is_correct)
+    attempts_used = await _commit(turn, user_id, question, student_input, has_image, image_hash, [m.to_dict() for m in misconceptions], is_correct)
+    _speculate_rubric(user_id, question, student_input, topic, mode, attempts_used, is_correct)
 
-    next_q = (sc.get("next_question") or (misconceptions[0].diagnostic_question if misconceptions else "")).strip()
-    if hint_level < 4:
-        msg += f"### Try this\n{next_q or 'Explain your reasoning briefly.'}"
-    else:
-        final = misconceptions[0].final_answer if misconceptions else ""
-        msg = final or "Here’s the correct solution idea."
+    dashboard = await in_thread(get_concept_dashboard, user_id)
+    return _socratic_response(user_id, sc, misconceptions, attempts_used, hint_level, dashboard)
 
-    tr = TutorResponse(
-        mode="SOCRATIC",
-        is_correct=is_correct,
-        confidence=clamp(sc.get("confidence", 0.5), 0.0, 1.0),
-        attempts_used=attempts_used,
+def handle_turn(
+    user_id: str,
+    question: str,
+    student_input: str,
+    mode: str,
+    topic: str,
+    hint_level: int = 1,
+    give_up: bool = False,
+    image_bytes: Optional[bytes] = None,
+    image_mime: Optional[str] = None,
+    on_partial: Optional[OnPartial] = None,
+    turn_id: Optional[str] = None,
+    budget_s: Optional[float] = None,
+    image_hash: Optional[str] = None,
+) -> Dict[str, Any]:
+    return run_sync(
+        ahandle_turn,
+        user_id=user_id,
+        question=question,
+        student_input=student_input,
+        mode=mode,
+        topic=topic,
         hint_level=hint_level,
-        messages=[{"role": "assistant", "text": msg}],
-        misconceptions=misconceptions,
-        artifacts=Artifacts(concept_dashboard=get_concept_dashboard(user_id))
+        give_up=give_up,
+        image_bytes=image_bytes,
+        image_mime=image_mime,
+        on_partial=on_partial,
+        turn_id=turn_id,
+        budget_s=budget_s,
+        image_hash=image_hash,
     )
-    return tr.to_dict()
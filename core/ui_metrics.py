@@ -0,0 +1,70 @@
+import os
+import logging
+import threading
+from typing import Dict, Any
+
+# Counters for what the Streamlit UI costs: full script runs, fragment-only
+# runs, time spent rendering and chat messages rendered. Totals are
+# process-wide; ui.py also keeps per-turn and per-session counter dicts and
+# passes them to every record_* call.
+
+UI_METRICS = os.getenv("LEARNSENSE_UI_METRICS", "0") == "1"
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_totals: Dict[str, float] = {
+    "script_runs": 0,
+    "fragment_runs": 0,
+    "render_ms": 0.0,
+    "messages_rendered": 0,
+    "turns": 0,
+    "turn_script_runs": 0,
+    "turn_fragment_runs": 0,
+    "turn_render_ms": 0.0,
+}
+
+
+def new_turn_counters() -> Dict[str, float]:
+    return {"script_runs": 0, "fragment_runs": 0, "render_ms": 0.0, "messages_rendered": 0}
+
+
+def _add(key: str, amount: float, counters):
+    for c in counters:
+        c[key] += amount
+    with _lock:
+        _totals[key] += amount
+
+
+def record_run(kind: str, *counters: Dict[str, float]):
+    """kind is "script" or "fragment"."""
+    _add("script_runs" if kind == "script" else "fragment_runs", 1, counters)
+
+
+def record_render(render_ms: float, messages: int, *counters: Dict[str, float]):
+    _add("render_ms", render_ms, counters)
+    if messages:
+        _add("messages_rendered", messages, counters)
+
+
+def finish_turn(counters: Dict[str, float]):
+    with _lock:
+        _totals["turns"] += 1
+        _totals["turn_script_runs"] += counters["script_runs"]
+        _totals["turn_fragment_runs"] += counters["fragment_runs"]
+        _totals["turn_render_ms"] += counters["render_ms"]
+    if UI_METRICS:
+        logger.info(
+            "turn: %d script runs, %d fragment runs, %.1f ms rendering",
+            counters["script_runs"], counters["fragment_runs"], counters["render_ms"],
+        )
+
+
+def ui_stats() -> Dict[str, Any]:
+    with _lock:
+        out = dict(_totals)
+    turns = out["turns"] or 1
+    out["script_runs_per_turn"] = out["turn_script_runs"] / turns
+    out["fragment_runs_per_turn"] = out["turn_fragment_runs"] / turns
+    out["render_ms_per_turn"] = out["turn_render_ms"] / turns
+    return out
@@ -1,29 +1,28 @@
-import json
 from typing import Optional, Any, Dict
 
+from .json_scan import scan_json, ScanResult
+
 def extract_json(text: str) -> Optional[str]:
+    """JSON text of the first object in text, repaired if needed, or None."""
     if not text:
         return None
-    t = text.strip()
-    if t.startswith("```"):
-        lines = t.split("\n")
-        if len(lines) > 2:
-            t = "\n".join(lines[1:-1])
-    t = t.replace("```json", "").replace("```", "").strip()
-    start = t.find("{")
-    end = t.rfind("}")
-    if start == -1 or end == -1:
-        return None
-    return t[start:end + 1]
+    return scan_json(text).text
 
-def safe_json_load(text: str) -> Optional[Dict[str, Any]]:
+def safe_json_scan(text: str) -> ScanResult:
+    """
+    scan_json() that never raises. Check .complete before caching or
+    accepting the value: a response cut off mid-object is still closed off
+    into a dict, minus whatever was lost.
+    """
+    if not text:
+        return ScanResult()
     try:
-        j = extract_json(text)
-        if not j:
-            return None
-        return json.loads(j)
+        return scan_json(text)
     except Exception:
-        return None
+        return ScanResult()
+
+def safe_json_load(text: str) -> Optional[Dict[str, Any]]:
+    return safe_json_scan(text).value
 
 def is_academic_only(text: str) -> bool:
     t = (text or "").lower()
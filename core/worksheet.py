@@ -0,0 +1,298 @@
+import io
+import os
+import time
+import asyncio
+from typing import Optional, List, Dict, Any, Tuple
+
+from .schemas import Artifacts
+from .utils import clamp
+from .diagnose import adiagnose
+from .llm_cache import cache_key, cache_get, cache_put
+from .tutor import build_memory_block, normalize_misconceptions
+from .streaming import OnPartial
+from .aio import run_sync, in_thread
+from .image_prep import ingest_image
+from .turns import Turn, TurnCancelled, TurnExpired, begin_turn, attach_task, end_turn
+from .scheduler import user_scope
+
+from db import record_attempt, update_user_concepts, get_concept_dashboard
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+try:
+    from pypdf import PdfReader, PdfWriter
+except ImportError:  # without pypdf a PDF is diagnosed as a single page
+    PdfReader = None
+    PdfWriter = None
+
+# Worksheet mode: a whole answer sheet (several photos, a multi-page PDF) is
+# split into pages, each question is mapped to the page its answer is on, and
+# the per-question Mistake Microscope calls run concurrently, at most
+# WORKSHEET_CONCURRENCY at a time. Results are cached per (page hash,
+# question), so re-grading the same sheet costs no model calls. The sheet
+# takes about as long as its slowest question instead of the sum of all of them.
+
+WORKSHEET_CONCURRENCY = int(os.getenv("LEARNSENSE_WORKSHEET_CONCURRENCY", "4"))
+WORKSHEET_MAX_PAGES = int(os.getenv("LEARNSENSE_WORKSHEET_MAX_PAGES", "20"))
+WORKSHEET_MAX_QUESTIONS = int(os.getenv("LEARNSENSE_WORKSHEET_MAX_QUESTIONS", "30"))
+WORKSHEET_BUDGET_S = float(os.getenv("LEARNSENSE_WORKSHEET_BUDGET_S", "90"))
+
+Page = Tuple[bytes, str]
+
+
+def split_pages(data: bytes, mime: Optional[str] = None) -> List[Page]:
+    """One (bytes, mime) per page: PDF pages, frames of a multi-page TIFF, or the image itself."""
+    mime = mime or "image/jpeg"
+    if not data:
+        return []
+    if mime == "application/pdf":
+        if PdfReader is None:
+            return [(data, mime)]
+        try:
+            reader = PdfReader(io.BytesIO(data))
+            pages = []
+            for page in reader.pages[:WORKSHEET_MAX_PAGES]:
+                writer = PdfWriter()
+                writer.add_page(page)
+                out = io.BytesIO()
+                writer.write(out)
+                pages.append((out.getvalue(), mime))
+            return pages or [(data, mime)]
+        except Exception:
+            return [(data, mime)]
+
+    if Image is not None:
+        try:
+            with Image.open(io.BytesIO(data)) as img:
+                frames = getattr(img, "n_frames", 1)
+                if frames > 1:
+                    pages = []
+                    for i in range(min(frames, WORKSHEET_MAX_PAGES)):
+                        img.seek(i)
+                        out = io.BytesIO()
+                        img.save(out, format="PNG")
+                        pages.append((out.getvalue(), "image/png"))
+                    return pages
+        except Exception:
+            pass
+    return [(data, mime)]
+
+
+def assign_pages(n_questions: int, n_pages: int) -> List[int]:
+    """
+    Page index for each question: one question per page when the counts
+    match, otherwise questions are spread over the pages in order (a single
+    photo of the whole sheet serves every question).
+    """
+    if n_pages <= 0:
+        return []
+    if n_pages >= n_questions:
+        return list(range(n_questions))
+    return [i * n_pages // n_questions for i in range(n_questions)]
+
+
+def _item_text(number: int, student_text: str) -> str:
+    note = f"(Answer sheet: grade only the answer to question {number} on the attached page.)"
+    return f"{student_text}\n{note}" if student_text else note
+
+
+async def _diagnose_item(
+    turn: Turn,
+    sem: asyncio.Semaphore,
+    index: int,
+    question: str,
+    student_text: str,
+    page: int,
+    page_hash: Optional[str],
+    page_mime: str,
+    mem: str,
+    mode: str,
+    topic: str,
+    on_partial: Optional[OnPartial],
+) -> Dict[str, Any]:
+    item: Dict[str, Any] = {"index": index, "question": question, "page": page, "image_hash": page_hash}
+    if page_hash is None:
+        # Ingest failed (OSError): without the page there is nothing to grade.
+        item.update(error="Page could not be read.", ms=0.0)
+        if on_partial is not None:
+            on_partial(f"items[{index}]", item)
+        return item
+    started = time.perf_counter()
+    text = _item_text(index + 1, student_text)
+    # Keyed without the memory block, which changes with every graded sheet.
+    # A page holds several answers, so the per-image transcript isn't used.
+    key = cache_key("worksheet", "\n".join((mode, topic, question, text)), image_hash=page_hash)
+    dg = await in_thread(cache_get, "worksheet", key)
+    if dg is None:
+        try:
+            async with sem:
+                dg = await turn.guard(adiagnose(
+                    question, text, mem, mode, topic, image_mime=page_mime, image_hash=page_hash,
+                    use_transcript=False,
+                ))
+        except TurnExpired:
+            dg = {"error": True, "error_message": "Timed out."}
+        if not dg.get("error") and not dg.get("truncated"):
+            await in_thread(cache_put, "worksheet", key, dg)
+    item["ms"] = (time.perf_counter() - started) * 1000
+
+    if dg.get("error"):
+        item["error"] = dg.get("error_message", "Diagnosis failed.")
+    else:
+        is_correct = bool(dg.get("is_correct", False))
+        item.update(
+            is_correct=is_correct,
+            confidence=clamp(dg.get("confidence", 0.5), 0.0, 1.0),
+            steps=dg.get("steps") or [],
+            wrong_step_index=int(dg.get("wrong_step_index", -1)),
+            fix=(dg.get("fix") or "").strip(),
+            misconceptions=[m.to_dict() for m in normalize_misconceptions(dg.get("misconceptions", []), is_correct)],
+        )
+    if on_partial is not None:
+        on_partial(f"items[{index}]", item)
+    return item
+
+
+def _merge(items: List[Dict[str, Any]], n_pages: int, elapsed_ms: float) -> Dict[str, Any]:
+    graded = [it for it in items if "error" not in it]
+    concepts: Dict[str, Dict[str, Any]] = {}
+    for it in graded:
+        if it["is_correct"]:
+            continue
+        for m in it["misconceptions"]:
+            c = concepts.setdefault(m["concept"], {"concept": m["concept"], "count": 0, "questions": []})
+            c["count"] += 1
+            c["questions"].append(it["index"] + 1)
+    return {
+        "mode": "WORKSHEET",
+        "items": items,
+        "pages": n_pages,
+        "correct": sum(1 for it in graded if it["is_correct"]),
+        "graded": len(graded),
+        "total": len(items),
+        "misconceptions": sorted(concepts.values(), key=lambda c: -c["count"]),
+        "elapsed_ms": elapsed_ms,
+        "slowest_ms": max((it["ms"] for it in items), default=0.0),
+        "sum_ms": sum(it["ms"] for it in items),
+    }
+
+
+def _commit_sheet(user_id: str, items: List[Dict[str, Any]], student_text: str):
+    for it in items:
+        if "error" in it:
+            continue
+        record_attempt(
+            user_id=user_id, question=it["question"], student_input=_item_text(it["index"] + 1, student_text),
+            has_image=True, image_hash=it["image_hash"],
+        )
+        update_user_concepts(user_id, it["misconceptions"], is_correct=it["is_correct"])
+
+
+async def adiagnose_worksheet(
+    user_id: str,
+    questions: List[str],
+    pages: List[Page],
+    mode: str,
+    topic: str,
+    student_text: str = "",
+    page_of: Optional[List[int]] = None,
+    on_partial: Optional[OnPartial] = None,
+    turn_id: Optional[str] = None,
+    budget_s: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    Grade every question of an answer sheet and merge the results into one
+    report. page_of[i] is the page holding question i's answer (default:
+    assign_pages). Finished items are streamed as on_partial("items[i]", item);
+    items still running when budget_s runs out are reported as timed out.
+    cancel_turn(turn_id) aborts the sheet and nothing is written.
+    """
+    questions = [q.strip() for q in questions if q and q.strip()][:WORKSHEET_MAX_QUESTIONS]
+    pages = pages[:WORKSHEET_MAX_PAGES]
+    if not questions or not pages:
+        return {"error": True, "error_message": "Add at least one question and one page."}
+    if page_of is None or len(page_of) != len(questions):
+        page_of = assign_pages(len(questions), len(pages))
+    page_of = [max(0, min(len(pages) - 1, int(p))) for p in page_of]
+
+    turn = begin_turn(turn_id, WORKSHEET_BUDGET_S if budget_s is None else budget_s)
+    with user_scope(user_id):
+        work = asyncio.ensure_future(_run_sheet(
+            turn, user_id, questions, pages, page_of, mode, topic, student_text, on_partial,
+        ))
+    attach_task(turn, work)
+    try:
+        return await work
+    except asyncio.CancelledError:
+        if turn.cancelled:
+            raise TurnCancelled(turn.turn_id) from None
+        raise
+    finally:
+        end_turn(turn)
+
+
+async def _run_sheet(
+    turn: Turn,
+    user_id: str,
+    questions: List[str],
+    pages: List[Page],
+    page_of: List[int],
+    mode: str,
+    topic: str,
+    student_text: str,
+    on_partial: Optional[OnPartial],
+) -> Dict[str, Any]:
+    started = time.perf_counter()
+
+    async def ingest(page: Page) -> Tuple[Optional[str], str]:
+        try:
+            return await in_thread(ingest_image, page[0], page[1])
+        except OSError:
+            return None, page[1]
+
+    used = sorted(set(page_of))
+    stored, mem = await asyncio.gather(
+        asyncio.gather(*(ingest(pages[p]) for p in used)),
+        in_thread(build_memory_block, user_id),
+    )
+    page_refs = dict(zip(used, stored))
+
+    sem = asyncio.Semaphore(max(1, WORKSHEET_CONCURRENCY))
+    items = await asyncio.gather(*(
+        _diagnose_item(
+            turn, sem, i, q, student_text, page_of[i], page_refs[page_of[i]][0], page_refs[page_of[i]][1],
+            mem, mode, topic, on_partial,
+        )
+        for i, q in enumerate(questions)
+    ))
+
+    # Writes happen only for a sheet that wasn't cancelled; an expired budget
+    # still records the questions that did get graded.
+    if turn.cancelled:
+        raise asyncio.CancelledError()
+    await asyncio.shield(in_thread(_commit_sheet, user_id, items, student_text))
+
+    report = _merge(items, len(pages), (time.perf_counter() - started) * 1000)
+    report["artifacts"] = Artifacts(concept_dashboard=await in_thread(get_concept_dashboard, user_id)).to_dict()
+    return report
+
+
+def diagnose_worksheet(
+    user_id: str,
+    questions: List[str],
+    pages: List[Page],
+    mode: str,
+    topic: str,
+    student_text: str = "",
+    page_of: Optional[List[int]] = None,
+    on_partial: Optional[OnPartial] = None,
+    turn_id: Optional[str] = None,
+    budget_s: Optional[float] = None,
+) -> Dict[str, Any]:
+    return run_sync(
+        adiagnose_worksheet, user_id, questions, pages, mode, topic,
+        student_text=student_text, page_of=page_of, on_partial=on_partial, turn_id=turn_id, budget_s=budget_s,
+    )
@@ -1,60 +1,248 @@
+import os
+import queue
+import atexit
+import logging
 import sqlite3
 import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime
-from typing import List, Tuple, Dict, Any
+from typing import List, Tuple, Dict, Any, Iterator, Optional
 
-DB_PATH = "learnsense.db"
+DB_PATH = os.getenv("LEARNSENSE_DB_PATH", "learnsense.db")
+DB_POOL_SIZE = int(os.getenv("LEARNSENSE_DB_POOL_SIZE", "8"))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("LEARNSENSE_DB_BUSY_TIMEOUT_MS", "5000"))
+DASHBOARD_CACHE_SIZE = int(os.getenv("LEARNSENSE_DASHBOARD_CACHE_SIZE", "2048"))
+# OFF | NORMAL | FULL. NORMAL survives app crashes; FULL also survives power loss.
+DB_SYNCHRONOUS = os.getenv("LEARNSENSE_DB_SYNCHRONOUS", "NORMAL").upper()
 
+# Write-behind: attempts and concept updates are queued and committed in
+# batches by a background thread instead of on the request thread.
+WRITE_BEHIND = os.getenv("LEARNSENSE_DB_WRITE_BEHIND", "0") == "1"
+WRITE_QUEUE_SIZE = int(os.getenv("LEARNSENSE_DB_WRITE_QUEUE_SIZE", "10000"))
+WRITE_BATCH_SIZE = int(os.getenv("LEARNSENSE_DB_WRITE_BATCH_SIZE", "256"))
 
-def _conn():
-    return sqlite3.connect(DB_PATH, check_same_thread=False)
+logger = logging.getLogger(__name__)
 
+# Long-lived connections shared by every Streamlit session in this process.
+_pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=DB_POOL_SIZE)
+_init_lock = threading.Lock()
+_initialized_path = None
 
-def init_db():
-    con = _conn()
-    cur = con.cursor()
-
-    # Backward-compatible table (you used this for “history” memory)
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS history (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id TEXT NOT NULL,
-        concept TEXT NOT NULL,
-        mastery INTEGER NOT NULL,
-        note TEXT NOT NULL,
-        created_at TEXT NOT NULL
-    )
-    """)
-
-    # Attempts per (user, question_hash)
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS attempts (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id TEXT NOT NULL,
-        question_hash TEXT NOT NULL,
-        question TEXT NOT NULL,
-        student_input TEXT NOT NULL,
-        has_image INTEGER NOT NULL DEFAULT 0,
-        created_at TEXT NOT NULL
-    )
-    """)
-
-    # Concept memory dashboard
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS user_concepts (
-        user_id TEXT NOT NULL,
-        concept TEXT NOT NULL,
-        mastery_est REAL NOT NULL DEFAULT 50.0,
-        misconception_count INTEGER NOT NULL DEFAULT 0,
-        correct_count INTEGER NOT NULL DEFAULT 0,
-        seen_count INTEGER NOT NULL DEFAULT 0,
-        last_seen TEXT NOT NULL,
-        PRIMARY KEY (user_id, concept)
+# user_id -> dashboard, most recently used last. Writers bump the epoch so a
+# read that raced with a write doesn't put a stale dashboard back.
+_dashboard_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_dashboard_lock = threading.Lock()
+_dashboard_epoch = 0
+
+
+def _conn():
+    con = sqlite3.connect(
+        DB_PATH,
+        check_same_thread=False,
+        timeout=DB_BUSY_TIMEOUT_MS / 1000.0,
     )
-    """)
+    # WAL lets readers run while another session writes; NORMAL sync is
+    # durable across app crashes and only risks the last commit on power loss.
+    con.execute("PRAGMA journal_mode=WAL")
+    if DB_SYNCHRONOUS in ("OFF", "NORMAL", "FULL"):
+        con.execute(f"PRAGMA synchronous={DB_SYNCHRONOUS}")
+    con.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    con.execute("PRAGMA temp_store=MEMORY")
+    con.execute("PRAGMA cache_size=-8000")
+    return con
+
+
+@contextmanager
+def _connection() -> Iterator[sqlite3.Connection]:
+    """
+    Borrow a pooled connection. The block runs in one transaction:
+    committed on success, rolled back on error.
+    """
+    init_db()
+    try:
+        con = _pool.get_nowait()
+    except queue.Empty:
+        con = _conn()
+
+    try:
+        with con:
+            yield con
+    except sqlite3.Error:
+        # Don't hand a possibly broken connection to the next caller.
+        con.close()
+        raise
+
+    try:
+        _pool.put_nowait(con)
+    except queue.Full:
+        con.close()
+
+
+def close_db():
+    """Close every pooled connection (e.g. on shutdown or after changing DB_PATH)."""
+    global _initialized_path
+    flush_writes()
+    with _init_lock:
+        while True:
+            try:
+                _pool.get_nowait().close()
+            except queue.Empty:
+                break
+        _initialized_path = None
+    _invalidate_dashboard()
+
+
+# Schema migrations, applied in order and recorded in PRAGMA user_version.
+# Never edit a shipped migration; append a new one instead.
+_MIGRATIONS: List[Tuple[int, List[str]]] = [
+    (1, [
+        # Backward-compatible table (you used this for “history” memory)
+        """
+        CREATE TABLE IF NOT EXISTS history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            concept TEXT NOT NULL,
+            mastery INTEGER NOT NULL,
+            note TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        )
+        """,
+        # Attempts per (user, question_hash)
+        """
+        CREATE TABLE IF NOT EXISTS attempts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            question_hash TEXT NOT NULL,
+            question TEXT NOT NULL,
+            student_input TEXT NOT NULL,
+            has_image INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL
+        )
+        """,
+        # Concept memory dashboard
+        """
+        CREATE TABLE IF NOT EXISTS user_concepts (
+            user_id TEXT NOT NULL,
+            concept TEXT NOT NULL,
+            mastery_est REAL NOT NULL DEFAULT 50.0,
+            misconception_count INTEGER NOT NULL DEFAULT 0,
+            correct_count INTEGER NOT NULL DEFAULT 0,
+            seen_count INTEGER NOT NULL DEFAULT 0,
+            last_seen TEXT NOT NULL,
+            PRIMARY KEY (user_id, concept)
+        )
+        """,
+    ]),
+    (2, [
+        # Leftovers from the first prototype; nothing reads them.
+        "DROP TABLE IF EXISTS users",
+        "DROP TABLE IF EXISTS learning_attempts",
+        # Running attempt count per (user, question_hash), so counting is O(1)
+        # no matter how long the attempts log gets.
+        """
+        CREATE TABLE IF NOT EXISTS attempt_counts (
+            user_id TEXT NOT NULL,
+            question_hash TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, question_hash)
+        ) WITHOUT ROWID
+        """,
+        """
+        INSERT OR REPLACE INTO attempt_counts (user_id, question_hash, attempts)
+        SELECT user_id, question_hash, COUNT(*) FROM attempts GROUP BY user_id, question_hash
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_attempts_user_question ON attempts (user_id, question_hash)",
+        "CREATE INDEX IF NOT EXISTS idx_history_user ON history (user_id, id)",
+        # Covering indexes for the two dashboard queries.
+        """
+        CREATE INDEX IF NOT EXISTS idx_user_concepts_weakest
+        ON user_concepts (user_id, mastery_est, concept, misconception_count, seen_count, last_seen)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_user_concepts_frequent
+        ON user_concepts (user_id, misconception_count DESC, concept)
+        """,
+    ]),
+    (3, [
+        # Chat messages that fell out of a session's in-memory window.
+        """
+        CREATE TABLE IF NOT EXISTS chat_messages (
+            user_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            PRIMARY KEY (user_id, seq)
+        ) WITHOUT ROWID
+        """,
+    ]),
+    (4, [
+        # Uploaded images live in the blob store (core/blob_store.py); attempts keep the hash.
+        "ALTER TABLE attempts ADD COLUMN image_hash TEXT",
+    ]),
+]
+
+SCHEMA_VERSION = _MIGRATIONS[-1][0]
+
+
+def _migrate(con: sqlite3.Connection):
+    """Apply pending migrations, each in its own transaction."""
+    current = int(con.execute("PRAGMA user_version").fetchone()[0])
+    for version, statements in _MIGRATIONS:
+        if version <= current:
+            continue
+        try:
+            con.execute("BEGIN IMMEDIATE")
+            # Another process may have migrated while we waited for the lock.
+            if int(con.execute("PRAGMA user_version").fetchone()[0]) >= version:
+                con.rollback()
+                continue
+            for sql in statements:
+                con.execute(sql)
+            con.execute(f"PRAGMA user_version={version}")
+            con.commit()
+        except Exception:
+            con.rollback()
+            raise
+    con.execute("PRAGMA optimize")
+
+
+def get_schema_version() -> int:
+    with _connection() as con:
+        return int(con.execute("PRAGMA user_version").fetchone()[0])
+
 
-    con.commit()
-    con.close()
+def init_db():
+    """Migrate the schema once per process (per DB_PATH). Cheap to call again."""
+    global _initialized_path
+    if _initialized_path == DB_PATH:
+        return
+
+    with _init_lock:
+        if _initialized_path == DB_PATH:
+            return
+
+        # DB_PATH was changed at runtime: drop connections to the old file.
+        while True:
+            try:
+                _pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+        _invalidate_dashboard()
+        with _counts_lock:
+            _attempt_counts.clear()
+
+        con = _conn()
+        _migrate(con)
+        # Keep the connection instead of paying for it again on the first query.
+        try:
+            _pool.put_nowait(con)
+        except queue.Full:
+            con.close()
+        _initialized_path = DB_PATH
 
 
 def question_to_hash(question: str) -> str:
@@ -62,34 +250,63 @@ def question_to_hash(question: str) -> str:
     return hashlib.sha256(q).hexdigest()[:16]
 
 
-def record_attempt(user_id: str, question: str, student_input: str, has_image: bool) -> int:
-    init_db()
-    qh = question_to_hash(question)
-    con = _conn()
-    cur = con.cursor()
-
-    cur.execute(
-        "INSERT INTO attempts (user_id, question_hash, question, student_input, has_image, created_at) VALUES (?, ?, ?, ?, ?, ?)",
-        (user_id, qh, question, student_input, 1 if has_image else 0, datetime.utcnow().isoformat()),
-    )
-    con.commit()
+_INSERT_ATTEMPT = (
+    "INSERT INTO attempts (user_id, question_hash, question, student_input, has_image, image_hash, created_at) "
+    "VALUES (:user_id, :question_hash, :question, :student_input, :has_image, :image_hash, :created_at)"
+)
+_BUMP_ATTEMPT_COUNT = """INSERT INTO attempt_counts (user_id, question_hash, attempts) VALUES (:user_id, :question_hash, 1)
+   ON CONFLICT (user_id, question_hash) DO UPDATE SET attempts = attempts + 1"""
 
-    cur.execute("SELECT COUNT(*) FROM attempts WHERE user_id=? AND question_hash=?", (user_id, qh))
-    attempts_used = int(cur.fetchone()[0])
 
-    con.close()
+def record_attempt(
+    user_id: str,
+    question: str,
+    student_input: str,
+    has_image: bool,
+    image_hash: Optional[str] = None,
+) -> int:
+    qh = question_to_hash(question)
+    row = {
+        "user_id": user_id,
+        "question_hash": qh,
+        "question": question,
+        "student_input": student_input,
+        "has_image": 1 if has_image or image_hash else 0,
+        "image_hash": image_hash,
+        "created_at": datetime.utcnow().isoformat(),
+    }
+
+    if WRITE_BEHIND:
+        key = (user_id, qh)
+        _cached_attempt_count(user_id, qh)
+        with _counts_lock:
+            _attempt_counts[key] += 1
+            attempts_used = _attempt_counts[key]
+        _enqueue_write("attempt", row)
+        return attempts_used
+
+    with _connection() as con:
+        cur = con.cursor()
+        cur.execute(_INSERT_ATTEMPT, row)
+        cur.execute(_BUMP_ATTEMPT_COUNT, row)
+        cur.execute("SELECT attempts FROM attempt_counts WHERE user_id=? AND question_hash=?", (user_id, qh))
+        attempts_used = int(cur.fetchone()[0])
     return attempts_used
 
 
+def _read_attempt_count(user_id: str, qh: str) -> int:
+    with _connection() as con:
+        row = con.execute(
+            "SELECT attempts FROM attempt_counts WHERE user_id=? AND question_hash=?", (user_id, qh)
+        ).fetchone()
+    return int(row[0]) if row else 0
+
+
 def get_attempts_used(user_id: str, question: str) -> int:
-    init_db()
     qh = question_to_hash(question)
-    con = _conn()
-    cur = con.cursor()
-    cur.execute("SELECT COUNT(*) FROM attempts WHERE user_id=? AND question_hash=?", (user_id, qh))
-    row = cur.fetchone()
-    con.close()
-    return int(row[0]) if row else 0
+    if WRITE_BEHIND:
+        return _cached_attempt_count(user_id, qh)
+    return _read_attempt_count(user_id, qh)
 
 
 def get_user_history(user_id: str) -> List[Tuple[str, int, str, str]]:
@@ -97,28 +314,55 @@ def get_user_history(user_id: str) -> List[Tuple[str, int, str, str]]:
     Returns rows like older code expects:
       (concept, mastery%, note, created_at)
     """
-    init_db()
-    con = _conn()
-    cur = con.cursor()
-    cur.execute(
-        "SELECT concept, mastery, note, created_at FROM history WHERE user_id=? ORDER BY id DESC LIMIT 50",
-        (user_id,),
-    )
-    rows = cur.fetchall()
-    con.close()
+    with _connection() as con:
+        rows = con.execute(
+            "SELECT concept, mastery, note, created_at FROM history WHERE user_id=? ORDER BY id DESC LIMIT 50",
+            (user_id,),
+        ).fetchall()
     return rows
 
 
 def add_history(user_id: str, concept: str, mastery: int, note: str):
-    init_db()
-    con = _conn()
-    cur = con.cursor()
-    cur.execute(
-        "INSERT INTO history (user_id, concept, mastery, note, created_at) VALUES (?, ?, ?, ?, ?)",
-        (user_id, concept, int(mastery), note, datetime.utcnow().isoformat()),
-    )
-    con.commit()
-    con.close()
+    with _connection() as con:
+        con.execute(
+            "INSERT INTO history (user_id, concept, mastery, note, created_at) VALUES (?, ?, ?, ?, ?)",
+            (user_id, concept, int(mastery), note, datetime.utcnow().isoformat()),
+        )
+
+
+def spill_chat_messages(user_id: str, messages: List[Dict[str, Any]]):
+    """Store messages ({"seq", "role", "content"}) evicted from a session's window."""
+    if not messages:
+        return
+    now = datetime.utcnow().isoformat()
+    with _connection() as con:
+        con.executemany(
+            "INSERT OR REPLACE INTO chat_messages (user_id, seq, role, content, created_at) VALUES (?, ?, ?, ?, ?)",
+            [(user_id, int(m["seq"]), m["role"], m["content"], now) for m in messages],
+        )
+
+
+def load_chat_messages(user_id: str, before_seq: int, limit: int) -> List[Dict[str, Any]]:
+    """Up to limit spilled messages older than before_seq, oldest first."""
+    with _connection() as con:
+        rows = con.execute(
+            "SELECT seq, role, content FROM chat_messages WHERE user_id=? AND seq<? ORDER BY seq DESC LIMIT ?",
+            (user_id, int(before_seq), int(limit)),
+        ).fetchall()
+    return [{"seq": r[0], "role": r[1], "content": r[2]} for r in reversed(rows)]
+
+
+def count_chat_messages(user_id: str, before_seq: int) -> int:
+    with _connection() as con:
+        row = con.execute(
+            "SELECT COUNT(*) FROM chat_messages WHERE user_id=? AND seq<?", (user_id, int(before_seq))
+        ).fetchone()
+    return int(row[0])
+
+
+def clear_chat_messages(user_id: str):
+    with _connection() as con:
+        con.execute("DELETE FROM chat_messages WHERE user_id=?", (user_id,))
 
 
 def update_user_concepts(user_id: str, misconceptions: List[Dict[str, Any]], is_correct: bool):
@@ -128,80 +372,199 @@ def update_user_concepts(user_id: str, misconceptions: List[Dict[str, Any]], is_
       - correct_count++ if correct else misconception_count++
       - mastery_est +/- delta, clamped 0..100
     """
-    init_db()
-    con = _conn()
-    cur = con.cursor()
-
     now = datetime.utcnow().isoformat()
-    delta = 4.0 if is_correct else -6.0
 
     if not misconceptions:
         misconceptions = [{"concept": "General Understanding"}]
 
-    for m in misconceptions:
-        concept = (m.get("concept") or "General Understanding").strip()
+    rows = [
+        {
+            "user_id": user_id,
+            "concept": (m.get("concept") or "General Understanding").strip(),
+            "mastery": 55.0 if is_correct else 45.0,
+            "delta": 4.0 if is_correct else -6.0,
+            "mis": 0 if is_correct else 1,
+            "cor": 1 if is_correct else 0,
+            "now": now,
+        }
+        for m in misconceptions
+    ]
+
+    if WRITE_BEHIND:
+        _enqueue_write("concepts", rows)
+        return
+
+    with _connection() as con:
+        _apply_concept_rows(con, rows)
+
+    _invalidate_dashboard(user_id)
+
+
+def _apply_concept_rows(con: sqlite3.Connection, rows: List[Dict[str, Any]]):
+    # Single UPSERT per concept: counters and clamping happen inside SQLite,
+    # so concurrent turns for the same user can't lose each other's updates.
+    con.executemany(
+        """INSERT INTO user_concepts
+           (user_id, concept, mastery_est, misconception_count, correct_count, seen_count, last_seen)
+           VALUES (:user_id, :concept, :mastery, :mis, :cor, 1, :now)
+           ON CONFLICT (user_id, concept) DO UPDATE SET
+               mastery_est = MAX(0.0, MIN(100.0, mastery_est + :delta)),
+               misconception_count = misconception_count + :mis,
+               correct_count = correct_count + :cor,
+               seen_count = seen_count + 1,
+               last_seen = :now""",
+        rows,
+    )
 
-        cur.execute(
-            "SELECT mastery_est, misconception_count, correct_count, seen_count FROM user_concepts WHERE user_id=? AND concept=?",
-            (user_id, concept),
-        )
-        row = cur.fetchone()
-
-        if row:
-            mastery_est, mis_cnt, cor_cnt, seen_cnt = row
-            seen_cnt += 1
-            if is_correct:
-                cor_cnt += 1
-            else:
-                mis_cnt += 1
-            mastery_est = max(0.0, min(100.0, float(mastery_est) + delta))
-            cur.execute(
-                """UPDATE user_concepts
-                   SET mastery_est=?, misconception_count=?, correct_count=?, seen_count=?, last_seen=?
-                   WHERE user_id=? AND concept=?""",
-                (mastery_est, mis_cnt, cor_cnt, seen_cnt, now, user_id, concept),
-            )
+
+# ---------- Write-behind ----------
+# (user_id, question_hash) -> attempts, authoritative while WRITE_BEHIND is on.
+# Seeded from attempt_counts on first use, then only bumped in memory.
+_attempt_counts: Dict[Tuple[str, str], int] = {}
+_counts_lock = threading.Lock()
+
+_write_queue: "queue.Queue[Tuple[str, Any]]" = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+_writer_lock = threading.Lock()
+_writer: Optional[threading.Thread] = None
+
+
+def _cached_attempt_count(user_id: str, qh: str) -> int:
+    key = (user_id, qh)
+    with _counts_lock:
+        if key in _attempt_counts:
+            return _attempt_counts[key]
+    # Seed outside the lock; if another thread got there first, keep its value
+    # since it may already include queued attempts.
+    seed = _read_attempt_count(user_id, qh)
+    with _counts_lock:
+        return _attempt_counts.setdefault(key, seed)
+
+
+def _apply_writes(events: List[Tuple[str, Any]]):
+    attempts = [payload for kind, payload in events if kind == "attempt"]
+    concepts = [row for kind, payload in events if kind == "concepts" for row in payload]
+    with _connection() as con:
+        if attempts:
+            con.executemany(_INSERT_ATTEMPT, attempts)
+            con.executemany(_BUMP_ATTEMPT_COUNT, attempts)
+        if concepts:
+            _apply_concept_rows(con, concepts)
+    for user_id in {row["user_id"] for row in concepts}:
+        _invalidate_dashboard(user_id)
+
+
+def _writer_loop():
+    while True:
+        events = [_write_queue.get()]
+        while len(events) < WRITE_BATCH_SIZE:
+            try:
+                events.append(_write_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            _apply_writes(events)
+        except Exception:
+            logger.exception("write-behind batch of %d events failed", len(events))
+        finally:
+            for _ in events:
+                _write_queue.task_done()
+
+
+def _enqueue_write(kind: str, payload: Any):
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = threading.Thread(target=_writer_loop, name="learnsense-db-writer", daemon=True)
+                _writer.start()
+    try:
+        _write_queue.put_nowait((kind, payload))
+    except queue.Full:
+        # Writer can't keep up: fall back to writing on the caller's thread.
+        _apply_writes([(kind, payload)])
+
+
+def flush_writes():
+    """Block until every queued write-behind event is committed."""
+    if _writer is not None:
+        _write_queue.join()
+
+
+atexit.register(flush_writes)
+
+
+def _invalidate_dashboard(user_id: Optional[str] = None):
+    global _dashboard_epoch
+    with _dashboard_lock:
+        _dashboard_epoch += 1
+        if user_id is None:
+            _dashboard_cache.clear()
         else:
-            mastery_est = 55.0 if is_correct else 45.0
-            mis_cnt = 0 if is_correct else 1
-            cor_cnt = 1 if is_correct else 0
-            seen_cnt = 1
-            cur.execute(
-                """INSERT INTO user_concepts
-                   (user_id, concept, mastery_est, misconception_count, correct_count, seen_count, last_seen)
-                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
-                (user_id, concept, mastery_est, mis_cnt, cor_cnt, seen_cnt, now),
-            )
+            _dashboard_cache.pop(user_id, None)
 
-    con.commit()
-    con.close()
 
+def _copy_dashboard(d: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "weakest": [dict(w) for w in d["weakest"]],
+        "frequent": [dict(f) for f in d["frequent"]],
+    }
 
-def get_concept_dashboard(user_id: str) -> Dict[str, Any]:
-    init_db()
-    con = _conn()
-    cur = con.cursor()
 
-    cur.execute(
-        "SELECT concept, mastery_est, misconception_count, seen_count, last_seen FROM user_concepts WHERE user_id=? ORDER BY mastery_est ASC LIMIT 3",
-        (user_id,),
+# Both top-3 lists in one round trip. Each half reads only columns of its
+# index (idx_user_concepts_weakest / _frequent), so both are covering
+# searches; the outer ORDER BY then sorts the at most six rows in a temp B-tree.
+_DASHBOARD_SQL = """
+    SELECT kind, concept, mastery_est, misconception_count, seen_count, last_seen FROM (
+        SELECT * FROM (
+            SELECT 0 AS kind, concept, mastery_est, misconception_count, seen_count, last_seen
+            FROM user_concepts WHERE user_id=? ORDER BY mastery_est ASC LIMIT 3
+        )
+        UNION ALL
+        SELECT * FROM (
+            SELECT 1 AS kind, concept, NULL, misconception_count, NULL, NULL
+            FROM user_concepts WHERE user_id=? ORDER BY misconception_count DESC LIMIT 3
+        )
     )
+    ORDER BY kind, CASE kind WHEN 0 THEN mastery_est ELSE -misconception_count END
+    """
+
+
+def _load_concept_dashboard(user_id: str) -> Dict[str, Any]:
+    with _connection() as con:
+        rows = con.execute(_DASHBOARD_SQL, (user_id, user_id)).fetchall()
+
     weakest = [
         {
-            "concept": r[0],
-            "mastery_est": float(r[1]),
-            "misconception_count": int(r[2]),
-            "seen_count": int(r[3]),
-            "last_seen": r[4],
+            "concept": r[1],
+            "mastery_est": float(r[2]),
+            "misconception_count": int(r[3]),
+            "seen_count": int(r[4]),
+            "last_seen": r[5],
         }
-        for r in cur.fetchall()
+        for r in rows if r[0] == 0
     ]
+    frequent = [{"concept": r[1], "misconception_count": int(r[3])} for r in rows if r[0] == 1]
+    return {"weakest": weakest, "frequent": frequent}
 
-    cur.execute(
-        "SELECT concept, misconception_count FROM user_concepts WHERE user_id=? ORDER BY misconception_count DESC LIMIT 3",
-        (user_id,),
-    )
-    frequent = [{"concept": r[0], "misconception_count": int(r[1])} for r in cur.fetchall()]
 
-    con.close()
-    return {"weakest": weakest, "frequent": frequent}
+def get_concept_dashboard(user_id: str) -> Dict[str, Any]:
+    """
+    Per-user dashboard served from an in-process LRU cache.
+    update_user_concepts() invalidates the user's entry.
+    """
+    with _dashboard_lock:
+        cached = _dashboard_cache.get(user_id)
+        if cached is not None:
+            _dashboard_cache.move_to_end(user_id)
+            return _copy_dashboard(cached)
+        epoch = _dashboard_epoch
+
+    dash = _load_concept_dashboard(user_id)
+
+    with _dashboard_lock:
+        if epoch == _dashboard_epoch and DASHBOARD_CACHE_SIZE > 0:
+            _dashboard_cache[user_id] = dash
+            _dashboard_cache.move_to_end(user_id)
+            while len(_dashboard_cache) > DASHBOARD_CACHE_SIZE:
+                _dashboard_cache.popitem(last=False)
+    return _copy_dashboard(dash)
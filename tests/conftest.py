@@ -0,0 +1,139 @@
+import os
+import sys
+import time
+import asyncio
+import tempfile
+import threading
+from typing import Any, Callable, List, Optional, Tuple
+
+import pytest
+
+# The app isn't installed as a package; import core/, backend, db from the checkout.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Importing backend creates the database and starts the Gemini warm-up; keep
+# every file the app writes out of the checkout and don't touch the network.
+_scratch = tempfile.mkdtemp(prefix="learnsense-tests-")
+os.environ.setdefault("LEARNSENSE_DB_PATH", os.path.join(_scratch, "learnsense.db"))
+os.environ.setdefault("LEARNSENSE_LLM_CACHE_PATH", os.path.join(_scratch, "llm_cache.db"))
+os.environ.setdefault("LEARNSENSE_BLOB_DIR", os.path.join(_scratch, "blobs"))
+os.environ.setdefault("LEARNSENSE_GEMINI_WARMUP", "0")
+os.environ.pop("GOOGLE_API_KEY", None)
+
+
+@pytest.fixture
+def fresh_db(tmp_path, monkeypatch):
+    """db module pointed at an empty database file under tmp_path."""
+    import db
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "learnsense.db"))
+    db.init_db()
+    yield db
+    db.close_db()
+
+
+@pytest.fixture
+def fresh_cache(tmp_path, monkeypatch):
+    """llm_cache on an empty file, with fresh per-thread connections and stats."""
+    from core import llm_cache
+    monkeypatch.setattr(llm_cache, "CACHE_PATH", str(tmp_path / "llm_cache.db"))
+    monkeypatch.setattr(llm_cache, "_local", threading.local())
+    monkeypatch.setattr(llm_cache, "_schema_ready", False)
+    monkeypatch.setattr(llm_cache, "_stats", {})
+    llm_cache.cache_clear()
+    yield llm_cache
+    llm_cache.cache_clear()
+
+
+class _Resp:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeClient:
+    """
+    Stands in for genai.Client. respond(model, contents) gives the response
+    text; every call is recorded as (model, contents). Like httpx's pool, the
+    async side is bound to the first event loop that uses it and raises on
+    any other one.
+    """
+
+    def __init__(self, respond: Callable[[str, Any], str], delay: float = 0.0):
+        self.respond = respond
+        self.delay = delay
+        self.calls: List[Tuple[str, Any]] = []
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.models = _Models(self)
+        self.aio = _Aio(self)
+
+    def _bind(self):
+        loop = asyncio.get_running_loop()
+        if self.loop is None:
+            self.loop = loop
+        elif loop is not self.loop:
+            raise RuntimeError("connection pool is bound to a different event loop")
+
+
+class _Models:
+    def __init__(self, client: FakeClient):
+        self.c = client
+
+    def get(self, model: str):
+        return {"name": model}
+
+    def generate_content(self, model: str, contents: Any, **kw):
+        self.c.calls.append((model, contents))
+        time.sleep(self.c.delay)
+        return _Resp(self.c.respond(model, contents))
+
+    def generate_content_stream(self, model: str, contents: Any, **kw):
+        self.c.calls.append((model, contents))
+        text = self.c.respond(model, contents)
+        for i in range(0, len(text), 7):
+            time.sleep(self.c.delay / max(1, len(text) // 7))
+            yield _Resp(text[i:i + 7])
+
+
+class _AioModels:
+    def __init__(self, client: FakeClient):
+        self.c = client
+
+    async def get(self, model: str):
+        self.c._bind()
+        return {"name": model}
+
+    async def generate_content(self, model: str, contents: Any, **kw):
+        self.c._bind()
+        self.c.calls.append((model, contents))
+        await asyncio.sleep(self.c.delay)
+        return _Resp(self.c.respond(model, contents))
+
+    async def generate_content_stream(self, model: str, contents: Any, **kw):
+        self.c._bind()
+        self.c.calls.append((model, contents))
+        text = self.c.respond(model, contents)
+
+        async def chunks():
+            for i in range(0, len(text), 7):
+                await asyncio.sleep(self.c.delay / max(1, len(text) // 7))
+                yield _Resp(text[i:i + 7])
+        return chunks()
+
+
+class _Aio:
+    def __init__(self, client: FakeClient):
+        self.models = _AioModels(client)
+
+
+@pytest.fixture
+def fake_client(monkeypatch, fresh_db, fresh_cache, tmp_path):
+    """
+    Install a FakeClient as the process's Gemini client, on a fresh database,
+    response cache and blob store. Set .respond (and .delay) in the test.
+    """
+    pytest.importorskip("httpx")
+    pytest.importorskip("google.genai")
+    from core import gemini_client, blob_store
+    monkeypatch.setattr(blob_store, "BLOB_DIR", str(tmp_path / "blobs"))
+    client = FakeClient(lambda model, contents: "{}")
+    monkeypatch.setattr(gemini_client, "_client", client)
+    return client
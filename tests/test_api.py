@@ -0,0 +1,92 @@
+import io
+import json
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("multipart")
+Image = pytest.importorskip("PIL.Image")
+from fastapi.testclient import TestClient  # noqa: E402
+
+import api  # noqa: E402
+
+QUESTION = "Why does a binary search need a sorted array?"
+SOCRATIC = json.dumps({
+    "is_correct": False, "confidence": 0.4, "next_question": "What does one comparison rule out?",
+    "misconceptions": [{"concept": "Search invariants", "hints": ["h1", "h2", "h3"]}],
+})
+DIAGNOSE = json.dumps({
+    "is_correct": True, "confidence": 0.9, "steps": ["2x = 8", "x = 4"], "wrong_step_index": -1,
+    "fix": "", "hints": [], "misconceptions": [],
+})
+
+
+@pytest.fixture
+def client(fake_client):
+    # TestClient serves the app on a loop of its own, like uvicorn.
+    with TestClient(api.app) as c:
+        yield c
+
+
+def _png() -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", (64, 48), "white").save(out, "PNG")
+    return out.getvalue()
+
+
+def test_health(client):
+    r = client.get("/health")
+    assert r.status_code == 200 and r.json()["ok"] is True
+
+
+def test_tutor_turn_json(client, fake_client, fresh_db):
+    fake_client.respond = lambda model, contents: SOCRATIC
+    r = client.post("/tutor/turn", json={"user_id": "api-u", "question": QUESTION, "student_input": "It's faster"})
+    assert r.status_code == 200
+    body = r.json()
+    assert body["mode"] == "SOCRATIC" and body["attempts_used"] == 1
+    assert fresh_db.get_attempts_used("api-u", QUESTION) == 1
+    # A second request is served from another TestClient portal call; the pool stays on one loop.
+    r = client.post("/tutor/turn", json={"user_id": "api-u", "question": QUESTION, "student_input": "Still faster"})
+    assert r.status_code == 200 and r.json()["attempts_used"] == 2
+
+
+def test_tutor_turn_validation(client):
+    assert client.post("/tutor/turn", json={"user_id": "api-u"}).status_code == 400
+    assert client.post("/tutor/turn", json=[1, 2]).status_code == 400
+    r = client.post("/tutor/turn", json={"user_id": "api-u", "question": QUESTION, "hint_level": "two"})
+    assert r.status_code == 400
+
+
+def test_tutor_turn_multipart_image(client, fake_client):
+    fake_client.respond = lambda model, contents: DIAGNOSE
+    r = client.post(
+        "/tutor/turn",
+        data={"user_id": "api-img", "question": "Solve 2x = 8."},
+        files={"image": ("work.png", _png(), "image/png")},
+    )
+    assert r.status_code == 200
+    assert r.json()["mode"] == "DIAGNOSE"
+    r = client.post(
+        "/tutor/turn",
+        data={"user_id": "api-img", "question": "Solve 2x = 8."},
+        files={"image": ("work.txt", b"not an image", "text/plain")},
+    )
+    assert r.status_code == 415
+
+
+def test_worksheet(client, fake_client):
+    fake_client.respond = lambda model, contents: DIAGNOSE
+    r = client.post(
+        "/worksheet/diagnose",
+        data={"user_id": "api-ws", "questions": "Solve 2x = 8.\nSolve 3x = 12."},
+        files=[("pages", ("p1.png", _png(), "image/png")), ("pages", ("p2.png", _png(), "image/png"))],
+    )
+    assert r.status_code == 200
+    body = r.json()
+    assert body["mode"] == "WORKSHEET" and body["graded"] == body["total"] == 2
+    assert client.post("/worksheet/diagnose", data={"user_id": "api-ws", "questions": "Q"}).status_code == 400
+
+
+def test_cancel_unknown_turn(client):
+    assert client.post("/tutor/turn/nope/cancel").json() == {"cancelled": False}
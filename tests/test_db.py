@@ -0,0 +1,213 @@
+import os
+import time
+import queue
+import random
+import sqlite3
+import threading
+
+import pytest
+
+THREADS = 8
+TURNS = 200
+
+
+def _hammer(fn):
+    """Run fn(thread_index, turn) from THREADS threads at once; re-raise the first error."""
+    start = threading.Barrier(THREADS)
+    errors = []
+
+    def work(t):
+        start.wait()
+        try:
+            for i in range(TURNS):
+                fn(t, i)
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=work, args=(t,)) for t in range(THREADS)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    if errors:
+        raise errors[0]
+
+
+@pytest.mark.parametrize("write_behind", [False, True])
+def test_concurrent_concept_updates_lose_nothing(fresh_db, monkeypatch, write_behind):
+    # Every thread updates the same user's same two concepts: the UPSERT
+    # (and the write-behind batches) must count every single turn.
+    db = fresh_db
+    monkeypatch.setattr(db, "WRITE_BEHIND", write_behind)
+    concepts = [{"concept": "Rotation"}, {"concept": "Balance"}]
+    _hammer(lambda t, i: db.update_user_concepts("u", concepts, i % 2 == 0))
+    db.flush_writes()
+
+    rows = sqlite3.connect(db.DB_PATH).execute(
+        "SELECT concept, seen_count, correct_count, misconception_count, mastery_est FROM user_concepts ORDER BY concept"
+    ).fetchall()
+    total = THREADS * TURNS
+    assert [r[:4] for r in rows] == [
+        ("Balance", total, total // 2, total // 2),
+        ("Rotation", total, total // 2, total // 2),
+    ]
+    assert all(0.0 <= r[4] <= 100.0 for r in rows)
+    dash = db.get_concept_dashboard("u")
+    assert {w["concept"]: w["seen_count"] for w in dash["weakest"]} == {"Balance": total, "Rotation": total}
+
+
+@pytest.mark.parametrize("write_behind", [False, True])
+def test_concurrent_attempts_get_distinct_counts(fresh_db, monkeypatch, write_behind):
+    db = fresh_db
+    monkeypatch.setattr(db, "WRITE_BEHIND", write_behind)
+    seen = []
+    lock = threading.Lock()
+
+    def attempt(t, i):
+        n = db.record_attempt("u", "What is an AVL tree?", f"answer {t}/{i}", False)
+        with lock:
+            seen.append(n)
+
+    _hammer(attempt)
+    db.flush_writes()
+
+    total = THREADS * TURNS
+    assert sorted(seen) == list(range(1, total + 1))
+    assert db.get_attempts_used("u", "What is an AVL tree?") == total
+    con = sqlite3.connect(db.DB_PATH)
+    assert con.execute("SELECT COUNT(*) FROM attempts").fetchone()[0] == total
+    assert con.execute("SELECT attempts FROM attempt_counts").fetchall() == [(total,)]
+
+
+class _NoPool(queue.LifoQueue):
+    """Never hands out or keeps a connection: every call connects from scratch."""
+
+    def get_nowait(self):
+        raise queue.Empty
+
+    def put_nowait(self, item):
+        raise queue.Full
+
+
+def _ms_per_turn(db, turns: int) -> float:
+    # The DB work of one tutor turn: count the attempt, read memory, update
+    # concepts, refresh the dashboard.
+    def turn(i):
+        user = f"u{i % 20}"
+        db.record_attempt(user, "What is an AVL tree?", "answer", False)
+        db.get_user_history(user)
+        db.update_user_concepts(user, [{"concept": "Rotation"}, {"concept": "Balance"}], i % 3 == 0)
+        db.get_concept_dashboard(user)
+
+    for i in range(20):
+        turn(i)
+    started = time.perf_counter()
+    for i in range(turns):
+        turn(i)
+    return (time.perf_counter() - started) / turns * 1000
+
+
+def test_benchmark_per_turn_overhead(fresh_db, monkeypatch, capsys):
+    # Pooled long-lived connections vs. a fresh connection (and its PRAGMAs)
+    # per call, which is what every query paid before the pool.
+    db = fresh_db
+    pooled = _ms_per_turn(db, 300)
+    monkeypatch.setattr(db, "_pool", _NoPool())
+    unpooled = _ms_per_turn(db, 300)
+    with capsys.disabled():
+        print(f"\nDB overhead per turn: pooled {pooled:.2f} ms, connection per call {unpooled:.2f} ms")
+    assert pooled < unpooled
+    assert pooled < 20
+
+
+# Synthetic attempts log for the query-plan benchmark. The default keeps the
+# suite quick; LEARNSENSE_BENCH_ATTEMPTS=1000000 checks a production-sized log.
+BENCH_ATTEMPTS = int(os.getenv("LEARNSENSE_BENCH_ATTEMPTS", "50000"))
+BENCH_USERS = 5000
+
+
+def _p95_us(fn, args) -> float:
+    times = []
+    for a in args:
+        started = time.perf_counter()
+        fn(*a)
+        times.append((time.perf_counter() - started) * 1e6)
+    times.sort()
+    return times[int(0.95 * (len(times) - 1))]
+
+
+def test_benchmark_large_db(tmp_path, monkeypatch, capsys):
+    # A version-1 database (no indexes, no counter table) with a big attempts
+    # log, migrated to the current schema; then the hot queries' plans and
+    # latencies.
+    import db
+    path = str(tmp_path / "big.db")
+    rnd = random.Random(1)
+    con = sqlite3.connect(path)
+    for sql in db._MIGRATIONS[0][1]:
+        con.execute(sql)
+    con.execute("PRAGMA user_version=1")
+    con.executemany(
+        "INSERT INTO attempts (user_id, question_hash, question, student_input, has_image, created_at) VALUES (?, ?, 'Q', 'A', 0, '')",
+        ((f"u{rnd.randrange(BENCH_USERS)}", f"q{rnd.randrange(200):015d}") for _ in range(BENCH_ATTEMPTS)),
+    )
+    con.executemany(
+        "INSERT OR IGNORE INTO user_concepts VALUES (?, ?, ?, ?, 0, 1, '')",
+        ((f"u{rnd.randrange(BENCH_USERS)}", f"c{rnd.randrange(300)}", rnd.random() * 100, rnd.randrange(20))
+         for _ in range(BENCH_ATTEMPTS // 10)),
+    )
+    con.commit()
+    con.close()
+
+    monkeypatch.setattr(db, "DB_PATH", path)
+    started = time.perf_counter()
+    db.init_db()
+    migrate_s = time.perf_counter() - started
+    try:
+        assert db.get_schema_version() == db.SCHEMA_VERSION
+        con = sqlite3.connect(path)
+        u, qh, n = con.execute(
+            "SELECT user_id, question_hash, COUNT(*) FROM attempts GROUP BY user_id, question_hash LIMIT 1"
+        ).fetchone()
+        assert con.execute(
+            "SELECT attempts FROM attempt_counts WHERE user_id=? AND question_hash=?", (u, qh)
+        ).fetchone() == (n,)
+
+        plans = {}
+        for name, sql in (
+            ("attempt_count", "SELECT attempts FROM attempt_counts WHERE user_id='u1' AND question_hash='x'"),
+            ("attempts_by_question", "SELECT COUNT(*) FROM attempts WHERE user_id='u1' AND question_hash='x'"),
+            ("history", "SELECT concept, mastery, note, created_at FROM history WHERE user_id='u1' ORDER BY id DESC LIMIT 50"),
+        ):
+            plans[name] = " | ".join(r[3] for r in con.execute("EXPLAIN QUERY PLAN " + sql))
+        # The statement _load_concept_dashboard() actually runs.
+        dashboard = [r[3] for r in con.execute("EXPLAIN QUERY PLAN " + db._DASHBOARD_SQL, ("u1", "u1"))]
+        con.close()
+
+        users = [(f"u{rnd.randrange(BENCH_USERS)}",) for _ in range(2000)]
+        latency = {
+            "get_attempts_used": _p95_us(lambda user: db.get_attempts_used(user, "Q"), users),
+            "dashboard_query": _p95_us(db._load_concept_dashboard, users),
+            "record_attempt": _p95_us(lambda user: db.record_attempt(user, "Q", "A", False), users[:300]),
+        }
+    finally:
+        db.close_db()
+
+    with capsys.disabled():
+        print(f"\n{BENCH_ATTEMPTS} attempts, migrated in {migrate_s:.2f}s")
+        for name, plan in plans.items():
+            print(f"  plan {name}: {plan}")
+        print(f"  plan dashboard: {' | '.join(dashboard)}")
+        for name, us in latency.items():
+            print(f"  p95 {name}: {us:.0f}us")
+    # Every hot query is an index search, never a table scan or a sort.
+    for name, plan in plans.items():
+        assert "SEARCH" in plan and "SCAN" not in plan and "TEMP B-TREE" not in plan, (name, plan)
+    # Both dashboard halves are covering searches; the only SCANs are of their
+    # (at most three-row) subquery results, which the outer ORDER BY sorts.
+    assert "SEARCH user_concepts USING COVERING INDEX idx_user_concepts_weakest (user_id=?)" in dashboard
+    assert "SEARCH user_concepts USING COVERING INDEX idx_user_concepts_frequent (user_id=?)" in dashboard
+    assert not any(step.startswith("SCAN user_concepts") for step in dashboard), dashboard
+    # Loose: a few ms means an index lookup, a table scan of the log takes far longer.
+    assert latency["get_attempts_used"] < 5000
+    assert latency["dashboard_query"] < 5000
@@ -0,0 +1,58 @@
+import json
+import asyncio
+
+import pytest
+
+pytest.importorskip("google.genai")
+from core.diagnose import adiagnose, diagnose  # noqa: E402
+
+IMAGE = b"\xff\xd8\xff\xe0 handwritten working"
+ANSWER = json.dumps({
+    "is_correct": False, "confidence": 0.7, "steps": ["2x + 3 = 11", "2x = 14", "x = 7"],
+    "wrong_step_index": 1, "fix": "Subtract 3, don't add it.", "hints": ["Check step 2."], "misconceptions": [],
+})
+
+
+def _run(question="Solve 2x + 3 = 11.", text="x = 7", on_partial=None):
+    return diagnose(question, text, "", "Coach", "algebra", image_bytes=IMAGE, image_mime="image/jpeg", on_partial=on_partial)
+
+
+def _sent_image(call) -> bool:
+    return isinstance(call[1], list) and len(call[1]) > 1
+
+
+def test_repeat_turn_on_an_image_is_a_cache_hit(fake_client, fresh_cache, monkeypatch):
+    # The diagnose site is off by default (the prompt embeds the student's history).
+    monkeypatch.setattr(fresh_cache, "ENABLED_SITES", fresh_cache.ENABLED_SITES | {"diagnose"})
+    fake_client.respond = lambda model, contents: ANSWER
+    first = _run()
+    assert first["wrong_step_index"] == 1
+    assert len(fake_client.calls) == 1 and _sent_image(fake_client.calls[0])
+
+    assert _run() == first
+    assert len(fake_client.calls) == 1
+
+
+def test_follow_up_uses_the_transcript_for_the_same_question_only(fake_client):
+    fake_client.respond = lambda model, contents: ANSWER
+    _run()
+    _run(text="x = 7, I think")
+    assert not _sent_image(fake_client.calls[1])
+    # Same photo, another question: its steps must be read off the image again.
+    _run(question="Solve 3x - 1 = 8.")
+    assert _sent_image(fake_client.calls[2])
+
+
+def test_broken_callback_on_transcript_steps_keeps_the_diagnosis(fake_client):
+    fake_client.respond = lambda model, contents: ANSWER
+    _run()
+
+    def on_partial(name, value):
+        raise ValueError("UI gone")
+
+    # Called directly: run_sync would deliver the partials on this thread itself.
+    out = asyncio.run(adiagnose(
+        "Solve 2x + 3 = 11.", "x = 7, I think", "", "Coach", "algebra", image_bytes=IMAGE, on_partial=on_partial,
+    ))
+    assert not out.get("error")
+    assert out["steps"] == ["2x + 3 = 11", "2x = 14", "x = 7"]
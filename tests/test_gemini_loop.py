@@ -0,0 +1,33 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("google.genai")
+from core import aio  # noqa: E402
+from core.gemini_client import warm_up, get_client  # noqa: E402
+from core.streaming import agenerate_text  # noqa: E402
+
+
+def test_calls_from_two_loops_share_one_pool(fake_client):
+    # The fake's async side is bound to the first loop it's used on, the way
+    # httpx's pool is; warm-up, run_sync and two separate asyncio.run loops
+    # (uvicorn's, a test client's) must all end up on core.aio's loop.
+    fake_client.respond = lambda model, contents: '{"fix": "ok", "hints": ["a", "b"]}'
+    assert warm_up()
+
+    async def call(stream: bool):
+        seen = []
+        loop = asyncio.get_running_loop()
+        on_partial = (lambda name, value: seen.append((name, asyncio.get_running_loop() is loop))) if stream else None
+        text = await agenerate_text(get_client(), "m", ["p"], on_partial, ("fix", "hints[]"), "diagnose")
+        return text, seen
+
+    first, _ = asyncio.run(call(False))
+    second, seen = asyncio.run(call(True))
+    third = aio.run_sync(agenerate_text, get_client(), "m", ["p"])
+
+    assert first == second == third
+    # Partials come back on the caller's loop, in order.
+    assert seen == [("fix", True), ("hints[0]", True), ("hints[1]", True)]
+    assert fake_client.loop is aio.get_loop()
+    assert len(fake_client.calls) == 3
@@ -0,0 +1,70 @@
+import io
+import random
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+from PIL import ImageDraw, ImageChops  # noqa: E402
+
+from core.image_prep import preprocess_image, PREP_MAX_DIM  # noqa: E402
+
+# Phone-camera sizes of a worksheet photo.
+SIZES = [(4032, 3024), (3264, 2448), (4000, 3000), (2592, 1944)]
+
+
+def _photo(w: int, h: int, seed: int, orientation: int = 1) -> bytes:
+    """Handwriting on paper under uneven light, with sensor noise and a dark table border."""
+    rng = random.Random(seed)
+    light = Image.linear_gradient("L").rotate(90).resize((w, h)).point(lambda v: 205 + v * 35 // 255)
+    # Gaussian noise centred on 128.
+    paper = ImageChops.add(light, Image.effect_noise((w, h), 12), offset=-128)
+    img = Image.merge("RGB", (paper, paper.point(lambda v: v * 98 // 100), paper.point(lambda v: v * 93 // 100)))
+    draw = ImageDraw.Draw(img)
+    m = int(min(w, h) * 0.06)
+    for box in ((0, 0, w, m), (0, h - m, w, h), (0, 0, m, h), (w - m, 0, w, h)):
+        draw.rectangle(box, fill=(60, 60, 60))
+    for line in range(18):
+        y, x = int(h * 0.15 + line * h * 0.04), int(w * 0.12)
+        for _ in range(40):
+            nx = x + rng.randint(10, 40)
+            draw.line([(x, y + rng.randint(-8, 8)), (nx, y + rng.randint(-8, 8))], fill=(30, 30, 90), width=5)
+            x = nx
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    out = io.BytesIO()
+    img.save(out, "JPEG", quality=rng.choice([88, 92, 95]), exif=exif)
+    return out.getvalue()
+
+
+def _pct(xs, p: float) -> float:
+    xs = sorted(xs)
+    return xs[int(p * (len(xs) - 1))]
+
+
+def test_exif_orientation_and_max_dim():
+    res = preprocess_image(_photo(1200, 800, 0, orientation=6), "image/jpeg")
+    out = Image.open(io.BytesIO(res.data))
+    assert res.mime == "image/jpeg"
+    # Orientation 6 is a quarter turn: the portrait page comes out portrait.
+    assert out.height > out.width
+    assert max(out.size) <= PREP_MAX_DIM
+
+
+def test_benchmark_prep(capsys):
+    # Size and latency distribution over a batch of full-size phone photos.
+    photos = [_photo(*SIZES[i % len(SIZES)], seed=i, orientation=random.Random(i).choice([1, 3, 6])) for i in range(8)]
+    results = [preprocess_image(p, "image/jpeg") for p in photos]
+    ins = [r.bytes_in for r in results]
+    outs = [r.bytes_out for r in results]
+    ms = [r.ms for r in results]
+
+    with capsys.disabled():
+        print(f"\nimage prep over {len(results)} photos, steps {results[-1].steps}")
+        print("  input  MB p50 %.2f p90 %.2f max %.2f" % (_pct(ins, .5) / 1e6, _pct(ins, .9) / 1e6, max(ins) / 1e6))
+        print("  output MB p50 %.2f p90 %.2f max %.2f" % (_pct(outs, .5) / 1e6, _pct(outs, .9) / 1e6, max(outs) / 1e6))
+        print("  prep   ms p50 %.0f p90 %.0f max %.0f" % (_pct(ms, .5), _pct(ms, .9), max(ms)))
+        print("  saved %.0f%% of the bytes" % (100 * (1 - sum(outs) / sum(ins))))
+    for r in results:
+        assert r.bytes_out < r.bytes_in
+        assert max(Image.open(io.BytesIO(r.data)).size) <= PREP_MAX_DIM
+    assert sum(outs) < sum(ins) / 2
@@ -0,0 +1,154 @@
+import json
+import random
+import time
+
+import pytest
+
+from core.json_scan import JsonScanner, scan_json
+from core.utils import safe_json_load, safe_json_scan
+
+
+def _feed(text: str, rng: random.Random):
+    sc = JsonScanner()
+    pos = 0
+    while pos < len(text):
+        step = rng.randint(1, 9)
+        sc.feed(text[pos:pos + step])
+        pos += step
+    return sc.result()
+
+
+def _value(rng: random.Random, depth: int = 0):
+    t = rng.random()
+    if depth > 3 or t < 0.3:
+        return rng.choice([
+            rng.randint(-1000, 1000), round(rng.random() * 100, 3), True, False, None,
+            "".join(rng.choice('ab "\\\n\té{}[],:') for _ in range(rng.randint(0, 12))),
+        ])
+    if t < 0.6:
+        return [_value(rng, depth + 1) for _ in range(rng.randint(0, 4))]
+    return {f"k{rng.randint(0, 99)}": _value(rng, depth + 1) for _ in range(rng.randint(0, 5))}
+
+
+def _corpus(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    for _ in range(n):
+        obj = {f"f{i}": _value(rng) for i in range(rng.randint(1, 6))}
+        text = json.dumps(obj, ensure_ascii=rng.random() < 0.5, indent=rng.choice([None, 2]))
+        prefix = rng.choice(["", "Here you go:\n```json\n", "```\n"])
+        suffix = rng.choice(["", "\n```", "\n```\nHope {this} helps}"])
+        yield obj, text, prefix + text + suffix, rng
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"a": [1 2 3]}', {"a": [1, 2, 3]}),
+    ('{"a": [1\n2\t3]}', {"a": [1, 2, 3]}),
+    ('{"a": 1 "b": 2}', {"a": 1, "b": 2}),
+    ('{"a": ["x" "y"] "b": {"c": 1}}', {"a": ["x", "y"], "b": {"c": 1}}),
+    ('{"a": [true false null]}', {"a": [True, False, None]}),
+    ('{"a": [True False None]}', {"a": [True, False, None]}),
+    ('{"a": [{"b": 1} {"b": 2}]}', {"a": [{"b": 1}, {"b": 2}]}),
+])
+def test_whitespace_separates_values(text, expected):
+    res = scan_json(text)
+    assert res.value == expected
+    assert res.complete
+    assert "missing_comma" in res.repairs
+
+
+def test_literal_split_across_chunks_stays_one_value():
+    sc = JsonScanner()
+    for ch in '{"a": [12 3], "b": -4.5e1}':
+        sc.feed(ch)
+    assert sc.result().value == {"a": [12, 3], "b": -45.0}
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"a": "line\none"}', {"a": "line\none"}),
+    ('{"a": "C:\\q"}', {"a": "C:\\q"}),
+    ('{"a": [1, 2,], }', {"a": [1, 2]}),
+    ('noise {"a": 1} {"b": 2}', {"a": 1}),
+])
+def test_repairs(text, expected):
+    assert scan_json(text).value == expected
+
+
+def test_fuzz_valid_roundtrip():
+    # Well-formed objects, with prose or fences around them and fed in
+    # random chunks, come back exactly, field by field.
+    for obj, _, wrapped, rng in _corpus(1500):
+        res = _feed(wrapped, rng)
+        assert res.value == obj, wrapped
+        assert res.complete
+        assert res.fields == list(obj)
+
+
+def test_fuzz_truncation_is_flagged():
+    # Every cut-off response that got past "{" is closed off into a dict,
+    # and is never reported complete.
+    for obj, text, wrapped, rng in _corpus(1500, seed=1):
+        start = wrapped.index("{")
+        cut = wrapped[:rng.randint(start + 1, start + len(text) - 1)]
+        res = scan_json(cut)
+        assert isinstance(res.value, dict), cut
+        assert not res.complete
+        assert "truncated" in res.repairs
+        assert set(res.fields) <= set(obj)
+        assert all(res.value[k] == obj[k] for k in res.fields)
+
+
+def test_fuzz_mangled_output_still_parses():
+    # Raw newlines in strings and trailing commas everywhere.
+    for _, text, _, _ in _corpus(1500, seed=2):
+        mangled = text.replace("\\n", "\n").replace("}", ",}").replace("]", ",]")
+        assert isinstance(scan_json(mangled).value, dict), mangled
+
+
+def test_safe_json_scan_reports_incomplete():
+    assert safe_json_scan('{"steps": ["a", "b"], "fix": "x"}').complete
+    res = safe_json_scan('{"steps": ["a", "b"], "fix": "x')
+    assert res.value == {"steps": ["a", "b"], "fix": "x"}
+    assert not res.complete
+    assert res.partial_fields == ["fix"]
+    assert not safe_json_scan("").complete
+    assert safe_json_scan("no json here").value is None
+    # safe_json_load keeps its old contract: best-effort dict or None.
+    assert safe_json_load('{"a": 1') == {"a": 1}
+
+
+def _median_us(fn, text: str, n: int) -> float:
+    runs = []
+    for _ in range(5):
+        started = time.perf_counter()
+        for _ in range(n):
+            fn(text)
+        runs.append((time.perf_counter() - started) / n * 1e6)
+    return sorted(runs)[2]
+
+
+def test_benchmark_scan(capsys):
+    # A diagnose-sized response (~2 KB). Well-formed text takes the C
+    # decoder; repaired text walks the scanner. The bounds are loose, only
+    # there to catch an accidental per-character slowdown.
+    doc = {
+        "is_correct": False, "confidence": 0.62, "wrong_step_index": 2,
+        "steps": [f"Step {i}: the height of an AVL tree is bounded by 1.44 log n" for i in range(6)],
+        "fix": "Balance factor must be in {-1,0,1} for every node, not just the root.",
+        "misconceptions": [{
+            "concept": "AVL balance", "why_wrong": "x" * 200, "hints": ["h" * 80] * 3,
+            "teaching": {"explanation": "e" * 300, "analogy": "a" * 100}, "final_answer": "z" * 200,
+        }],
+    }
+    clean = "```json\n" + json.dumps(doc, indent=2) + "\n```"
+    repaired = clean.replace('"concept"', '"concept" ').replace('],', ',],')
+    truncated = clean[:-400]
+    assert scan_json(clean).value == doc
+    assert scan_json(repaired).value == doc
+
+    timings = {name: _median_us(scan_json, text, 200) for name, text in
+               (("clean", clean), ("repaired", repaired), ("truncated", truncated))}
+    with capsys.disabled():
+        print("\njson_scan on %d bytes: " % len(clean) + ", ".join(f"{k} {v:.0f}us" for k, v in timings.items()))
+    assert timings["clean"] < 1000
+    assert timings["repaired"] < 20000
+    assert timings["truncated"] < 20000
@@ -0,0 +1,80 @@
+import sqlite3
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def cache(fresh_cache):
+    return fresh_cache
+
+
+def _last_used(cache, key):
+    row = sqlite3.connect(cache.CACHE_PATH).execute("SELECT last_used FROM llm_cache WHERE key=?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def test_disk_hit_after_memory_is_dropped(cache):
+    key = cache.cache_key("rubric", "prompt")
+    cache.cache_put("rubric", key, {"final_answer": "42"})
+    with cache._lock:
+        cache._memory.clear()
+    got = cache.cache_get("rubric", key)
+    assert got == {"final_answer": "42"}
+    got["final_answer"] = "changed"
+    assert cache.cache_get("rubric", key) == {"final_answer": "42"}
+    assert cache.cache_stats()["rubric"] == {"memory_hits": 1, "disk_hits": 1, "misses": 0, "stores": 1}
+
+
+def test_expired_disk_entry_is_a_miss(cache, monkeypatch):
+    monkeypatch.setitem(cache.SITE_TTLS, "exam", -1.0)
+    key = cache.cache_key("exam", "prompt")
+    cache.cache_put("exam", key, {"questions": []})
+    assert cache.cache_get("exam", key) is None
+    assert cache.cache_stats()["exam"]["misses"] == 1
+
+
+def test_last_used_is_written_in_batches(cache, monkeypatch):
+    monkeypatch.setattr(cache, "TOUCH_BATCH", 3)
+    keys = [cache.cache_key("notes", f"p{i}") for i in range(3)]
+    for k in keys:
+        cache.cache_put("notes", k, {"questions": [k]})
+    stored = {k: _last_used(cache, k) for k in keys}
+    with cache._lock:
+        cache._memory.clear()
+
+    cache.cache_get("notes", keys[0])
+    cache.cache_get("notes", keys[1])
+    assert [_last_used(cache, k) for k in keys[:2]] == [stored[keys[0]], stored[keys[1]]]
+    cache.cache_get("notes", keys[2])
+    assert all(_last_used(cache, k) > stored[k] for k in keys)
+
+
+def test_concurrent_gets_and_puts(cache):
+    # Threads reading and writing overlapping keys: every get returns what
+    # was put under that key, and nothing raises.
+    keys = [cache.cache_key("rubric", f"p{i}") for i in range(40)]
+    errors = []
+
+    def work(t):
+        try:
+            for i in range(200):
+                k = keys[(t * 7 + i) % len(keys)]
+                if i % 3 == 0:
+                    cache.cache_put("rubric", k, {"key": k})
+                    if i % 9 == 0:
+                        with cache._lock:
+                            cache._memory.pop(k, None)
+                got = cache.cache_get("rubric", k)
+                assert got is None or got == {"key": k}
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=work, args=(t,)) for t in range(8)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    assert not errors
+    stats = cache.cache_stats()["rubric"]
+    assert stats["memory_hits"] + stats["disk_hits"] + stats["misses"] == 8 * 200
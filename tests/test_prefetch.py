@@ -0,0 +1,54 @@
+import json
+import re
+
+import pytest
+
+pytest.importorskip("google.genai")
+from core.prefetch import prefetch_rubric, take_rubric  # noqa: E402
+
+QUESTION = "Solve 2x + 3 = 11."
+
+
+def _attempt(prompt: str) -> str:
+    return re.search(r'Student attempt:\n"""(.*?)"""', prompt, re.S).group(1)
+
+
+def _respond(errors_for_refresh: bool):
+    def respond(model, contents):
+        prompt = contents if isinstance(contents, str) else contents[0]
+        attempt = _attempt(prompt)
+        if "Rubric steps:" in prompt:
+            out = {"minimal_fix": f"FIX-FOR-{attempt}"}
+            if errors_for_refresh:
+                out["student_errors"] = [f"ERR-FOR-{attempt}", ""]
+            return json.dumps(out)
+        return json.dumps({
+            "solution_steps": ["2x = 8", "x = 4"],
+            "rubric": [
+                {"step": "Subtract 3", "marks": 1, "expected": "2x = 8", "common_errors": "", "student_error": f"ERR-FOR-{attempt}"},
+                {"step": "Divide by 2", "marks": 1, "expected": "x = 4", "common_errors": "", "student_error": ""},
+            ],
+            "minimal_fix": f"FIX-FOR-{attempt}",
+            "final_answer": "x = 4",
+        })
+    return respond
+
+
+def test_changed_attempt_redoes_student_errors(fake_client):
+    fake_client.respond = _respond(errors_for_refresh=True)
+    assert prefetch_rubric("u-refresh", QUESTION, "a3", "algebra", "Coach")
+    rb = take_rubric("u-refresh", QUESTION, "a4", "algebra", "Coach", timeout=5)
+
+    assert rb["minimal_fix"] == "FIX-FOR-a4"
+    assert [it["student_error"] for it in rb["rubric"]] == ["ERR-FOR-a4", ""]
+    assert rb["final_answer"] == "x = 4"
+
+
+def test_changed_attempt_without_errors_blanks_them(fake_client):
+    # A refresh that doesn't say what went wrong per step must not keep the old attempt's errors.
+    fake_client.respond = _respond(errors_for_refresh=False)
+    assert prefetch_rubric("u-blank", QUESTION, "a3", "algebra", "Coach")
+    rb = take_rubric("u-blank", QUESTION, "a4", "algebra", "Coach", timeout=5)
+
+    assert rb["minimal_fix"] == "FIX-FOR-a4"
+    assert all(it["student_error"] == "" for it in rb["rubric"])
@@ -0,0 +1,65 @@
+import pytest
+
+pytest.importorskip("google.genai")
+from core import router  # noqa: E402
+
+# Both default to the same model name; routing needs two distinct candidates.
+MODEL_FAST, MODEL_DEEP = "fast-model", "deep-model"
+
+
+@pytest.fixture
+def stats(monkeypatch):
+    """Live stats per model: set p95 ms, error rate or an open breaker in the test."""
+    live = {m: {"p95": None, "err": None, "open": False} for m in (MODEL_FAST, MODEL_DEEP)}
+    monkeypatch.setattr(router, "ROUTER_MODELS", [MODEL_FAST, MODEL_DEEP])
+    monkeypatch.setattr(router, "MODEL_QUALITY", {MODEL_FAST: 0.6, MODEL_DEEP: 0.9})
+    monkeypatch.setattr(router, "ROUTER_ENABLED", True)
+    monkeypatch.setattr(router, "ROUTER_LOG", "")
+    monkeypatch.setattr(router, "latency_percentile", lambda site, m, *a: live[m]["p95"])
+    monkeypatch.setattr(router, "error_rate", lambda site, m, *a: live[m]["err"])
+    monkeypatch.setattr(router, "circuit_open", lambda m: live[m]["open"])
+    return live
+
+
+def test_full_answer_floor_is_clamped_to_best_model(stats):
+    r = router.route("rubric", hint_level=4)
+    assert (r.model, r.reason) == (MODEL_DEEP, "cheapest_meeting_floor_and_slo")
+    assert r.floor == router.MODEL_QUALITY[MODEL_DEEP]
+    assert r.signals["floor_wanted"] > r.floor
+    assert r.backup == MODEL_FAST
+
+
+def test_hard_diagnose_picks_deep_without_relaxing(stats):
+    r = router.route("diagnose", has_image=True, prev_confidence=0.2, attempts=4)
+    assert (r.model, r.reason) == (MODEL_DEEP, "cheapest_meeting_floor_and_slo")
+
+
+def test_easy_socratic_takes_the_cheap_model(stats):
+    r = router.route("socratic")
+    assert (r.model, r.reason) == (MODEL_FAST, "cheapest_meeting_floor_and_slo")
+    assert "floor_wanted" not in r.signals
+
+
+def test_slow_deep_model_relaxes_the_floor(stats):
+    stats[MODEL_DEEP]["p95"] = router.SITE_SLO_MS["rubric"] * 2
+    r = router.route("rubric", hint_level=4)
+    assert (r.model, r.reason) == (MODEL_FAST, "floor_relaxed_for_slo")
+
+
+def test_degraded_hard_task_stays_on_a_model_that_clears_the_floor(stats):
+    for m in stats.values():
+        m["err"] = 0.9
+    stats[MODEL_DEEP]["open"] = True
+    r = router.route("rubric", hint_level=4)
+    assert (r.model, r.reason) == (MODEL_DEEP, "all_degraded")
+
+
+def test_explore_retries_a_skipped_cheaper_model(stats, monkeypatch):
+    monkeypatch.setattr(router, "EXPLORE_RATE", 1.0)
+    stats[MODEL_FAST]["err"] = 0.5
+    assert router.route("socratic").reason == "explore"
+    # Not while its breaker is open, and never below a hard task's floor.
+    stats[MODEL_FAST]["open"] = True
+    assert router.route("socratic").reason == "cheapest_meeting_floor_and_slo"
+    stats[MODEL_FAST]["open"] = False
+    assert router.route("rubric", hint_level=4).model == MODEL_DEEP
@@ -0,0 +1,83 @@
+import json
+import time
+import asyncio
+import threading
+
+import pytest
+
+pytest.importorskip("google.genai")
+from core.aio import run_sync  # noqa: E402
+from core.single_flight import asingle_flight, flight_key, flight_stats  # noqa: E402
+from core.turns import TurnCancelled, cancel_turn  # noqa: E402
+from core.tutor import handle_turn  # noqa: E402
+
+QUESTION = "Why does a binary search need a sorted array?"
+SOCRATIC = json.dumps({
+    "is_correct": False, "confidence": 0.4, "next_question": "What does one comparison rule out?",
+    "misconceptions": [{"concept": "Search invariants", "hints": ["h1", "h2", "h3"]}],
+})
+
+
+def test_cancelled_leader_hands_over_to_a_follower():
+    calls = []
+
+    async def generate(on_partial):
+        calls.append(1)
+        await asyncio.sleep(0.3)
+        return {"final_answer": "f"}
+
+    async def crowd():
+        key = flight_key("rubric", "handover test prompt")
+        leader = asyncio.ensure_future(asingle_flight("rubric", key, generate))
+        await asyncio.sleep(0.05)
+        followers = [asyncio.ensure_future(asingle_flight("rubric", key, generate)) for _ in range(5)]
+        await asyncio.sleep(0.05)
+        leader.cancel()
+        return await asyncio.gather(*followers), leader.cancelled()
+
+    before = flight_stats().get("rubric", {}).get("handovers", 0)
+    results, leader_cancelled = run_sync(crowd)
+    assert leader_cancelled
+    assert results == [{"final_answer": "f"}] * 5
+    # The leader's call was abandoned and exactly one follower made a new one.
+    assert len(calls) == 2
+    assert flight_stats()["rubric"]["handovers"] == before + 1
+
+
+def test_cancel_turn_writes_no_attempt(fake_client, fresh_db):
+    fake_client.respond = lambda model, contents: SOCRATIC
+    fake_client.delay = 2.0
+    outcome = {}
+
+    def student():
+        try:
+            outcome["result"] = handle_turn("u-cancel", QUESTION, "It's faster", "Coach", "DSA", turn_id="t-cancel")
+        except TurnCancelled:
+            outcome["cancelled"] = True
+
+    th = threading.Thread(target=student)
+    th.start()
+    time.sleep(0.3)
+    assert cancel_turn("t-cancel")
+    th.join(5)
+    assert outcome == {"cancelled": True}
+    assert fresh_db.get_attempts_used("u-cancel", QUESTION) == 0
+
+
+def test_turn_past_its_budget_answers_without_writing(fake_client, fresh_db):
+    fake_client.respond = lambda model, contents: SOCRATIC
+    fake_client.delay = 3.0
+    started = time.perf_counter()
+    out = handle_turn("u-slow", QUESTION, "It's faster", "Coach", "DSA", budget_s=0.3)
+    assert time.perf_counter() - started < 2.0
+    assert "taking too long" in out["messages"][0]["text"]
+    assert out["attempts_used"] == 0
+    assert fresh_db.get_attempts_used("u-slow", QUESTION) == 0
+
+
+def test_turn_within_budget_is_recorded(fake_client, fresh_db):
+    fake_client.respond = lambda model, contents: SOCRATIC
+    out = handle_turn("u-ok", QUESTION, "It's faster", "Coach", "DSA", budget_s=5)
+    assert out["mode"] == "SOCRATIC" and out["attempts_used"] == 1
+    assert "What does one comparison rule out?" in out["messages"][0]["text"]
+    assert fresh_db.get_attempts_used("u-ok", QUESTION) == 1
@@ -1,6 +1,29 @@
+import os
+import time
 import streamlit as st
 import uuid
-from backend import tutor_turn, generate_questions_from_notes
+from backend import (
+    submit_tutor_turn,
+    get_job,
+    pop_job,
+    cancel_job,
+    generate_questions_from_notes,
+    diagnose_worksheet,
+    split_pages,
+    prefetch_give_up,
+    TurnCancelled,
+)
+from core.ui_metrics import UI_METRICS, new_turn_counters, record_run, record_render, finish_turn
+from core.image_prep import ingest_image
+from core.chat_history import trim_window, load_earlier, clear_history, session_bytes
+
+_run_started = time.perf_counter()
+
+# How often the pending message checks on its background turn.
+UI_POLL_S = float(os.getenv("LEARNSENSE_UI_POLL_S", "0.25"))
+
+# st.fragment reruns only the pending message while a turn is in flight.
+_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
 
 st.set_page_config(page_title="LearnSense", page_icon="🧠", layout="wide")
 
@@ -48,11 +71,6 @@ if "pending_placeholder_index" not in st.session_state:
 if "pending_request_id" not in st.session_state:
     st.session_state.pending_request_id = None
 
-if "cancel_requested" not in st.session_state:
-    st.session_state.cancel_requested = False
-if "cancel_request_id" not in st.session_state:
-    st.session_state.cancel_request_id = None
-
 # Tutor settings (left rail)
 if "learning_mode" not in st.session_state:
     st.session_state.learning_mode = "Exam"  # ELI5 | Exam | Interview
@@ -64,8 +82,15 @@ if "hint_level" not in st.session_state:
     st.session_state.hint_level = 1  # 1-4
 
 # Attachment state (ChatGPT-like "+")
-if "uploaded_image_bytes" not in st.session_state:
-    st.session_state.uploaded_image_bytes = None
+# Only the blob-store hash is kept in the session, never the image bytes.
+if "uploaded_image_hash" not in st.session_state:
+    st.session_state.uploaded_image_hash = None
+if "uploaded_file_key" not in st.session_state:
+    st.session_state.uploaded_file_key = None
+if "uploaded_file_hash" not in st.session_state:
+    st.session_state.uploaded_file_hash = None
+if "uploaded_file_mime" not in st.session_state:
+    st.session_state.uploaded_file_mime = None
 if "uploaded_image_mime" not in st.session_state:
     st.session_state.uploaded_image_mime = None
 
@@ -73,6 +98,10 @@ if "uploaded_image_mime" not in st.session_state:
 if "question_bank" not in st.session_state:
     st.session_state.question_bank = []
 
+# Worksheet mode: last merged report
+if "worksheet_report" not in st.session_state:
+    st.session_state.worksheet_report = None
+
 # Last response + last student answer (for Give up)
 if "last_tutor_response" not in st.session_state:
     st.session_state.last_tutor_response = None
@@ -87,10 +116,49 @@ if "_force_give_up" not in st.session_state:
 if "last_user_text" not in st.session_state:
     st.session_state.last_user_text = None
 
+# Chat window: older messages live in the DB (see core/chat_history.py)
+if "next_seq" not in st.session_state:
+    st.session_state.next_seq = 0
+if "spilled_count" not in st.session_state:
+    st.session_state.spilled_count = 0
+if "history_pages" not in st.session_state:
+    st.session_state.history_pages = 0
+
+# Rerun / render-time accounting for the current turn and the whole session
+if "turn_metrics" not in st.session_state:
+    st.session_state.turn_metrics = new_turn_counters()
+if "session_metrics" not in st.session_state:
+    st.session_state.session_metrics = new_turn_counters()
+if "last_turn_metrics" not in st.session_state:
+    st.session_state.last_turn_metrics = None
+if "_turn_finished" not in st.session_state:
+    st.session_state._turn_finished = False
+st.session_state._script_run_no = st.session_state.get("_script_run_no", 0) + 1
+record_run("script", st.session_state.turn_metrics, st.session_state.session_metrics)
+
 
 # ---------- Helpers ----------
+def _trim_history():
+    # Never while a turn is pending: pending_placeholder_index points into the list.
+    if st.session_state.pending:
+        return
+    st.session_state.spilled_count += trim_window(st.session_state.user_id, st.session_state.messages)
+
+
+def _attach_upload(up):
+    # The uploader hands back the same file on every rerun; store and hash it once.
+    key = getattr(up, "file_id", None) or (up.name, up.size)
+    if key != st.session_state.uploaded_file_key:
+        st.session_state.uploaded_file_hash, st.session_state.uploaded_file_mime = ingest_image(up.getvalue(), up.type)
+        st.session_state.uploaded_file_key = key
+    st.session_state.uploaded_image_hash = st.session_state.uploaded_file_hash
+    st.session_state.uploaded_image_mime = st.session_state.uploaded_file_mime
+
+
 def add_msg(role: str, content: str):
-    st.session_state.messages.append({"role": role, "content": content})
+    _trim_history()
+    st.session_state.messages.append({"seq": st.session_state.next_seq, "role": role, "content": content})
+    st.session_state.next_seq += 1
 
 
 def render_msg(role: str, content: str):
@@ -98,6 +166,44 @@ def render_msg(role: str, content: str):
         st.markdown(content)
 
 
+def render_pending_msg(content: str):
+    # Returns a slot the streaming callback can overwrite in place.
+    with st.chat_message("assistant"):
+        slot = st.empty()
+        slot.markdown(content)
+    return slot
+
+
+def _partial_preview(fields: dict, hint_level: int) -> str:
+    """Best text to show while the model response is still streaming in."""
+    parts = []
+    fix = (fields.get("fix") or "").strip() if isinstance(fields.get("fix"), str) else ""
+    if fix:
+        parts.append(fix)
+
+    hint = fields.get(f"hints[{max(0, min(2, hint_level - 1))}]")
+    if not fix and hint_level < 4 and isinstance(hint, str) and hint.strip():
+        parts.append(f"### Hint\n{hint.strip()}")
+
+    next_q = fields.get("next_question")
+    if hint_level < 4 and isinstance(next_q, str) and next_q.strip():
+        parts.append(f"### Try this\n{next_q.strip()}")
+
+    steps = []
+    i = 0
+    while f"solution_steps[{i}]" in fields:
+        steps.append(f"- **Step {i+1}:** {fields[f'solution_steps[{i}]']}")
+        i += 1
+    if steps:
+        parts.append("\n".join(steps))
+
+    final = fields.get("final_answer")
+    if (hint_level >= 4 or steps) and isinstance(final, str) and final.strip():
+        parts.append(final.strip())
+
+    return "\n\n".join(parts)
+
+
 def is_academic_query(text: str) -> bool:
     t = (text or "").lower()
     banned = [
@@ -110,18 +216,20 @@ def is_academic_query(text: str) -> bool:
 
 
 def reset_all():
+    clear_history(st.session_state.user_id)
     st.session_state.messages = []
+    st.session_state.spilled_count = 0
+    st.session_state.history_pages = 0
     st.session_state.pending = False
     st.session_state.pending_input = ""
     st.session_state.pending_placeholder_index = None
     st.session_state.pending_request_id = None
-    st.session_state.cancel_requested = False
-    st.session_state.cancel_request_id = None
     st.session_state.last_user_text = None
-    st.session_state.uploaded_image_bytes = None
+    st.session_state.uploaded_image_hash = None
     st.session_state.uploaded_image_mime = None
     st.session_state.last_tutor_response = None
     st.session_state.last_student_answer = ""
+    st.session_state.worksheet_report = None
     st.session_state.hint_level = 1
     st.session_state._force_give_up = False
     st.rerun()
@@ -194,6 +302,96 @@ def _render_artifacts(tr: dict):
                     st.markdown(f"- {concept} — {cnt} times")
 
 
+def _render_worksheet(report: dict):
+    if report.get("error"):
+        st.warning(report.get("error_message", "Couldn’t grade this sheet."))
+        return
+    st.markdown(
+        f"**{report['correct']}/{report['total']} correct** "
+        f"({report['pages']} page(s), {report['elapsed_ms'] / 1000:.1f}s)"
+    )
+    for it in report.get("items") or []:
+        n = it["index"] + 1
+        if it.get("error"):
+            st.markdown(f"- **Q{n}** ⚠️ {it['error']}")
+        elif it.get("is_correct"):
+            st.markdown(f"- **Q{n}** ✅")
+        else:
+            top = (it.get("misconceptions") or [{}])[0].get("concept", "")
+            st.markdown(f"- **Q{n}** ❌ {top} — {it.get('fix', '')}")
+    if report.get("misconceptions"):
+        st.markdown("**Across the sheet:**")
+        for m in report["misconceptions"][:5]:
+            qs = ", ".join(f"Q{q}" for q in m["questions"])
+            st.markdown(f"- {m['concept']} ({qs})")
+
+
+def _submit_pending():
+    # The turn runs in the background; the page only polls the pending message.
+    submit_tutor_turn(
+        st.session_state.pending_request_id,
+        user_id=st.session_state.user_id,
+        question=st.session_state.current_question,
+        student_input=st.session_state.pending_input,
+        mode=st.session_state.learning_mode,
+        topic=st.session_state.current_topic,
+        hint_level=int(st.session_state.hint_level),
+        give_up=bool(st.session_state._force_give_up),
+        image_mime=st.session_state.uploaded_image_mime,
+        image_hash=st.session_state.uploaded_image_hash,
+    )
+    st.session_state.turn_metrics = new_turn_counters()
+
+
+def _pending_preview(placeholder: str) -> str:
+    job = get_job(st.session_state.pending_request_id)
+    if job is None:
+        return placeholder
+    hint_level = 4 if st.session_state._force_give_up else int(st.session_state.hint_level)
+    preview = _partial_preview(job.partial(), hint_level)
+    return preview + "\n\n⏳ …" if preview else placeholder
+
+
+def _pending_view(placeholder: str):
+    # First call is part of a full script run; later calls are fragment reruns.
+    started = time.perf_counter()
+    fragment_rerun = st.session_state.get("_pending_view_run") == st.session_state._script_run_no
+    st.session_state._pending_view_run = st.session_state._script_run_no
+    if not st.session_state.pending:
+        return
+
+    with st.chat_message("assistant"):
+        st.markdown(_pending_preview(placeholder))
+
+    job = get_job(st.session_state.pending_request_id)
+    if fragment_rerun:
+        metrics = (st.session_state.turn_metrics, st.session_state.session_metrics)
+        record_run("fragment", *metrics)
+        record_render((time.perf_counter() - started) * 1000, 1, *metrics)
+    if job is None or job.done:
+        st.rerun()
+
+
+def _pending_view_blocking(placeholder: str):
+    # Older Streamlit without fragments: poll in this script run instead.
+    slot = render_pending_msg(placeholder)
+    shown = placeholder
+    job = get_job(st.session_state.pending_request_id)
+    while job is not None and not job.done:
+        time.sleep(UI_POLL_S)
+        text = _pending_preview(placeholder)
+        if text != shown:
+            slot.markdown(text)
+            shown = text
+    st.rerun()
+
+
+if _fragment is not None:
+    _pending_view = _fragment(run_every=UI_POLL_S)(_pending_view)
+else:
+    _pending_view = _pending_view_blocking
+
+
 def _start_pending(user_visible_user_msg: str, pending_student_input: str, force_give_up: bool):
     add_msg("user", user_visible_user_msg)
     add_msg("assistant", "⏳ Analyzing…")
@@ -201,12 +399,55 @@ def _start_pending(user_visible_user_msg: str, pending_student_input: str, force
     st.session_state.pending_input = pending_student_input
     st.session_state.pending = True
     st.session_state.pending_request_id = str(uuid.uuid4())
-    st.session_state.cancel_requested = False
-    st.session_state.cancel_request_id = None
     st.session_state._force_give_up = force_give_up
+    _submit_pending()
     st.rerun()
 
 
+# Resolve pending: pick up the background turn once it has finished
+if st.session_state.pending:
+    request_id = st.session_state.pending_request_id
+    job = get_job(request_id)
+    if job is None:
+        # Lost (e.g. the server restarted mid-turn); run it again.
+        _submit_pending()
+    elif job.done:
+        pop_job(request_id)
+        assistant_text = "I couldn’t analyze that yet. Try again."
+
+        try:
+            tr = job.result()
+
+            if isinstance(tr, dict):
+                st.session_state.last_tutor_response = tr
+
+            assistant_text = _first_text_message(tr) or "Done."
+
+        except TurnCancelled:
+            assistant_text = "⏹ Stopped."
+
+        except Exception:
+            assistant_text = "I couldn’t reach the model right now (it may be overloaded). Please try again in a moment."
+            st.session_state.last_tutor_response = None
+
+        idx = st.session_state.pending_placeholder_index
+        if idx is not None and 0 <= idx < len(st.session_state.messages):
+            st.session_state.messages[idx]["content"] = assistant_text
+
+        # Clear attachment after send (ChatGPT-like)
+        st.session_state.uploaded_image_hash = None
+        st.session_state.uploaded_image_mime = None
+
+        # cleanup
+        st.session_state.pending = False
+        st.session_state.pending_input = ""
+        st.session_state.pending_placeholder_index = None
+        st.session_state.pending_request_id = None
+        st.session_state._force_give_up = False
+        st.session_state._turn_finished = True
+        _trim_history()
+
+
 # ==========================
 # LEFT RAIL (ChatGPT-like)
 # ==========================
@@ -253,11 +494,21 @@ with st.sidebar:
         gen = st.button("Generate", use_container_width=True)
 
         if gen and notes_text.strip():
+            progress = st.empty()
+            streamed = []
+
+            def on_question(name, value):
+                streamed.append(value)
+                progress.caption(f"Generating… {len(streamed)} questions so far")
+
             qb = generate_questions_from_notes(
                 notes_text=notes_text,
                 topic=st.session_state.current_topic,
-                mode=st.session_state.learning_mode
+                mode=st.session_state.learning_mode,
+                on_partial=on_question,
+                user_id=st.session_state.user_id,
             )
+            progress.empty()
 
             if isinstance(qb, dict) and qb.get("questions"):
                 st.session_state.question_bank = qb["questions"]
@@ -286,16 +537,68 @@ with st.sidebar:
                 selected = st.session_state.question_bank[idx]
                 st.session_state.current_question = selected.get("q", "")
                 st.session_state.current_topic = selected.get("topic", st.session_state.current_topic)
-                st.session_state.uploaded_image_bytes = None
+                st.session_state.uploaded_image_hash = None
                 st.session_state.uploaded_image_mime = None
                 st.session_state.last_tutor_response = None
                 st.session_state.last_student_answer = ""
                 st.rerun()
 
+    with st.expander("🗂️ Grade a whole worksheet"):
+        sheet_questions = st.text_area(
+            "Questions (one per line)",
+            height=120,
+            placeholder="1. Differentiate AVL and BST.\n2. ...",
+        )
+        sheet_files = st.file_uploader(
+            "Answer pages (photos or PDF)",
+            type=["png", "jpg", "jpeg", "webp", "pdf"],
+            accept_multiple_files=True,
+        )
+
+        if st.button("Grade sheet", use_container_width=True) and sheet_files and sheet_questions.strip():
+            progress = st.empty()
+            graded = []
+
+            def on_item(name, value):
+                graded.append(value)
+                progress.caption(f"Grading… {len(graded)} questions done")
+
+            pages = []
+            for f in sheet_files:
+                pages.extend(split_pages(f.getvalue(), f.type))
+            st.session_state.worksheet_report = diagnose_worksheet(
+                user_id=st.session_state.user_id,
+                questions=sheet_questions.splitlines(),
+                pages=pages,
+                mode=st.session_state.learning_mode,
+                topic=st.session_state.current_topic,
+                on_partial=on_item,
+            )
+            progress.empty()
+
+        if st.session_state.worksheet_report:
+            _render_worksheet(st.session_state.worksheet_report)
+
     st.markdown("---")
     if st.button("🔄 Reset chat", use_container_width=True):
         reset_all()
 
+    if UI_METRICS:
+        if st.session_state.last_turn_metrics:
+            m = st.session_state.last_turn_metrics
+            st.caption(
+                f"Last turn: {int(m['script_runs'])} script runs, "
+                f"{int(m['fragment_runs'])} fragment runs, {m['render_ms']:.0f} ms rendering"
+            )
+        m = st.session_state.session_metrics
+        st.caption(
+            f"Session: {int(m['script_runs'] + m['fragment_runs'])} runs, {m['render_ms']:.0f} ms rendering, "
+            f"{int(m['messages_rendered'])} messages rendered; "
+            f"{len(st.session_state.messages)} in memory "
+            f"({session_bytes(st.session_state.messages) / 1024:.0f} KB), "
+            f"{st.session_state.spilled_count} spilled"
+        )
+
     # Give up control (only when you have a last response, and it's not correct, and not generating)
     if st.session_state.last_tutor_response and not st.session_state.pending:
         tr = st.session_state.last_tutor_response
@@ -306,12 +609,20 @@ with st.sidebar:
         st.caption(f"Attempts so far: {attempts_used}")
 
         if not is_correct:
-            if st.button("🏳️ Give up (show answer + rubric)", use_container_width=True):
-                # Use the last student answer as the attempt context for rubric generation
-                attempt_text = (st.session_state.last_student_answer or "").strip()
-                if not attempt_text:
-                    attempt_text = "I don't know."
+            # Use the last student answer as the attempt context for rubric generation
+            attempt_text = (st.session_state.last_student_answer or "").strip()
+            if not attempt_text:
+                attempt_text = "I don't know."
+
+            prefetch_give_up(
+                user_id=st.session_state.user_id,
+                question=st.session_state.current_question,
+                student_input=attempt_text,
+                mode=st.session_state.learning_mode,
+                topic=st.session_state.current_topic,
+            )
 
+            if st.button("🏳️ Give up (show answer + rubric)", use_container_width=True):
                 _start_pending(
                     user_visible_user_msg="I give up.",
                     pending_student_input=attempt_text,
@@ -324,14 +635,35 @@ with st.sidebar:
 if len(st.session_state.messages) == 0:
     add_msg("assistant", "Hi! Type an answer below and I’ll analyze it for misconceptions.")
 
-for msg in st.session_state.messages:
+# Earlier messages are only read back (and rendered) when asked for.
+first_seq = st.session_state.messages[0].get("seq", 0) if st.session_state.messages else st.session_state.next_seq
+earlier = load_earlier(st.session_state.user_id, first_seq, st.session_state.history_pages)
+hidden = st.session_state.spilled_count - len(earlier)
+if hidden > 0:
+    if st.button(f"⬆️ Show earlier messages ({hidden})"):
+        st.session_state.history_pages += 1
+        st.rerun()
+elif earlier:
+    if st.button("Hide earlier messages"):
+        st.session_state.history_pages = 0
+        st.rerun()
+
+for msg in earlier:
     render_msg(msg["role"], msg["content"])
 
+rendered = len(earlier)
+for i, msg in enumerate(st.session_state.messages):
+    if st.session_state.pending and i == st.session_state.pending_placeholder_index:
+        _pending_view(msg["content"])
+    else:
+        render_msg(msg["role"], msg["content"])
+    rendered += 1
+
 # Stop generating
 if st.session_state.pending:
     if st.button("⏹ Stop generating"):
-        st.session_state.cancel_requested = True
-        st.session_state.cancel_request_id = st.session_state.pending_request_id
+        # Aborts the model call; a cancelled turn writes no attempt/mastery updates.
+        cancel_job(st.session_state.pending_request_id)
         idx = st.session_state.pending_placeholder_index
         if idx is not None and 0 <= idx < len(st.session_state.messages):
             st.session_state.messages[idx]["content"] = "⏹ Stopped."
@@ -342,66 +674,6 @@ if st.session_state.pending:
         st.session_state._force_give_up = False
         st.rerun()
 
-# Resolve pending (single call to tutor_turn)
-if st.session_state.pending:
-    if st.session_state.cancel_requested and st.session_state.cancel_request_id == st.session_state.pending_request_id:
-        st.session_state.pending = False
-        st.session_state.pending_input = ""
-        st.session_state.pending_placeholder_index = None
-        st.session_state.pending_request_id = None
-        st.session_state.cancel_requested = False
-        st.session_state.cancel_request_id = None
-        st.session_state._force_give_up = False
-        st.rerun()
-
-    request_id = st.session_state.pending_request_id
-
-    with st.spinner("Analyzing with Gemini…"):
-        assistant_text = "I couldn’t analyze that yet. Try again."
-        tr = None
-        try:
-            tr = tutor_turn(
-                user_id=st.session_state.user_id,
-                question=st.session_state.current_question,
-                student_input=st.session_state.pending_input,
-                mode=st.session_state.learning_mode,
-                topic=st.session_state.current_topic,
-                hint_level=int(st.session_state.hint_level),
-                give_up=bool(st.session_state._force_give_up),
-                image_bytes=st.session_state.uploaded_image_bytes,
-                image_mime=st.session_state.uploaded_image_mime,
-            )
-
-            if isinstance(tr, dict):
-                st.session_state.last_tutor_response = tr
-
-            assistant_text = _first_text_message(tr) or "Done."
-
-        except Exception:
-            assistant_text = "I couldn’t reach the model right now (it may be overloaded). Please try again in a moment."
-            st.session_state.last_tutor_response = None
-
-        idx = st.session_state.pending_placeholder_index
-        canceled = (st.session_state.cancel_requested and st.session_state.cancel_request_id == request_id)
-        if not canceled and idx is not None and 0 <= idx < len(st.session_state.messages):
-            st.session_state.messages[idx]["content"] = assistant_text
-
-        # Clear attachment after send (ChatGPT-like)
-        st.session_state.uploaded_image_bytes = None
-        st.session_state.uploaded_image_mime = None
-
-        # cleanup
-        st.session_state.pending = False
-        st.session_state.pending_input = ""
-        st.session_state.pending_placeholder_index = None
-        st.session_state.pending_request_id = None
-        st.session_state._force_give_up = False
-        if st.session_state.cancel_request_id == request_id:
-            st.session_state.cancel_requested = False
-            st.session_state.cancel_request_id = None
-
-    st.rerun()
-
 # Render artifacts for the most recent model turn (at bottom)
 if st.session_state.last_tutor_response and not st.session_state.pending:
     with st.container():
@@ -424,8 +696,7 @@ with attach_col:
                 label_visibility="collapsed",
             )
             if up is not None:
-                st.session_state.uploaded_image_bytes = up.read()
-                st.session_state.uploaded_image_mime = up.type
+                _attach_upload(up)
                 st.success("Attached. Now send your answer.")
     except Exception:
         with st.expander("➕ Attach image"):
@@ -435,12 +706,11 @@ with attach_col:
                 accept_multiple_files=False,
             )
             if up is not None:
-                st.session_state.uploaded_image_bytes = up.read()
-                st.session_state.uploaded_image_mime = up.type
+                _attach_upload(up)
                 st.success("Attached. Now send your answer.")
 
 with rest_col:
-    if st.session_state.uploaded_image_bytes:
+    if st.session_state.uploaded_image_hash:
         st.caption("📎 Image attached")
 
 placeholder = "Type your answer…"
@@ -474,7 +744,19 @@ if user_text and not st.session_state.pending:
     st.session_state.pending_input = user_text
     st.session_state.pending = True
     st.session_state.pending_request_id = str(uuid.uuid4())
-    st.session_state.cancel_requested = False
-    st.session_state.cancel_request_id = None
     st.session_state._force_give_up = False
+    _submit_pending()
     st.rerun()
+
+# Per-turn rerun / render accounting (runs that end in st.rerun() are counted but not timed)
+record_render(
+    (time.perf_counter() - _run_started) * 1000,
+    rendered,
+    st.session_state.turn_metrics,
+    st.session_state.session_metrics,
+)
+if st.session_state._turn_finished:
+    finish_turn(st.session_state.turn_metrics)
+    st.session_state.last_turn_metrics = st.session_state.turn_metrics
+    st.session_state.turn_metrics = new_turn_counters()
+    st.session_state._turn_finished = False